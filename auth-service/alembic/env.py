@@ -1,7 +1,7 @@
 import asyncio
 from logging.config import fileConfig
 
-from sqlalchemy import pool
+from sqlalchemy import pool, text
 from sqlalchemy.engine import Connection
 from sqlalchemy.ext.asyncio import async_engine_from_config
 
@@ -26,6 +26,8 @@ if config.config_file_name is not None:
 # from myapp import mymodel
 # target_metadata = mymodel.Base.metadata
 target_metadata = entity.Base.metadata
+# every replica runs the migrations on start, the lock makes them wait for each other instead of racing
+_MIGRATIONS_LOCK_ID = 4_721_983_056
 
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
@@ -58,6 +60,9 @@ def run_migrations_offline() -> None:
 
 
 def do_run_migrations(connection: Connection) -> None:
+    # a session lock, it outlives the commit and is released when the connection is closed
+    connection.execute(text("SELECT pg_advisory_lock(:id)"), {"id": _MIGRATIONS_LOCK_ID})
+    connection.commit()
     context.configure(connection=connection, target_metadata=target_metadata)
 
     with context.begin_transaction():
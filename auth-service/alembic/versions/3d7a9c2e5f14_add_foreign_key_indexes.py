@@ -0,0 +1,44 @@
+"""add foreign key indexes
+
+Revision ID: 3d7a9c2e5f14
+Revises: 8c1f4e2a9b37
+Create Date: 2026-10-19 17:20:12.604117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3d7a9c2e5f14'
+down_revision: Union[str, None] = '8c1f4e2a9b37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_USER_LOGINS_PARTITIONS = ('mobile', 'tablet', 'pc', 'unknown')
+
+
+def upgrade() -> None:
+    # an index on a partitioned table cannot be built concurrently: it is created on the parent only, built on each
+    # partition concurrently and becomes valid once every partition index is attached
+    op.execute('CREATE INDEX IF NOT EXISTS ix_user_logins_user_id_date ON ONLY user_logins (user_id, date)')
+    with op.get_context().autocommit_block():
+        for partition in _USER_LOGINS_PARTITIONS:
+            op.create_index(f'ix_user_logins_{partition}_user_id_date', f'user_logins_{partition}', ['user_id', 'date'],
+                            postgresql_concurrently=True, if_not_exists=True)
+            op.execute(f'ALTER INDEX ix_user_logins_user_id_date '
+                       f'ATTACH PARTITION ix_user_logins_{partition}_user_id_date')
+        op.create_index('ix_provider_users_user_id', 'provider_users', ['user_id'],
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_user_role_role_id', 'user_role', ['role_id'],
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_user_role_role_id', table_name='user_role', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_provider_users_user_id', table_name='provider_users', postgresql_concurrently=True,
+                      if_exists=True)
+    # dropping the parent index drops the attached partition indexes
+    op.drop_index('ix_user_logins_user_id_date', table_name='user_logins', if_exists=True)
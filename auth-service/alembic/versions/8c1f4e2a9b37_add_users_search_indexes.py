@@ -0,0 +1,34 @@
+"""add users search indexes
+
+Revision ID: 8c1f4e2a9b37
+Revises: 45201c1ba853
+Create Date: 2026-10-19 10:12:40.118302
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c1f4e2a9b37'
+down_revision: Union[str, None] = '45201c1ba853'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # concurrent builds do not lock users for writes, but cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        op.create_index('ix_users_created_id', 'users', ['created', 'id'],
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_users_email_trgm', 'users', ['email'],
+                        postgresql_using='gin', postgresql_ops={'email': 'gin_trgm_ops'},
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_users_email_trgm', table_name='users', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_users_created_id', table_name='users', postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,32 @@
+"""add login archives
+
+Revision ID: b7e2d5a1c940
+Revises: 3d7a9c2e5f14
+Create Date: 2026-10-19 18:40:37.218455
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e2d5a1c940'
+down_revision: Union[str, None] = '3d7a9c2e5f14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('login_archives',
+    sa.Column('end_date', sa.DateTime(), nullable=False),
+    sa.Column('month', sa.DateTime(), nullable=False),
+    sa.Column('logins', sa.Integer(), nullable=False),
+    sa.Column('created', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('end_date')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('login_archives')
@@ -1,6 +1,6 @@
 #!/bin/sh
 
 alembic upgrade head
-gunicorn main:app --chdir src --workers 4 --worker-class uvicorn.workers.UvicornWorker --bind 0.0.0.0:8000
+cd src && gunicorn main:app --config gunicorn_conf.py
 
 exec "$@"
\ No newline at end of file
@@ -1,17 +1,22 @@
+import time
 from uuid import UUID
-from typing import Annotated
+from typing import Annotated, List
 
 from fastapi import APIRouter, Depends, Response, Header, HTTPException, status
 from fastapi_pagination import Page
 
-from services.auth_service import get_auth_service, AuthService
+from core.config import settings
+from services.auth_service import get_auth_service, AuthService, RefreshTokenPayload
 from services.user_service import get_user_service, UserService
+from storage.login_throttle import LoginThrottle, get_login_throttle
 from api.v1.providers.auth import router as provider_router
-from api.v1.dependencies import get_token, get_request_user_id, revoke_tokens
-from api.v1.schemas import UserIn, UserOut, UserCredentials, Token, AuthHistory
+from api.v1.dependencies import get_client_ip, get_token, get_request_user_id, revoke_tokens
+from api.v1.schemas import UserIn, UserOut, UserCredentials, Token, AuthHistory, Session
 
 router = APIRouter()
 router.include_router(provider_router, tags=['providers'])
+# called by the gateway on every proxied request, so it is mounted without the per-client rate limit
+verify_router = APIRouter()
 
 
 @router.post('/signup', response_model=UserOut)
@@ -19,9 +24,10 @@ async def signup(
     new_user: UserIn,
     user_service: Annotated[UserService, Depends(get_user_service)]
 ) -> UserOut:
-    if await user_service.get_by_email(new_user.email):
+    user_id = await user_service.create(new_user.email, new_user.password)
+    if not user_id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='User already exists')
-    return await user_service.create(new_user.email, new_user.password)
+    return UserOut(id=user_id, email=new_user.email)
 
 
 @router.post('/login', response_model=Token)
@@ -29,14 +35,23 @@ async def login(
     user_credentials: UserCredentials,
     user_service: Annotated[UserService, Depends(get_user_service)],
     auth_service: Annotated[AuthService, Depends(get_auth_service)],
+    login_throttle: Annotated[LoginThrottle, Depends(get_login_throttle)],
+    ip: Annotated[str, Depends(get_client_ip)],
     user_agent: Annotated[str | None, Header()] = None,
 ) -> Token:
-    user = await user_service.get_by_email(user_credentials.email)
+    lockout = await login_throttle.get_lockout(user_credentials.email, ip)
+    if lockout:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail='Too many failed login attempts',
+                            headers={'Retry-After': str(lockout)})
+    user = await user_service.get_auth_info_by_email(user_credentials.email)
     if not user:
+        await login_throttle.register_failure(ip)
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='User not found')
     if not auth_service.verify_password(user_credentials.email, user_credentials.password, user.hashed_password):
+        await login_throttle.register_failure(ip, user_credentials.email)
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Incorrect password')
-    access_token, refresh_token = await auth_service.create_token_pair(user.id, user.roles)
+    await login_throttle.reset(user_credentials.email)
+    access_token, refresh_token = await auth_service.create_token_pair(user.id, user.roles, user_agent)
     await auth_service.update_history(user.id, user_agent)
     return Token(access_token=access_token, refresh_token=refresh_token)
 
@@ -46,17 +61,17 @@ async def logout() -> Response:
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
-@router.post('/refresh', response_model=Token, dependencies=[Depends(revoke_tokens)])
+@router.post('/refresh', response_model=Token)
 async def refresh(
-    refresh_token: Annotated[str, Depends(get_token)],
+    refresh_token_payload: Annotated[RefreshTokenPayload, Depends(revoke_tokens)],
     auth_service: Annotated[AuthService, Depends(get_auth_service)],
     user_service: Annotated[UserService, Depends(get_user_service)],
+    user_agent: Annotated[str | None, Header()] = None,
 ) -> Token:
-    user_id = auth_service.get_user_id_from_refresh_token(refresh_token)
-    user = await user_service.get_by_id(user_id)
+    user = await user_service.get_auth_info_by_id(refresh_token_payload.user_id)
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='User not found')
-    access_token, refresh_token = await auth_service.create_token_pair(user.id, user.roles)
+    access_token, refresh_token = await auth_service.create_token_pair(user.id, user.roles, user_agent)
     return Token(access_token=access_token, refresh_token=refresh_token)
 
 
@@ -66,3 +81,36 @@ async def history(
     auth_service: Annotated[AuthService, Depends(get_auth_service)],
 ) -> Page[AuthHistory]:
     return await auth_service.get_history(request_user_id)
+
+
+@router.get('/sessions', response_model=List[Session])
+async def sessions(
+    request_user_id: Annotated[UUID, Depends(get_request_user_id)],
+    auth_service: Annotated[AuthService, Depends(get_auth_service)],
+) -> List[Session]:
+    return await auth_service.get_sessions(request_user_id)
+
+
+@router.delete('/sessions')
+async def revoke_sessions(
+    request_user_id: Annotated[UUID, Depends(get_request_user_id)],
+    auth_service: Annotated[AuthService, Depends(get_auth_service)],
+) -> Response:
+    await auth_service.revoke_sessions(request_user_id)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@verify_router.get('/verify', status_code=status.HTTP_204_NO_CONTENT)
+async def verify(
+    access_token: Annotated[str, Depends(get_token)],
+    auth_service: Annotated[AuthService, Depends(get_auth_service)],
+) -> Response:
+    payload = await auth_service.verify_access_token(access_token)
+    if not payload:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, headers={'Cache-Control': 'no-store'})
+    max_age = max(0, min(int(payload.exp - time.time()), settings.revocation_propagation_seconds))
+    return Response(status_code=status.HTTP_204_NO_CONTENT, headers={
+        'X-User-Id': str(payload.user_id),
+        'X-User-Roles': ','.join(payload.roles),
+        'Cache-Control': f'max-age={max_age}',
+    })
@@ -1,15 +1,29 @@
+from ipaddress import ip_address
 from uuid import UUID
-from typing import Annotated
+from typing import Annotated, Awaitable, Callable
 
-from fastapi import Depends, Header, HTTPException, status
+from fastapi import Depends, Header, HTTPException, Request, status
 
-from services.auth_service import get_auth_service, AuthService
-from services.role_service import RoleService, get_role_service
+from core.config import settings
+from core.permissions import has_permission, permission_bit, permission_mask
+from services.auth_service import get_auth_service, AccessTokenPayload, AuthService, RefreshTokenPayload
 from services.user_service import UserService, get_user_service
 
 _TOKEN_PREFIX = 'Bearer '
 
 
+def get_client_ip(request: Request, x_real_ip: Annotated[str | None, Header()] = None) -> str:
+    # X-Real-IP is set by nginx, a client reaching the service past it could set any address
+    peer = request.client.host
+    if not x_real_ip:
+        return peer
+    try:
+        trusted = any(ip_address(peer) in network for network in settings.login_trusted_proxies)
+    except ValueError:
+        trusted = False
+    return x_real_ip if trusted else peer
+
+
 def get_token(authorization: Annotated[str | None, Header()] = None) -> str:
     token = (authorization.removeprefix(_TOKEN_PREFIX)
              if authorization and authorization.startswith(_TOKEN_PREFIX)
@@ -19,29 +33,52 @@ def get_token(authorization: Annotated[str | None, Header()] = None) -> str:
     return token
 
 
-async def get_request_user_id(
+async def get_access_token_payload(
     access_token: Annotated[str, Depends(get_token)],
     auth_service: Annotated[AuthService, Depends(get_auth_service)]
-) -> UUID:
-    if not await auth_service.is_access_token_valid(access_token):
+) -> AccessTokenPayload:
+    payload = await auth_service.verify_access_token(access_token)
+    if not payload:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Invalid access token')
-    return auth_service.get_user_id_from_access_token(access_token)
+    return payload
+
+
+async def get_request_user_id(payload: Annotated[AccessTokenPayload, Depends(get_access_token_payload)]) -> UUID:
+    return payload.user_id
+
+
+async def get_request_permissions(
+    payload: Annotated[AccessTokenPayload, Depends(get_access_token_payload)],
+    user_service: Annotated[UserService, Depends(get_user_service)],
+) -> int:
+    if settings.token_permissions and payload.permissions is not None:
+        return payload.permissions
+    # the roles come from the profile cache, a role change applies to the next request
+    return permission_mask(role.name for role in await user_service.get_roles(payload.user_id))
+
+
+async def has_request_permission(payload: AccessTokenPayload, user_service: UserService, permission: str) -> bool:
+    """Checks a permission where it is needed only in some cases, the roles are not read in the others."""
+    return has_permission(await get_request_permissions(payload, user_service), permission)
+
+
+def require_permission(permission: str) -> Callable[[int], Awaitable[None]]:
+    """Returns a dependency that rejects requests without the permission, an unknown name fails at import."""
+    bit = permission_bit(permission)
+
+    async def check_permission(permissions: Annotated[int, Depends(get_request_permissions)]) -> None:
+        if not permissions & bit:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='You do not have permission')
+
+    return check_permission
 
 
 async def revoke_tokens(
     refresh_token: Annotated[str, Depends(get_token)],
     auth_service: Annotated[AuthService, Depends(get_auth_service)]
-) -> None:
-    if not await auth_service.check_is_valid_and_remove_refresh_token(refresh_token):
+) -> RefreshTokenPayload:
+    payload = await auth_service.verify_and_remove_refresh_token(refresh_token)
+    if not payload:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Invalid refresh token')
-    await auth_service.logout(refresh_token)
-
-
-async def check_user_staff(
-        request_user_id: Annotated[UUID, Depends(get_request_user_id)],
-        user_service: Annotated[UserService, Depends(get_user_service)],
-        role_service: Annotated[RoleService, Depends(get_role_service)],
-):
-    user_roles = await user_service.get_roles(request_user_id)
-    if not await role_service.is_staff(user_roles):
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='You do not have permission')
+    await auth_service.logout(payload)
+    return payload
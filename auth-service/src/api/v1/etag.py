@@ -0,0 +1,24 @@
+from fastapi import Response, status
+
+from storage.profile_cache import CachedBody
+
+# clients keep the body and ask whether it changed on every use, the responses are per user
+_CACHE_CONTROL = 'private, no-cache'
+
+
+def etag_matches(etag: str | None, if_none_match: str | None) -> bool:
+    if not etag or not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    # weak comparison, as required for If-None-Match
+    return any(tag.strip().removeprefix('W/') == etag for tag in if_none_match.split(','))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag, 'Cache-Control': _CACHE_CONTROL})
+
+
+def cached_json_response(cached: CachedBody) -> Response:
+    headers = {'ETag': cached.etag, 'Cache-Control': _CACHE_CONTROL} if cached.etag else {}
+    return Response(content=cached.body, media_type='application/json', headers=headers)
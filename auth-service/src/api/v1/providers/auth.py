@@ -4,6 +4,7 @@ from fastapi import APIRouter, Depends, Header, status, HTTPException
 from fastapi.responses import RedirectResponse
 
 from core.config import settings
+from http_client import ProviderUnavailableError
 from services.user_service import get_user_service, UserService, UserProvider
 from services.auth_service import get_auth_service, AuthService
 from api.v1.schemas import Token
@@ -14,7 +15,7 @@ router = APIRouter()
 @router.get('/{provider}/redirect')
 async def redirect(provider: UserProvider) -> RedirectResponse:
     if provider == UserProvider.YANDEX:
-        return RedirectResponse('https://oauth.yandex.ru/authorize?'
+        return RedirectResponse(f'{settings.yandex_oauth_url}/authorize?'
                                 'response_type=code&'
                                 f'client_id={settings.yandex_client_id}')
     raise HTTPException(status_code=status.UNPROCESSABLE_ENTITY, detail='Unknown provider')
@@ -28,7 +29,10 @@ async def get_tokens(
     auth_service: Annotated[AuthService, Depends(get_auth_service)],
     user_agent: Annotated[str | None, Header()] = None,
 ) -> Token:
-    user = await user_service.get_or_create_from_provider(code, provider)
-    access_token, refresh_token = await auth_service.create_token_pair(user.id, user.roles)
+    try:
+        user = await user_service.get_or_create_from_provider(code, provider)
+    except ProviderUnavailableError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail='Provider is unavailable') from e
+    access_token, refresh_token = await auth_service.create_token_pair(user.id, user.roles, user_agent)
     await auth_service.update_history(user.id, user_agent)
     return Token(access_token=access_token, refresh_token=refresh_token)
@@ -1,26 +1,32 @@
 from typing import List, Annotated
 from uuid import UUID
 
-from fastapi import APIRouter, Response, status, Depends, HTTPException
+from fastapi import APIRouter, Response, status, Depends, Header, HTTPException
 
 from api.v1.schemas import RoleIn, RoleOut
-from api.v1.dependencies import check_user_staff
+from api.v1.dependencies import require_permission
+from api.v1.etag import cached_json_response, etag_matches, not_modified
 from services.role_service import RoleService, get_role_service
 
 router = APIRouter()
 
 
-@router.get('/', response_model=List[RoleOut], dependencies=[Depends(check_user_staff)])
+@router.get('/', response_model=List[RoleOut], dependencies=[Depends(require_permission('roles:read'))])
 async def get_roles(
         role_service: Annotated[RoleService, Depends(get_role_service)],
-) -> List[RoleOut]:
-    return await role_service.get()
+        if_none_match: Annotated[str | None, Header()] = None,
+) -> Response:
+    etag = await role_service.get_catalog_etag()
+    if etag_matches(etag, if_none_match):
+        return not_modified(etag)
+
+    return cached_json_response(await role_service.get_serialized())
 
 
 @router.post(
     '/',
     response_model=RoleOut,
-    dependencies=[Depends(check_user_staff)],
+    dependencies=[Depends(require_permission('roles:write'))],
     status_code=status.HTTP_201_CREATED
 )
 async def create_role(
@@ -33,7 +39,7 @@ async def create_role(
     return new_role
 
 
-@router.delete('/{role_id}', dependencies=[Depends(check_user_staff)])
+@router.delete('/{role_id}', dependencies=[Depends(require_permission('roles:write'))])
 async def delete_role(
         role_id: UUID,
         role_service: Annotated[RoleService, Depends(get_role_service)],
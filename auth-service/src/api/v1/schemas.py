@@ -1,5 +1,6 @@
 from uuid import UUID
 from datetime import datetime
+from typing import List
 
 from pydantic import BaseModel, EmailStr, Field
 
@@ -21,6 +22,11 @@ class UserOut(BaseModel):
         from_attributes = True
 
 
+class UserListOut(BaseModel):
+    items: List[UserOut]
+    next_cursor: str | None
+
+
 class Token(BaseModel):
     access_token: str
     refresh_token: str
@@ -34,6 +40,13 @@ class AuthHistory(BaseModel):
         from_attributes = True
 
 
+class Session(BaseModel):
+    id: UUID
+    device_type: str
+    issued_at: datetime
+    expires_at: datetime
+
+
 class RoleIn(BaseModel):
     name: str
 
@@ -44,3 +57,16 @@ class RoleOut(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class UserRole(BaseModel):
+    user_id: UUID
+    role_id: UUID
+
+
+class UserRolesIn(BaseModel):
+    items: List[UserRole] = Field(min_length=1, max_length=1000)
+
+
+class UserRolesOut(BaseModel):
+    applied: List[UserRole]
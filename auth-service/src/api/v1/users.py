@@ -1,22 +1,101 @@
+import base64
+import binascii
+from datetime import datetime
 from uuid import UUID
-from typing import List, Annotated
+from typing import List, Annotated, Tuple
 
-from fastapi import APIRouter, Response, status, Depends, HTTPException
+from fastapi import APIRouter, Response, status, Depends, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
 
-from api.v1.schemas import UserIn, UserOut, RoleOut
-from api.v1.dependencies import get_request_user_id, check_user_staff
+from api.v1.schemas import UserIn, UserOut, UserListOut, RoleOut, UserRole, UserRolesIn, UserRolesOut
+from api.v1.dependencies import (
+    get_access_token_payload, get_request_user_id, has_request_permission, require_permission
+)
+from api.v1.etag import cached_json_response, etag_matches, not_modified
+from services.auth_service import AccessTokenPayload
 from services.user_service import UserService, get_user_service
-from services.role_service import RoleService, get_role_service
+from services.history_service import HistoryService, get_history_service
 
 router = APIRouter()
 
 
+@router.get('/', response_model=UserListOut, dependencies=[Depends(require_permission('users:read'))])
+async def get_users(
+        user_service: Annotated[UserService, Depends(get_user_service)],
+        email: Annotated[str | None, Query(min_length=3, description='Substring of the email')] = None,
+        role: Annotated[str | None, Query(description='Name of a role the users have')] = None,
+        cursor: Annotated[str | None, Query(description='next_cursor of the previous page')] = None,
+        size: Annotated[int, Query(ge=1, le=500)] = 50,
+) -> UserListOut:
+    users = await user_service.search(email=email, role=role, after=_decode_cursor(cursor) if cursor else None,
+                                      limit=size + 1)
+    next_cursor = _encode_cursor(users[size - 1].created, users[size - 1].id) if len(users) > size else None
+    return UserListOut(items=users[:size], next_cursor=next_cursor)
+
+
+@router.get('/history/export', response_class=StreamingResponse)
+async def export_history(
+        history_service: Annotated[HistoryService, Depends(get_history_service)],
+        user_service: Annotated[UserService, Depends(get_user_service)],
+        payload: Annotated[AccessTokenPayload, Depends(get_access_token_payload)],
+        user_id: Annotated[UUID | None, Query(description='Only logins of this user, all users if not set')] = None,
+        since: Annotated[datetime | None, Query(description='Logins at or after this time')] = None,
+        until: Annotated[datetime | None, Query(description='Logins before this time')] = None,
+        compress: Annotated[bool, Query(description='Gzip the output')] = False,
+) -> StreamingResponse:
+    # the permissions are resolved only for the history of others
+    if user_id != payload.user_id and not await has_request_permission(payload, user_service, 'history:read'):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You don't have permission")
+
+    filename = 'history.ndjson.gz' if compress else 'history.ndjson'
+    return StreamingResponse(
+        history_service.export(user_id, since, until, compress),
+        media_type='application/gzip' if compress else 'application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
+
+
+@router.post(
+    '/roles/bulk',
+    response_model=UserRolesOut,
+    dependencies=[Depends(require_permission('user_roles:write'))],
+)
+async def assign_roles(
+        user_roles: UserRolesIn,
+        user_service: Annotated[UserService, Depends(get_user_service)],
+) -> UserRolesOut:
+    applied = await user_service.add_roles_to_users([(item.user_id, item.role_id) for item in user_roles.items])
+    return UserRolesOut(applied=[UserRole(user_id=user_id, role_id=role_id) for user_id, role_id in applied])
+
+
+@router.delete(
+    '/roles/bulk',
+    response_model=UserRolesOut,
+    dependencies=[Depends(require_permission('user_roles:write'))],
+)
+async def dissociate_roles(
+        user_roles: UserRolesIn,
+        user_service: Annotated[UserService, Depends(get_user_service)],
+) -> UserRolesOut:
+    applied = await user_service.delete_roles_from_users([(item.user_id, item.role_id) for item in user_roles.items])
+    return UserRolesOut(applied=[UserRole(user_id=user_id, role_id=role_id) for user_id, role_id in applied])
+
+
 @router.get('/{user_id}', response_model=UserOut, dependencies=[Depends(get_request_user_id)])
 async def get_user(
         user_id: UUID,
         user_service: Annotated[UserService, Depends(get_user_service)],
-) -> UserOut:
-    return await user_service.get_by_id(user_id)
+        if_none_match: Annotated[str | None, Header()] = None,
+) -> Response:
+    etag = await user_service.get_profile_etag(user_id)
+    if etag_matches(etag, if_none_match):
+        return not_modified(etag)
+
+    profile = await user_service.get_profile(user_id)
+    if not profile:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='User not found')
+
+    return cached_json_response(profile)
 
 
 @router.put('/{user_id}', response_model=UserOut)
@@ -36,42 +115,61 @@ async def update_user(
 async def get_user_roles(
         user_id: UUID,
         user_service: Annotated[UserService, Depends(get_user_service)],
-        role_service: Annotated[RoleService, Depends(get_role_service)],
-        request_user_id: Annotated[UUID, Depends(get_request_user_id)],
-) -> List[RoleOut]:
-    if user_id != request_user_id and not await role_service.is_staff(await user_service.get_roles(request_user_id)):
+        payload: Annotated[AccessTokenPayload, Depends(get_access_token_payload)],
+        if_none_match: Annotated[str | None, Header()] = None,
+) -> Response:
+    if user_id != payload.user_id and not await has_request_permission(payload, user_service, 'users:read'):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You don't have permission")
 
-    return await user_service.get_roles(user_id)
+    etag = await user_service.get_roles_etag(user_id)
+    if etag_matches(etag, if_none_match):
+        return not_modified(etag)
+
+    return cached_json_response(await user_service.get_serialized_roles(user_id))
 
 
-@router.post('/{user_id}/roles', response_model=RoleOut, dependencies=[Depends(check_user_staff)])
+@router.post(
+    '/{user_id}/roles',
+    response_model=RoleOut,
+    dependencies=[Depends(require_permission('user_roles:write'))],
+)
 async def assign_role(
         user_id: UUID,
         role_id: UUID,
-        role_service: Annotated[RoleService, Depends(get_role_service)],
         user_service: Annotated[UserService, Depends(get_user_service)],
 ) -> RoleOut:
-    if not await role_service.is_role_exists_by_id(role_id):
+    assignment = await user_service.add_role_to_user(user_id=user_id, role_id=role_id)
+    if not assignment:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Role not found')
 
-    if await user_service.has_role(user_id=user_id, role_id=role_id):
+    if not assignment.applied:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='User already has this role')
 
-    role_id = await user_service.add_role_to_user(user_id=user_id, role_id=role_id)
-    return await role_service.get_role_by_id(role_id)
+    return RoleOut(id=assignment.id, name=assignment.name)
 
 
-@router.delete('/{user_id}/roles', dependencies=[Depends(check_user_staff)])
+@router.delete(
+    '/{user_id}/roles',
+    dependencies=[Depends(require_permission('user_roles:write'))],
+)
 async def dissociate_role(
         user_id: UUID,
         role_id: UUID,
-        role_service: Annotated[RoleService, Depends(get_role_service)],
         user_service: Annotated[UserService, Depends(get_user_service)],
 ) -> Response:
-    if not await role_service.is_role_exists_by_id(role_id):
+    if not await user_service.delete_role_from_user(user_id, role_id):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Role not found')
 
-    await user_service.delete_role_from_user(user_id, role_id)
-
     return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+def _encode_cursor(created: datetime, user_id: UUID) -> str:
+    return base64.urlsafe_b64encode(f'{created.isoformat()}|{user_id}'.encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    try:
+        created, user_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created), UUID(user_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail='Invalid cursor') from e
@@ -0,0 +1,28 @@
+from datetime import datetime, timedelta
+
+import typer
+
+from core.config import settings
+from create_superuser import coro
+from services.history_service import HistoryArchiveError, HistoryService
+
+app = typer.Typer()
+
+
+@app.command()
+@coro
+async def archive_history(
+    before: datetime = typer.Option(None, help='Archive logins older than this, '
+                                                'HISTORY_ARCHIVE_AFTER_DAYS before now if not set'),
+):
+    before = before or datetime.utcnow() - timedelta(days=settings.history_archive_after_days)
+    try:
+        archived = await HistoryService().archive(before)
+    except HistoryArchiveError as e:
+        typer.echo(f'archive failed, nothing was deleted from the failed month: {e}')
+        raise typer.Exit(1)
+    typer.echo(f'archived {archived} logins before {before:%Y-%m-%d %H:%M:%S} to {settings.history_archive_dir}')
+
+
+if __name__ == '__main__':
+    app()
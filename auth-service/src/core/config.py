@@ -1,5 +1,7 @@
 from logging import config as logging_config
+from typing import Dict, List, Literal
 
+from pydantic import IPvAnyNetwork
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 from core.logger import LOGGING
@@ -20,6 +22,14 @@ class Settings(BaseSettings):
 
     redis_host: str = '127.0.0.1'
     redis_port: int = 6379
+    redis_mode: Literal['standalone', 'sentinel', 'cluster'] = 'standalone'
+    # host:port of the sentinels or of the cluster startup nodes, redis_host and redis_port are used when empty
+    redis_nodes: List[str] = []
+    redis_sentinel_master: str = 'mymaster'
+    # revocation checks may read from replicas, a token revoked within the replication lag is then still accepted
+    redis_read_from_replicas: bool = False
+    # legacy -> dual for one refresh token lifetime -> compact, see storage/token_storage.py
+    token_storage_layout: Literal['legacy', 'dual', 'compact'] = 'legacy'
 
     private_key: bytes
     public_key: bytes
@@ -27,12 +37,100 @@ class Settings(BaseSettings):
 
     yandex_client_id: str
     yandex_client_secret: str
+    yandex_oauth_url: str = 'https://oauth.yandex.ru'
+    yandex_login_url: str = 'https://login.yandex.ru'
+
+    provider_http_pool_size: int = 100
+    provider_http_pool_size_per_host: int = 20
+    provider_http_keepalive_timeout: float = 30
+    provider_http_dns_cache_ttl: int = 300
+    provider_http_connect_timeout: float = 2
+    provider_http_request_timeout: float = 5
+    provider_http_deadline: float = 10
+    provider_http_retries: int = 2
+    provider_http_retry_backoff: float = 0.2
+    provider_circuit_failure_threshold: int = 5
+    provider_circuit_reset_timeout: float = 30
 
     jaeger_host: str = '127.0.0.1'
     jaeger_port: int = 6831
     enable_tracer: bool = True
+    enable_metrics: bool = False
+    otlp_metrics_endpoint: str = 'http://127.0.0.1:4317'
 
     echo_in_db: bool = True
 
+    # gunicorn, see gunicorn_conf.py
+    workers: int = 4
+    # imports the app once in the master, so workers fork with modules and parsed keys already in memory
+    preload_app: bool = True
+    # idle connections from nginx are kept open this long, longer than its upstream keepalive_timeout of 60 s,
+    # so nginx never sends a request on a connection the worker is closing
+    keepalive_seconds: int = 75
+    # connections opened by each worker before it reports ready, the pools keep them for later requests
+    warmup_db_connections: int = 5
+    warmup_redis_connections: int = 5
+
+    # full: readable claims; compact: base64url uuids, integer timestamps, a type code and a role bitmask.
+    # Tokens of both profiles are accepted whichever one is issued.
+    token_claims_profile: Literal['full', 'compact'] = 'full'
+    # role names by mapping version, a role's bit is its position in the list; published versions must not change,
+    # a new version is added instead while tokens issued with the old one are alive
+    token_role_mappings: Dict[int, List[str]] = {1: ['superuser', 'admin', 'service']}
+    token_role_mapping_version: int = 1
+
+    # permission names, a permission's bit is its position in the list; masks may be embedded in tokens, so
+    # a permission keeps its position and new ones are appended
+    permissions: List[str] = ['users:read', 'user_roles:write', 'roles:read', 'roles:write', 'history:read']
+    # permissions granted by each role, roles missing here grant none
+    role_permissions: Dict[str, List[str]] = {
+        role: ['users:read', 'user_roles:write', 'roles:read', 'roles:write', 'history:read']
+        for role in ('superuser', 'admin', 'service')
+    }
+    # embeds the permission mask in access tokens and checks trust it without reading the roles of the user,
+    # role changes then apply when the token is refreshed
+    token_permissions: bool = False
+
+    # how long a gateway may cache a positive token verification, i.e. keep accepting a just revoked token
+    revocation_propagation_seconds: int = 30
+
+    # rows fetched from the server side cursor at a time by the login history export
+    history_export_chunk_size: int = 1000
+    # logins older than this are moved from Postgres to gzipped JSON lines files by archive_history.py,
+    # the export reads them back
+    history_archive_dir: str = '/home/app/history_archive'
+    history_archive_after_days: int = 365
+    # files an archive run is split into by user, the export of one user reads one of them; changing it only
+    # affects later runs
+    history_archive_partitions: int = 64
+
+    # user profiles, role lists and the role catalog cached in Redis, changes invalidate them and the TTL bounds
+    # how long a body survives a failed invalidation
+    profile_cache_ttl_seconds: int = 60 * 60
+    # the role lists of users decide their permissions, a role revoked while the invalidation failed keeps working
+    # for at most this long
+    role_list_cache_ttl_seconds: int = 60
+
+    # Bloom filter of registered emails in Redis, logins with emails it does not contain skip the database.
+    # It takes about 1.2 MB per million emails at a 1% false positive rate
+    email_filter_enabled: bool = True
+    email_filter_capacity: int = 1_000_000
+    email_filter_error_rate: float = 0.01
+
+    # failed logins allowed per email and per source address before lockouts start, each further failure doubles
+    # the lockout up to its maximum; the counters are dropped after a window without failures
+    login_email_max_failures: int = 5
+    login_ip_max_failures: int = 50
+    login_lockout_seconds: int = 1
+    login_lockout_max_seconds: int = 15 * 60
+    login_failures_window_seconds: int = 60 * 60
+    # peers whose X-Real-IP is taken as the client address, by default loopback and the private networks nginx runs
+    # in; a request from any other peer is counted by its own address, so a client cannot pick the IP it is counted by
+    login_trusted_proxies: List[IPvAnyNetwork] = ['127.0.0.0/8', '::1/128', '10.0.0.0/8', '172.16.0.0/12',
+                                                  '192.168.0.0/16']
+
+    rate_limit_times: int = 5
+    rate_limit_seconds: int = 1
+
 
 settings = Settings()
@@ -0,0 +1,43 @@
+"""Permission bitmasks compiled once from the role to permission mapping in the settings.
+
+A permission's bit is its position in settings.permissions, a set of permissions is an integer and a check is an AND.
+"""
+from functools import lru_cache
+from typing import Dict, Iterable
+
+from core.config import settings
+
+
+@lru_cache()
+def _permission_bits() -> Dict[str, int]:
+    return {permission: 1 << i for i, permission in enumerate(settings.permissions)}
+
+
+@lru_cache()
+def _role_masks() -> Dict[str, int]:
+    masks = {}
+    for role, permissions in settings.role_permissions.items():
+        unknown = set(permissions) - _permission_bits().keys()
+        if unknown:
+            raise ValueError(f'Role {role} grants unknown permissions {", ".join(sorted(unknown))}')
+        masks[role] = sum(_permission_bits()[permission] for permission in set(permissions))
+    return masks
+
+
+def permission_bit(permission: str) -> int:
+    try:
+        return _permission_bits()[permission]
+    except KeyError:
+        raise ValueError(f'Unknown permission {permission}') from None
+
+
+def permission_mask(roles: Iterable[str]) -> int:
+    """Returns the permissions granted by the roles, roles missing from the mapping grant none."""
+    mask = 0
+    for role in roles:
+        mask |= _role_masks().get(role, 0)
+    return mask
+
+
+def has_permission(mask: int, permission: str) -> bool:
+    return bool(mask & permission_bit(permission))
@@ -11,6 +11,8 @@ from sqlalchemy.orm import sessionmaker
 
 from models.entity import User, Role, user_role
 from core.config import settings
+from db import redis
+from storage.email_filter import get_email_filter
 
 SUPERUSER = 'superuser'
 
@@ -59,6 +61,13 @@ async def create_superuser():
         message += f'added superuser with id = {user_id}'
         print(message)
 
+    # the superuser is inserted past UserService, its email is added to the filter here
+    redis_client, _ = redis.create_redis()
+    email_filter = get_email_filter(redis_client)
+    if email_filter:
+        await email_filter.add(email)
+    await redis_client.close()
+
 
 if __name__ == '__main__':
     create_superuser()
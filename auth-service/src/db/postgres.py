@@ -1,3 +1,5 @@
+from typing import AsyncIterator
+
 from sqlalchemy.orm import declarative_base, sessionmaker
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 
@@ -12,12 +14,12 @@ async_session = sessionmaker(
 )
 
 
-async def get_session() -> AsyncSession:
+async def get_session() -> AsyncIterator[AsyncSession]:
+    # the session checks out a pool connection on its first statement and returns it on commit,
+    # so requests that never touch Postgres do not hold a connection
     async with async_session() as session:
         try:
             yield session
         except Exception:
             await session.rollback()
             raise
-        finally:
-            await session.close()
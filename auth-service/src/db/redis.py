@@ -1,7 +1,41 @@
-from redis.asyncio import Redis
+from typing import List, Tuple
 
-redis: Redis | None = None
+from redis.asyncio import Redis, RedisCluster, Sentinel
+from redis.asyncio.cluster import ClusterNode
 
+from core.config import settings
 
-async def get_redis() -> Redis:
+redis: Redis | RedisCluster | None = None
+# read-only commands that tolerate replication lag may go here, it is the primary unless replica reads are enabled
+redis_replica: Redis | RedisCluster | None = None
+
+
+def _nodes() -> List[Tuple[str, int]]:
+    nodes = [node.rsplit(':', 1) for node in settings.redis_nodes] or [(settings.redis_host, settings.redis_port)]
+    return [(host, int(port)) for host, port in nodes]
+
+
+def create_redis() -> Tuple[Redis | RedisCluster, Redis | RedisCluster]:
+    """Creates the primary client for the configured topology and the client for replica reads."""
+    if settings.redis_mode == 'sentinel':
+        sentinel = Sentinel(_nodes())
+        primary = sentinel.master_for(settings.redis_sentinel_master)
+        if settings.redis_read_from_replicas:
+            # falls back to the primary while no replica is available
+            return primary, sentinel.slave_for(settings.redis_sentinel_master)
+        return primary, primary
+    if settings.redis_mode == 'cluster':
+        # the cluster client routes read-only commands to replicas by itself
+        cluster = RedisCluster(startup_nodes=[ClusterNode(host, port) for host, port in _nodes()],
+                               read_from_replicas=settings.redis_read_from_replicas)
+        return cluster, cluster
+    primary = Redis(host=settings.redis_host, port=settings.redis_port)
+    return primary, primary
+
+
+async def get_redis() -> Redis | RedisCluster:
     return redis
+
+
+async def get_redis_replica() -> Redis | RedisCluster:
+    return redis_replica
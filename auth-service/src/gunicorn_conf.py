@@ -0,0 +1,17 @@
+# gunicorn reads lower-case module attributes as its settings
+# pylint: disable=invalid-name
+import time
+
+from core.config import settings
+
+bind = '0.0.0.0:8000'
+worker_class = 'uvicorn.workers.UvicornWorker'
+workers = settings.workers
+preload_app = settings.preload_app
+keepalive = settings.keepalive_seconds
+
+
+def post_fork(server, worker):  # pylint: disable=unused-argument
+    # time to ready is counted from the fork, so it includes the app import unless the app is preloaded
+    import warmup  # pylint: disable=import-outside-toplevel
+    warmup.warm_up.boot_started = time.monotonic()
@@ -1,7 +1,159 @@
-from aiohttp import ClientSession
+import asyncio
+import logging
+import random
+import time
+from enum import IntEnum
+from typing import Annotated, Any, Dict, Iterable
+from urllib.parse import urlsplit
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector, ClientError, ClientResponseError, ClientConnectorError
+from fastapi import Depends
+from opentelemetry import metrics, trace
+from opentelemetry.metrics import CallbackOptions, Observation
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+tracer = trace.get_tracer(__name__)
+meter = metrics.get_meter(__name__)
 
 session: ClientSession | None = None
 
 
+class ProviderUnavailableError(Exception):
+    pass
+
+
+class CircuitState(IntEnum):
+    CLOSED = 0
+    HALF_OPEN = 1
+    OPEN = 2
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, reset_timeout: float) -> None:
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.state = CircuitState.CLOSED
+
+    def allow_request(self) -> bool:
+        if self.state == CircuitState.CLOSED:
+            return True
+        if self.state == CircuitState.OPEN and time.monotonic() - self._opened_at >= self._reset_timeout:
+            self.state = CircuitState.HALF_OPEN
+            self._trial_in_flight = False
+        if self.state == CircuitState.HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._trial_in_flight = False
+        self.state = CircuitState.CLOSED
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        self._trial_in_flight = False
+        if self.state == CircuitState.HALF_OPEN or self._failures >= self._failure_threshold:
+            self.state = CircuitState.OPEN
+            self._opened_at = time.monotonic()
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def _observe_breakers(_: CallbackOptions) -> Iterable[Observation]:
+    return [Observation(breaker.state.value, {'host': host}) for host, breaker in _breakers.items()]
+
+
+_request_duration = meter.create_histogram(
+    'provider.request.duration', unit='s', description='Duration of requests to OAuth providers'
+)
+meter.create_observable_gauge(
+    'provider.circuit.state', callbacks=[_observe_breakers],
+    description='Circuit breaker state per provider host: 0 closed, 1 half-open, 2 open'
+)
+
+
+class ProviderClient:
+    """Outbound client for OAuth providers with per-call timeouts, retries and a circuit breaker per host."""
+
+    def __init__(self, http_session: ClientSession) -> None:
+        self._http_session = http_session
+
+    async def request_json(self, method: str, url: str, *, idempotent: bool = True, **kwargs: Any) -> Any:
+        host = urlsplit(url).hostname
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker(settings.provider_circuit_failure_threshold,
+                                             settings.provider_circuit_reset_timeout)
+        breaker = _breakers[host]
+        for attempt in range(settings.provider_http_retries + 1):
+            if not breaker.allow_request():
+                logger.warning('Circuit for provider host %s is open', host)
+                raise ProviderUnavailableError(f'Provider {host} is unavailable')
+            started = time.monotonic()
+            with tracer.start_as_current_span(f'{method} {host}', attributes={'http.url': url, 'retry': attempt}):
+                try:
+                    async with self._http_session.request(method, url, raise_for_status=True, **kwargs) as response:
+                        body = await response.json()
+                except ClientResponseError as e:
+                    self._record(host, started, str(e.status))
+                    if e.status < 500:
+                        # the provider answered, so the request itself is wrong
+                        breaker.record_success()
+                        raise
+                    breaker.record_failure()
+                    if not idempotent:
+                        raise ProviderUnavailableError(f'Request to {host} failed: {e}') from e
+                    error = e
+                except (ClientError, asyncio.TimeoutError) as e:
+                    self._record(host, started, type(e).__name__)
+                    breaker.record_failure()
+                    # a request that may have reached the provider is retried only if it is idempotent
+                    if not idempotent and not isinstance(e, ClientConnectorError):
+                        raise ProviderUnavailableError(f'Request to {host} failed: {e}') from e
+                    error = e
+                except BaseException as e:
+                    # a cancelled call, for example by the caller's deadline, must not keep the half-open trial taken
+                    self._record(host, started, type(e).__name__)
+                    breaker.record_failure()
+                    raise
+                else:
+                    self._record(host, started, 'ok')
+                    breaker.record_success()
+                    return body
+            logger.warning('Request to provider host %s failed on attempt %s: %s', host, attempt + 1, error)
+            if attempt < settings.provider_http_retries:
+                await asyncio.sleep(random.uniform(0, settings.provider_http_retry_backoff * 2 ** attempt))
+        raise ProviderUnavailableError(f'Request to {host} failed: {error}') from error
+
+    @staticmethod
+    def _record(host: str, started: float, outcome: str) -> None:
+        _request_duration.record(time.monotonic() - started, {'host': host, 'outcome': outcome})
+
+
+def create_session() -> ClientSession:
+    return ClientSession(
+        connector=TCPConnector(
+            limit=settings.provider_http_pool_size,
+            limit_per_host=settings.provider_http_pool_size_per_host,
+            ttl_dns_cache=settings.provider_http_dns_cache_ttl,
+            keepalive_timeout=settings.provider_http_keepalive_timeout,
+        ),
+        timeout=ClientTimeout(
+            total=settings.provider_http_request_timeout,
+            connect=settings.provider_http_connect_timeout,
+        ),
+    )
+
+
 def get_session() -> ClientSession:
     return session
+
+
+def get_provider_client(http_session: Annotated[ClientSession, Depends(get_session)]) -> ProviderClient:
+    return ProviderClient(http_session)
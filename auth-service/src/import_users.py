@@ -0,0 +1,179 @@
+import asyncio
+import csv
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator, List, NamedTuple, Tuple
+
+import typer
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncConnection
+
+from core.config import settings
+from create_superuser import coro
+from db import redis
+from services.password_service import PasswordService
+from storage.email_filter import get_email_filter
+from storage.profile_cache import ProfileCache, user_roles_resource
+
+_STAGING_TABLE = 'import_users'
+_ROLES_SEPARATOR = ';'
+
+app = typer.Typer()
+
+
+class ImportRecord(NamedTuple):
+    email: str
+    password: str
+    roles: List[str]
+
+
+@app.command()
+@coro
+async def import_users(  # pylint: disable=too-many-locals
+    source: Path = typer.Argument(..., exists=True, dir_okay=False, help='CSV (email,password[,roles]) or JSONL file'),
+    batch_size: int = typer.Option(5000, min=1, help='Users loaded per COPY and transaction'),
+    workers: int = typer.Option(os.cpu_count() or 1, min=1, help='Processes used for password hashing'),
+    resume: bool = typer.Option(False, help='Skip records already loaded by a previous run'),
+):
+    checkpoint = source.with_name(f'{source.name}.checkpoint')
+    skip = int(checkpoint.read_text(encoding='utf-8')) if resume and checkpoint.exists() else 0
+    if skip:
+        typer.echo(f'resuming after {skip} records')
+
+    dsn = (f'postgresql+asyncpg://{settings.postgres_user}:{settings.postgres_password}@'
+           f'{settings.postgres_host}:{settings.postgres_port}/{settings.postgres_db}')
+    engine = create_async_engine(dsn, echo=False, future=True)
+    loop = asyncio.get_running_loop()
+    redis_client, _ = redis.create_redis()
+    # the users are inserted past UserService, their emails are added to the filter here
+    email_filter = get_email_filter(redis_client)
+    profile_cache = ProfileCache(redis_client)
+    started, loaded, created, assigned = time.monotonic(), skip, 0, 0
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        async with engine.connect() as conn:
+            await _create_staging_table(conn)
+            batches = _batches(_read_records(source), batch_size, skip)
+            # hashing of the next batch runs in the pool while the current one is copied
+            pending = _hash_batch(loop, pool, next(batches, []), workers)
+            while True:
+                rows = await pending
+                if not rows:
+                    break
+                pending = _hash_batch(loop, pool, next(batches, []), workers)
+                # added before the commit: an email of a failed batch is a harmless false positive, a committed user
+                # missing from the filter could not log in
+                if email_filter:
+                    await email_filter.add_many(email for _, email, _, _ in rows)
+                batch_created, assigned_user_ids = await _load_batch(conn, rows)
+                loaded, created = loaded + len(rows), created + batch_created
+                assigned += len(assigned_user_ids)
+                # right after the commit, a crash before it makes --resume load the batch again, which is safe
+                checkpoint.write_text(str(loaded), encoding='utf-8')
+                if assigned_user_ids:
+                    # role lists read while the batch was loading must not outlive it
+                    await profile_cache.invalidate(*(user_roles_resource(user_id) for user_id in assigned_user_ids))
+                elapsed = time.monotonic() - started
+                typer.echo(f'processed {loaded} records, created {created} users, assigned {assigned} roles '
+                           f'({(loaded - skip) / elapsed:.0f} records/s)')
+    await engine.dispose()
+    await redis_client.close()
+    checkpoint.unlink(missing_ok=True)
+    typer.echo(f'done: {loaded} records processed, {created} users created')
+
+
+def _read_records(source: Path) -> Iterator[ImportRecord]:
+    with source.open(encoding='utf-8', newline='') as f:
+        if source.suffix == '.jsonl':
+            for line in f:
+                if line.strip():
+                    item = json.loads(line)
+                    yield ImportRecord(item['email'], item['password'], list(item.get('roles') or []))
+            return
+        for row in csv.DictReader(f):
+            roles = [r for r in (row.get('roles') or '').split(_ROLES_SEPARATOR) if r]
+            yield ImportRecord(row['email'], row['password'], roles)
+
+
+def _batches(records: Iterator[ImportRecord], batch_size: int, skip: int) -> Iterator[List[ImportRecord]]:
+    batch = []
+    for i, record in enumerate(records):
+        if i < skip:
+            continue
+        batch.append(record)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def _hash_batch(
+    loop: asyncio.AbstractEventLoop, pool: ProcessPoolExecutor, batch: List[ImportRecord], workers: int
+) -> List[Tuple[uuid.UUID, str, str, List[str]]]:
+    if not batch:
+        return []
+    chunk_size = -(-len(batch) // workers)
+    chunks = [batch[i:i + chunk_size] for i in range(0, len(batch), chunk_size)]
+    hashed = await asyncio.gather(*(loop.run_in_executor(pool, _hash_chunk, chunk) for chunk in chunks))
+    return [
+        (uuid.uuid4(), record.email, hashed_password, record.roles)
+        for chunk, hashes in zip(chunks, hashed)
+        for record, hashed_password in zip(chunk, hashes)
+    ]
+
+
+def _hash_chunk(chunk: List[ImportRecord]) -> List[str]:
+    password_service = PasswordService()
+    return [password_service.get_password_hash(record.email, record.password) for record in chunk]
+
+
+async def _create_staging_table(conn: AsyncConnection) -> None:
+    await conn.execute(text(
+        f'CREATE TEMP TABLE IF NOT EXISTS {_STAGING_TABLE} '
+        '(id uuid, email text, hashed_password text, roles text[])'
+    ))
+    await conn.commit()
+
+
+async def _load_batch(
+    conn: AsyncConnection, rows: List[Tuple[uuid.UUID, str, str, List[str]]]
+) -> Tuple[int, List[uuid.UUID]]:
+    """Inserts the users of the batch that do not exist yet and grants them their roles.
+
+    Returns the number of created users and the user id of every granted role.
+    """
+    # truncating first also opens the transaction the COPY below runs in
+    await conn.execute(text(f'TRUNCATE {_STAGING_TABLE}'))
+    raw_connection = await conn.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        _STAGING_TABLE, records=rows, columns=['id', 'email', 'hashed_password', 'roles']
+    )
+    # users that already exist are left untouched and the roles are granted again, so re-running a batch is safe
+    created = await conn.execute(text(
+        f'INSERT INTO users (id, email, hashed_password, created) '
+        f'SELECT id, email, hashed_password, now() FROM {_STAGING_TABLE} '
+        'ON CONFLICT (email) DO NOTHING'
+    ))
+    # the hash is salted with the email, so only an account with the file's email and password matches: the users
+    # of a batch loaded before get their roles again and an existing account with its own password gets none
+    assigned = await conn.execute(text(
+        'INSERT INTO user_role (user_id, role_id) '
+        'SELECT users.id, roles.id '
+        f'FROM {_STAGING_TABLE} AS staging '
+        'JOIN users ON users.email = staging.email AND users.hashed_password = staging.hashed_password '
+        'JOIN roles ON roles.name = ANY(staging.roles) '
+        'ON CONFLICT DO NOTHING '
+        'RETURNING user_id'
+    ))
+    assigned_user_ids = list(assigned.scalars())
+    await conn.commit()
+    return created.rowcount, assigned_user_ids
+
+
+if __name__ == '__main__':
+    app()
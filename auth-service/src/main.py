@@ -1,32 +1,51 @@
+import asyncio
 from contextlib import asynccontextmanager
 import logging
 
 import uvicorn
-import aiohttp
 from fastapi import FastAPI, Request, status, Depends
-from fastapi.responses import ORJSONResponse
+from fastapi.responses import ORJSONResponse, Response
 from fastapi_limiter import FastAPILimiter
 from fastapi_limiter.depends import RateLimiter
 from fastapi_pagination import add_pagination
-from redis.asyncio import Redis
-from opentelemetry import trace
-from opentelemetry.sdk.resources import Resource
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
 from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
-from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
 
 import http_client
+import warmup
 from core.config import settings
 from core.logger import LOGGING
 from db import redis
 from api.v1 import auth, roles, users
+from services.auth_service import load_token_keys
+from services.user_service import rebuild_email_filter
+from storage.email_filter import get_email_filter
 
 
 logger = logging.getLogger(__name__)
 
 
+async def build_email_filter() -> None:
+    email_filter = get_email_filter(redis.redis)
+    if not email_filter:
+        return
+    try:
+        # the filter is shared through Redis, only the first worker to start after it was lost builds it
+        if not await email_filter.exists():
+            await rebuild_email_filter(email_filter)
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        # lookups go to the database until the filter exists
+        logger.error('Failed to build email filter: %s', e)
+
+
 def configure_tracer() -> None:
+    # the SDK and exporters are imported only when enabled, they take a noticeable part of the worker boot
+    # pylint: disable=import-outside-toplevel
+    from opentelemetry import trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+
     provider = TracerProvider(resource=Resource(attributes={'service.name': settings.project_name}))
     processor = BatchSpanProcessor(OTLPSpanExporter(endpoint=f'http://{settings.jaeger_host}:{settings.jaeger_port}',
                                                     insecure=True))
@@ -34,18 +53,42 @@ def configure_tracer() -> None:
     trace.set_tracer_provider(provider)
 
 
+def configure_meter() -> None:
+    # pylint: disable=import-outside-toplevel
+    from opentelemetry import metrics
+    from opentelemetry.sdk.metrics import MeterProvider
+    from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
+
+    reader = PeriodicExportingMetricReader(OTLPMetricExporter(endpoint=settings.otlp_metrics_endpoint, insecure=True))
+    metrics.set_meter_provider(MeterProvider(resource=Resource(attributes={'service.name': settings.project_name}),
+                                             metric_readers=[reader]))
+
+
 @asynccontextmanager
 async def lifespan(_: FastAPI):
-    redis.redis = Redis(host=settings.redis_host, port=settings.redis_port)
-    http_client.session = aiohttp.ClientSession()
+    # runs in every worker after the fork: the exporters' gRPC channels and export threads do not survive one,
+    # and the meters and tracers taken at import follow the providers set here
+    if settings.enable_tracer:
+        configure_tracer()
+    if settings.enable_metrics:
+        configure_meter()
+    redis.redis, redis.redis_replica = redis.create_redis()
+    http_client.session = http_client.create_session()
     await FastAPILimiter.init(redis.redis)
+    await warmup.warm_up.run(app)
+    email_filter_task = asyncio.create_task(build_email_filter())
     yield
+    email_filter_task.cancel()
     await FastAPILimiter.close()
+    if redis.redis_replica is not redis.redis:
+        await redis.redis_replica.close()
     await redis.redis.close()
     await http_client.session.close()
 
-if settings.enable_tracer:
-    configure_tracer()
+# with preload_app this runs once in the gunicorn master and the workers inherit the parsed keys
+load_token_keys()
 
 app = FastAPI(
     title=settings.project_name,
@@ -60,24 +103,35 @@ FastAPIInstrumentor.instrument_app(app)
 app.include_router(
     auth.router, prefix='/api/v1/auth',
     tags=['auth'],
-    dependencies=[Depends(RateLimiter(times=5, seconds=1))]
+    dependencies=[Depends(RateLimiter(times=settings.rate_limit_times, seconds=settings.rate_limit_seconds))]
 )
+app.include_router(auth.verify_router, prefix='/api/v1/auth', tags=['auth'])
 app.include_router(
     roles.router,
     prefix='/api/v1/roles',
     tags=['roles'],
-    dependencies=[Depends(RateLimiter(times=5, seconds=1))]
+    dependencies=[Depends(RateLimiter(times=settings.rate_limit_times, seconds=settings.rate_limit_seconds))]
 )
 app.include_router(
     users.router,
     prefix='/api/v1/users',
     tags=['users'],
-    dependencies=[Depends(RateLimiter(times=5, seconds=1))]
+    dependencies=[Depends(RateLimiter(times=settings.rate_limit_times, seconds=settings.rate_limit_seconds))]
 )
 
 
+@app.get('/api/health/ready', include_in_schema=False)
+async def ready() -> Response:
+    # retries a failed warm-up, so the worker turns ready once its dependencies are back
+    if not await warmup.warm_up.run(app):
+        return Response(status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
 @app.middleware('http')
 async def before_request(request: Request, call_next):
+    if request.url.path == '/api/health/ready':
+        return await call_next(request)
     request_id = request.headers.get('X-Request-Id')
     if not request_id:
         return ORJSONResponse(status_code=status.HTTP_400_BAD_REQUEST,
@@ -2,7 +2,7 @@ import uuid
 from typing import List
 from datetime import datetime
 
-from sqlalchemy import Column, Table, ForeignKey, Text, func, UniqueConstraint
+from sqlalchemy import Column, Table, ForeignKey, Text, func, UniqueConstraint, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.dialects.postgresql import UUID
 
@@ -13,11 +13,17 @@ user_role = Table(
     Base.metadata,
     Column('user_id', ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
     Column('role_id', ForeignKey('roles.id', ondelete='CASCADE'), primary_key=True),
+    # the primary key starts with user_id, deletes cascading from roles need their own index
+    Index('ix_user_role_role_id', 'role_id'),
 )
 
 
 class User(Base):
     __tablename__ = 'users'
+    __table_args__ = (
+        Index('ix_users_created_id', 'created', 'id'),
+        Index('ix_users_email_trgm', 'email', postgresql_using='gin', postgresql_ops={'email': 'gin_trgm_ops'}),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True)
     email: Mapped[str] = mapped_column(Text, unique=True, nullable=False)
@@ -46,6 +52,7 @@ class ProviderUser(Base):
     __tablename__ = 'provider_users'
     __table_args__ = (
         UniqueConstraint('id', 'provider'),
+        Index('ix_provider_users_user_id', 'user_id'),
     )
 
     id: Mapped[str] = mapped_column(Text, primary_key=True)
@@ -61,6 +68,7 @@ class UserLogin(Base):
     __tablename__ = 'user_logins'
     __table_args__ = (
         UniqueConstraint('id', 'user_device_type'),
+        Index('ix_user_logins_user_id_date', 'user_id', 'date'),
         {
             'postgresql_partition_by': 'LIST (user_device_type)',
         }
@@ -75,3 +83,16 @@ class UserLogin(Base):
 
     def __repr__(self) -> str:
         return f'<UserLogin {self.id}>'
+
+
+class LoginArchive(Base):
+    """An archive run of a month, recorded in the transaction that deletes its logins from user_logins."""
+    __tablename__ = 'login_archives'
+
+    end_date: Mapped[datetime] = mapped_column(primary_key=True)
+    month: Mapped[datetime] = mapped_column(nullable=False)
+    logins: Mapped[int] = mapped_column(nullable=False)
+    created: Mapped[datetime] = mapped_column(insert_default=func.now())  # pylint: disable=not-callable
+
+    def __repr__(self) -> str:
+        return f'<LoginArchive {self.month:%Y-%m} before {self.end_date}>'
@@ -0,0 +1,45 @@
+import typer
+
+from create_superuser import coro
+from db import redis
+from services.user_service import rebuild_email_filter as rebuild
+from storage.email_filter import EmailFilterStats, get_email_filter
+
+app = typer.Typer()
+
+
+@app.command()
+@coro
+async def rebuild_email_filter(
+    stats_only: bool = typer.Option(False, '--stats-only', help='Report the current filter without rebuilding it'),
+):
+    primary, replica = redis.create_redis()
+    try:
+        email_filter = get_email_filter(primary)
+        if not email_filter:
+            typer.echo('email filter is disabled')
+            raise typer.Exit(1)
+        if stats_only:
+            _echo_stats(await email_filter.stats())
+            return
+        stats = await rebuild(email_filter)
+        if not stats:
+            typer.echo('email filter is being rebuilt by another process')
+            raise typer.Exit(1)
+        _echo_stats(stats)
+    finally:
+        if replica is not primary:
+            await replica.close()
+        await primary.close()
+
+
+def _echo_stats(stats: EmailFilterStats | None) -> None:
+    if not stats:
+        typer.echo('email filter does not exist')
+        return
+    typer.echo(f'emails: {stats.items}, memory: {stats.size_bytes} B, '
+               f'false positive rate: {stats.false_positive_rate:.4%}')
+
+
+if __name__ == '__main__':
+    app()
@@ -1,6 +1,9 @@
 import logging
 import time
-from typing import Annotated, List
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Annotated, Any, Dict, List, NamedTuple, Sequence
 from uuid import uuid4, UUID
 from datetime import datetime
 from enum import Enum
@@ -8,20 +11,21 @@ from enum import Enum
 import jwt
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from pydantic import BaseModel, Field, ValidationError
 from fastapi import Depends
 from fastapi_pagination.ext.sqlalchemy import paginate
 from user_agents import parse
 
 from db.postgres import get_session
 from core.config import settings
-from models.entity import UserLogin, Role
+from core.permissions import permission_mask
+from models.entity import UserLogin
 from services.password_service import PasswordService, get_password_service
 from storage.token_storage import TokenStorage, get_token_storage
 
 _ALGORITHM = 'RS256'
 _ACCESS_TOKEN_EXPIRE_SECONDS = 24 * 60 * 60  # 1 day
 _REFRESH_TOKEN_EXPIRE_SECONDS = 10 * 24 * 60 * 60  # 10 days
+_DECODE_OPTIONS = {'require': ['exp', 'iat', 'jti']}
 
 logger = logging.getLogger(__name__)
 
@@ -38,35 +42,147 @@ class TokenType(str, Enum):
     REFRESH = 'refresh'
 
 
-class BaseTokenPayload(BaseModel):
+_TOKEN_TYPE_CODES = {TokenType.ACCESS: 'a', TokenType.REFRESH: 'r'}
+_TOKEN_TYPES = {code: token_type for token_type, code in _TOKEN_TYPE_CODES.items()}
+_TOKEN_TYPE_VALUES = {token_type.value: token_type for token_type in TokenType}
+
+
+def _encode_uuid(value: UUID) -> str:
+    return urlsafe_b64encode(value.bytes).rstrip(b'=').decode()
+
+
+def _decode_uuid(value: str) -> UUID:
+    return UUID(bytes=urlsafe_b64decode(value + '=='))
+
+
+@lru_cache()
+def _signing_key() -> Any:
+    return jwt.get_algorithm_by_name(_ALGORITHM).prepare_key(settings.private_key)
+
+
+@lru_cache()
+def _verifying_key() -> Any:
+    return jwt.get_algorithm_by_name(_ALGORITHM).prepare_key(settings.public_key)
+
+
+def load_token_keys() -> None:
+    """Parses the PEM keys once, otherwise every encode and decode parses them again."""
+    _signing_key()
+    _verifying_key()
+
+
+@lru_cache()
+def _role_bits(version: int) -> Dict[str, int]:
+    return {role: 1 << i for i, role in enumerate(settings.token_role_mappings[version])}
+
+
+# plain slotted structs: decoded claims are checked by hand instead of through model validation
+@dataclass(slots=True, kw_only=True)
+class BaseTokenPayload:
     user_id: UUID
     type: TokenType
-    iat: float = Field(default_factory=time.time)
+    iat: float = field(default_factory=time.time)
     exp: float
-    jti: UUID = Field(default_factory=uuid4)
+    jti: UUID = field(default_factory=uuid4)
 
-    def model_dump(self, *args, **kwargs) -> dict:
-        data = super().model_dump(*args, **kwargs)
-        data['user_id'] = str(data['user_id'])
-        data['jti'] = str(data['jti'])
-        return data
+    def to_claims(self) -> Dict[str, Any]:
+        return {'user_id': str(self.user_id), 'type': self.type.value, 'iat': self.iat, 'exp': self.exp,
+                'jti': str(self.jti)}
 
+    def to_compact_claims(self) -> Dict[str, Any]:
+        return {'sub': _encode_uuid(self.user_id), 'jti': _encode_uuid(self.jti), 't': _TOKEN_TYPE_CODES[self.type],
+                'iat': int(self.iat), 'exp': int(self.exp)}
 
+    @staticmethod
+    def _base_fields(claims: Dict[str, Any]) -> Dict[str, Any]:
+        # tokens of both claim profiles are accepted, whichever one is issued
+        if 't' in claims:
+            return {'user_id': _decode_uuid(claims['sub']), 'jti': _decode_uuid(claims['jti']),
+                    'type': _TOKEN_TYPES[claims['t']], 'iat': float(claims['iat']), 'exp': float(claims['exp'])}
+        return {'user_id': UUID(claims['user_id']), 'jti': UUID(claims['jti']),
+                'type': _TOKEN_TYPE_VALUES[claims['type']], 'iat': float(claims['iat']), 'exp': float(claims['exp'])}
+
+
+@dataclass(slots=True, kw_only=True)
 class AccessTokenPayload(BaseTokenPayload):
     type: TokenType = TokenType.ACCESS
-    exp: float = Field(default_factory=lambda: time.time() + _ACCESS_TOKEN_EXPIRE_SECONDS)
+    exp: float = field(default_factory=lambda: time.time() + _ACCESS_TOKEN_EXPIRE_SECONDS)
     roles: List[str]
-
-
+    # permission mask of the roles when it was issued, only with TOKEN_PERMISSIONS
+    permissions: int | None = None
+
+    def to_claims(self) -> Dict[str, Any]:
+        # zero-argument super() does not work in slotted dataclasses
+        claims = BaseTokenPayload.to_claims(self)
+        claims['roles'] = self.roles
+        if self.permissions is not None:
+            claims['permissions'] = self.permissions
+        return claims
+
+    def to_compact_claims(self) -> Dict[str, Any]:
+        claims = BaseTokenPayload.to_compact_claims(self)
+        # roles missing from the mapping are carried by name
+        role_bits = _role_bits(settings.token_role_mapping_version)
+        claims['rv'] = settings.token_role_mapping_version
+        claims['rm'] = sum(role_bits[role] for role in set(self.roles) if role in role_bits)
+        extra_roles = [role for role in self.roles if role not in role_bits]
+        if extra_roles:
+            claims['rx'] = extra_roles
+        if self.permissions is not None:
+            claims['pm'] = self.permissions
+        return claims
+
+    @classmethod
+    def from_claims(cls, claims: Dict[str, Any]) -> 'AccessTokenPayload':
+        try:
+            fields = cls._base_fields(claims)
+            if 't' in claims:
+                role_bits = _role_bits(claims['rv'])
+                roles = [role for role, bit in role_bits.items() if claims['rm'] & bit] + claims.get('rx', [])
+                permissions = claims.get('pm')
+            else:
+                roles = claims['roles']
+                permissions = claims.get('permissions')
+        except (KeyError, TypeError, ValueError) as e:
+            raise jwt.exceptions.InvalidTokenError(f'Malformed access token claims: {e!r}') from e
+        if not isinstance(roles, list) or not all(isinstance(role, str) for role in roles):
+            raise jwt.exceptions.InvalidTokenError('Malformed access token roles')
+        if permissions is not None and (not isinstance(permissions, int) or isinstance(permissions, bool)):
+            raise jwt.exceptions.InvalidTokenError('Malformed access token permissions')
+        return cls(roles=roles, permissions=permissions, **fields)
+
+
+@dataclass(slots=True, kw_only=True)
 class RefreshTokenPayload(BaseTokenPayload):
     type: TokenType = TokenType.REFRESH
-    exp: float = Field(default_factory=lambda: time.time() + _REFRESH_TOKEN_EXPIRE_SECONDS)
+    exp: float = field(default_factory=lambda: time.time() + _REFRESH_TOKEN_EXPIRE_SECONDS)
     access_jti: UUID
 
-    def model_dump(self, *args, **kwargs) -> dict:
-        data = super().model_dump(*args, **kwargs)
-        data['access_jti'] = str(data['access_jti'])
-        return data
+    def to_claims(self) -> Dict[str, Any]:
+        claims = BaseTokenPayload.to_claims(self)
+        claims['access_jti'] = str(self.access_jti)
+        return claims
+
+    def to_compact_claims(self) -> Dict[str, Any]:
+        claims = BaseTokenPayload.to_compact_claims(self)
+        claims['aj'] = _encode_uuid(self.access_jti)
+        return claims
+
+    @classmethod
+    def from_claims(cls, claims: Dict[str, Any]) -> 'RefreshTokenPayload':
+        try:
+            fields = cls._base_fields(claims)
+            access_jti = _decode_uuid(claims['aj']) if 't' in claims else UUID(claims['access_jti'])
+        except (KeyError, TypeError, ValueError) as e:
+            raise jwt.exceptions.InvalidTokenError(f'Malformed refresh token claims: {e!r}') from e
+        return cls(access_jti=access_jti, **fields)
+
+
+class UserSession(NamedTuple):
+    id: UUID
+    device_type: UserDeviceType
+    issued_at: datetime
+    expires_at: datetime
 
 
 class AuthService:
@@ -77,59 +193,87 @@ class AuthService:
         self._token_storage = token_storage
         self._password_service = password_service
 
-    async def create_token_pair(self, user_id: UUID, roles: List[Role]) -> tuple[str, str]:
+    async def create_token_pair(
+        self, user_id: UUID, roles: Sequence[str], user_agent: str | None = None
+    ) -> tuple[str, str]:
         logger.info('Creating token pair for user %s', user_id)
-        access_token_payload = AccessTokenPayload(user_id=user_id, roles=[r.name for r in roles])
-        refresh_token_payload = RefreshTokenPayload(user_id=user_id, access_jti=access_token_payload.jti)
+        # both tokens share iat, so the access token expiry can be derived from the refresh token on logout
+        issued_at = time.time()
+        access_token_payload = AccessTokenPayload(
+            user_id=user_id, roles=list(roles), iat=issued_at, exp=issued_at + _ACCESS_TOKEN_EXPIRE_SECONDS,
+            permissions=permission_mask(roles) if settings.token_permissions else None,
+        )
+        refresh_token_payload = RefreshTokenPayload(user_id=user_id, access_jti=access_token_payload.jti,
+                                                    iat=issued_at, exp=issued_at + _REFRESH_TOKEN_EXPIRE_SECONDS)
         access_token = self._create_token(access_token_payload)
         refresh_token = self._create_token(refresh_token_payload)
-        await self._token_storage.save_refresh_jti(refresh_token_payload.jti, _REFRESH_TOKEN_EXPIRE_SECONDS)
+        await self._token_storage.save_session(
+            user_id,
+            refresh_token_payload.jti,
+            access_token_payload.jti,
+            issued_at=refresh_token_payload.iat,
+            expires_at=refresh_token_payload.exp,
+            device_type=self._get_user_device_type(user_agent),
+        )
         return access_token, refresh_token
 
     def verify_password(self, user_email: str, plain_password: str, hashed_password: str) -> bool:
         logger.info('Verifying password for user with email %s', user_email)
         return self._password_service.verify_password(user_email, plain_password, hashed_password)
 
-    async def is_access_token_valid(self, access_token: str) -> bool:
+    async def verify_access_token(self, access_token: str) -> AccessTokenPayload | None:
         logger.info('Checking if access token is valid')
         try:
             payload = self._decode_access_token(access_token)
-        except (jwt.exceptions.InvalidTokenError, ValidationError) as e:
+        except jwt.exceptions.InvalidTokenError as e:
             logger.info('Access token is invalid: %s', e)
-            return False
+            return None
         if payload.type != TokenType.ACCESS:
             logger.info('Access token is not of type access')
-            return False
-        return not await self._token_storage.check_access_token_revoked(payload.jti)
+            return None
+        if await self._token_storage.check_access_token_revoked(payload.jti, payload.exp):
+            logger.info('Access token with jti %s is revoked', payload.jti)
+            return None
+        return payload
 
-    async def check_is_valid_and_remove_refresh_token(self, refresh_token: str) -> bool:
+    async def verify_and_remove_refresh_token(self, refresh_token: str) -> RefreshTokenPayload | None:
         logger.info('Checking if refresh token is valid and remove')
         try:
             payload = self._decode_refresh_token(refresh_token)
-        except (jwt.exceptions.InvalidTokenError, ValidationError) as e:
+        except jwt.exceptions.InvalidTokenError as e:
             logger.info('Refresh token is invalid: %s', e)
-            return False
+            return None
         if payload.type != TokenType.REFRESH:
             logger.info('Refresh token is not of type refresh')
-            return False
-        return await self._token_storage.check_refresh_token_exists(payload.jti)
+            return None
+        if not await self._token_storage.check_refresh_token_exists(payload.user_id, payload.jti):
+            return None
+        return payload
 
-    async def logout(self, refresh_token: str) -> None:
-        payload = self._decode_refresh_token(refresh_token)
+    async def logout(self, payload: RefreshTokenPayload) -> None:
         logger.info('Revoking refresh token with jti %s and access token with jti %s', payload.jti, payload.access_jti)
-        await self._token_storage.remove_refresh_jti(payload.jti)
+        await self._token_storage.remove_refresh_jti(payload.user_id, payload.jti)
         # access token is issued at the same time as refresh token
-        access_token_ttl = int(payload.iat + _ACCESS_TOKEN_EXPIRE_SECONDS - time.time())
-        if access_token_ttl > 0:
-            await self._token_storage.save_revoked_access_jti(payload.access_jti, access_token_ttl)
-
-    def get_user_id_from_access_token(self, token: str) -> UUID:
-        payload = self._decode_access_token(token)
-        return payload.user_id
-
-    def get_user_id_from_refresh_token(self, token: str) -> UUID:
-        payload = self._decode_refresh_token(token)
-        return payload.user_id
+        access_token_expires_at = payload.iat + _ACCESS_TOKEN_EXPIRE_SECONDS
+        if access_token_expires_at > time.time():
+            await self._token_storage.save_revoked_access_jti(payload.access_jti, access_token_expires_at)
+
+    async def get_sessions(self, user_id: UUID) -> List[UserSession]:
+        logger.info('Getting sessions of user %s', user_id)
+        sessions = await self._token_storage.get_sessions(user_id)
+        return sorted(
+            (UserSession(id=UUID(jti),
+                         device_type=UserDeviceType(session['device_type']),
+                         issued_at=datetime.utcfromtimestamp(session['iat']),
+                         expires_at=datetime.utcfromtimestamp(session['exp']))
+             for jti, session in sessions.items()),
+            key=lambda session: session.issued_at,
+            reverse=True,
+        )
+
+    async def revoke_sessions(self, user_id: UUID) -> None:
+        revoked = await self._token_storage.revoke_sessions(user_id, _ACCESS_TOKEN_EXPIRE_SECONDS)
+        logger.info('Revoked %s sessions of user %s', revoked, user_id)
 
     async def get_history(self, user_id: UUID) -> List[UserLogin]:
         logger.info('Getting auth history for user %s', user_id)
@@ -151,16 +295,20 @@ class AuthService:
         return user_login
 
     @staticmethod
-    def _create_token(payload: BaseTokenPayload) -> str:
-        return jwt.encode(payload.dict(), settings.private_key, algorithm=_ALGORITHM)
+    def _create_token(payload: BaseTokenPayload, claims_profile: str | None = None) -> str:
+        if (claims_profile or settings.token_claims_profile) == 'compact':
+            return jwt.encode(payload.to_compact_claims(), _signing_key(), algorithm=_ALGORITHM)
+        return jwt.encode(payload.to_claims(), _signing_key(), algorithm=_ALGORITHM)
 
     @staticmethod
     def _decode_access_token(token: str) -> AccessTokenPayload:
-        return AccessTokenPayload(**jwt.decode(token, settings.public_key, algorithms=[_ALGORITHM]))
+        claims = jwt.decode(token, _verifying_key(), algorithms=[_ALGORITHM], options=_DECODE_OPTIONS)
+        return AccessTokenPayload.from_claims(claims)
 
     @staticmethod
     def _decode_refresh_token(token: str) -> RefreshTokenPayload:
-        return RefreshTokenPayload(**jwt.decode(token, settings.public_key, algorithms=[_ALGORITHM]))
+        claims = jwt.decode(token, _verifying_key(), algorithms=[_ALGORITHM], options=_DECODE_OPTIONS)
+        return RefreshTokenPayload.from_claims(claims)
 
     @staticmethod
     def _get_user_device_type(user_agent: str | None):
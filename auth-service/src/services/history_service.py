@@ -0,0 +1,263 @@
+import asyncio
+import gzip
+import heapq
+import itertools
+import logging
+import shutil
+import zlib
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import IO, AsyncIterator, Iterator, List, Sequence, Tuple
+from uuid import UUID
+
+import orjson
+from sqlalchemy import Row, Select, delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from db.postgres import async_session
+from models.entity import LoginArchive, UserLogin
+
+# gzip container, so the output can be saved as a .gz file
+_GZIP_WBITS = 16 + zlib.MAX_WBITS
+_ARCHIVE_MONTH_FORMAT = '%Y-%m'
+_ARCHIVE_SUFFIX = '.jsonl.gz'
+_PARTIAL_SUFFIX = '.partial'
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryArchiveError(Exception):
+    pass
+
+
+class HistoryService:
+    """Exports login history as NDJSON, one login per line, oldest first, and moves old logins to archive files.
+
+    Archived logins are kept as gzipped JSON lines in a directory per month. The logins one archive run took from a
+    month go to a directory named after the end of its range, so the runs of a month sort by date. A run is split by
+    user into HISTORY_ARCHIVE_PARTITIONS files, the export of one user reads a single file of each run.
+
+    A run is recorded in login_archives in the transaction that deletes its logins, and the export reads only the
+    recorded runs, in the snapshot it reads the table in: a login is exported either from its run or from the table.
+    """
+
+    async def export(
+        self, user_id: UUID | None, since: datetime | None, until: datetime | None, compress: bool = False
+    ) -> AsyncIterator[bytes]:
+        logger.info('Exporting login history, user_id = %s, since = %s, until = %s', user_id, since, until)
+        since, until = _naive_utc(since), _naive_utc(until)
+        compressor = zlib.compressobj(wbits=_GZIP_WBITS) if compress else None
+        exported = 0
+        # a session of its own: the response is streamed after the request session is closed
+        async with async_session() as session:
+            await session.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+            archives = await _recorded_archives(session, since, until)
+            # every archived login is older than the logins left in the table
+            for chunks in (self._archived_chunks(archives, user_id, since, until),
+                           _stream_lines(session, _history_query(user_id, since, until))):
+                async for chunk in chunks:
+                    exported += chunk.count(b'\n')
+                    if compressor:
+                        chunk = compressor.compress(chunk)
+                    if chunk:
+                        yield chunk
+        if compressor:
+            yield compressor.flush()
+        logger.info('Exported %s logins', exported)
+
+    async def archive(self, before: datetime) -> int:
+        """Moves the logins older than before to archive files, a month per transaction, and returns their number."""
+        before = _naive_utc(before)
+        logger.info('Archiving logins before %s', before)
+        async with async_session() as session:
+            months = list(await session.scalars(
+                select(func.date_trunc('month', UserLogin.date).label('month'))
+                .where(UserLogin.date < before)
+                .group_by('month')
+                .order_by('month')
+            ))
+        archived = 0
+        for month in months:
+            archived += await self._archive_month(month, min(_next_month(month), before))
+        logger.info('Archived %s logins', archived)
+        return archived
+
+    @staticmethod
+    async def _archive_month(month: datetime, end: datetime) -> int:
+        path = _archive_path(month, end)
+        partial_path = path.with_name(f'{path.name}{_PARTIAL_SUFFIX}')
+        query = _history_query(None, None, end)
+        async with async_session() as session:
+            # the count, the copy and the delete see the same rows, logins inserted meanwhile are newer than end
+            await session.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+            if await session.get(LoginArchive, end):
+                raise HistoryArchiveError(f'logins before {end} are archived to {path} already')
+            # left by a run that failed before its commit, no export reads a run that is not recorded
+            shutil.rmtree(partial_path, ignore_errors=True)
+            shutil.rmtree(path, ignore_errors=True)
+            partial_path.mkdir(parents=True)
+            expected = await session.scalar(
+                select(func.count()).select_from(query.subquery())  # pylint: disable=not-callable
+            )
+            await _write_archive(session, query, partial_path)
+            written = await asyncio.to_thread(_count_lines, partial_path)
+            if written != expected:
+                shutil.rmtree(partial_path)
+                raise HistoryArchiveError(f'{path} holds {written} logins instead of {expected}')
+            partial_path.rename(path)
+            try:
+                deleted = (await session.execute(delete(UserLogin).where(UserLogin.date < end))).rowcount
+                if deleted != expected:
+                    raise HistoryArchiveError(f'{deleted} logins before {end} deleted instead of {expected}')
+                session.add(LoginArchive(end_date=end, month=month, logins=expected))
+                await session.commit()
+            except Exception:
+                # the logins stay in the table and the run is not recorded, its files would never be read
+                shutil.rmtree(path)
+                raise
+        logger.info('Archived %s logins before %s to %s', expected, end, path)
+        return expected
+
+    @staticmethod
+    async def _archived_chunks(
+        archives: Sequence[Row], user_id: UUID | None, since: datetime | None, until: datetime | None
+    ) -> AsyncIterator[bytes]:
+        for archive in archives:
+            lines = _read_archive(_archive_path(archive.month, archive.end_date), user_id, since, until)
+            # the file is read in a thread, a chunk at a time
+            while chunk := await asyncio.to_thread(_take, lines, settings.history_export_chunk_size):
+                yield b''.join(chunk)
+
+
+async def _recorded_archives(session: AsyncSession, since: datetime | None, until: datetime | None) -> Sequence[Row]:
+    query = select(LoginArchive.month, LoginArchive.end_date).order_by(LoginArchive.end_date)
+    # the logins of a run are older than its end and not older than its month
+    if since:
+        query = query.where(LoginArchive.end_date > since)
+    if until:
+        query = query.where(LoginArchive.month < until)
+    return (await session.execute(query)).all()
+
+
+def _history_query(user_id: UUID | None, since: datetime | None, until: datetime | None) -> Select:
+    query = (
+        select(UserLogin.id, UserLogin.user_id, UserLogin.user_agent, UserLogin.user_device_type, UserLogin.date)
+        .order_by(UserLogin.date, UserLogin.id)
+        .execution_options(yield_per=settings.history_export_chunk_size)
+    )
+    if user_id:
+        query = query.where(UserLogin.user_id == user_id)
+    if since:
+        query = query.where(UserLogin.date >= since)
+    if until:
+        query = query.where(UserLogin.date < until)
+    return query
+
+
+async def _stream_rows(session: AsyncSession, query: Select) -> AsyncIterator[Sequence[Row]]:
+    # a server side cursor keeps only one chunk of rows in memory
+    result = await session.stream(query)
+    async for rows in result.partitions():
+        yield rows
+
+
+async def _stream_lines(session: AsyncSession, query: Select) -> AsyncIterator[bytes]:
+    async for rows in _stream_rows(session, query):
+        yield b''.join(_ndjson_line(row) for row in rows)
+
+
+async def _write_archive(session: AsyncSession, query: Select, path: Path) -> None:
+    partitions = settings.history_archive_partitions
+    with ExitStack() as stack:
+        # empty partitions are written too, their number tells the reader how the run was split
+        archives = [stack.enter_context(gzip.open(path / _partition_name(partition), 'wb'))
+                    for partition in range(partitions)]
+        async for rows in _stream_rows(session, query):
+            lines: List[List[bytes]] = [[] for _ in range(partitions)]
+            for row in rows:
+                lines[_partition(row.user_id, partitions)].append(_ndjson_line(row))
+            await asyncio.to_thread(_write_partitions, archives, lines)
+
+
+def _write_partitions(archives: List[IO[bytes]], lines: List[List[bytes]]) -> None:
+    for archive, partition_lines in zip(archives, lines):
+        if partition_lines:
+            archive.write(b''.join(partition_lines))
+
+
+def _read_archive(
+    path: Path, user_id: UUID | None, since: datetime | None, until: datetime | None
+) -> Iterator[bytes]:
+    partition_paths = sorted(path.glob(f'*{_ARCHIVE_SUFFIX}'))
+    if user_id:
+        partition_paths = [path / _partition_name(_partition(user_id, len(partition_paths)))]
+    with ExitStack() as stack:
+        partitions = [_read_partition(stack.enter_context(gzip.open(partition_path, 'rb')), user_id, since, until)
+                      for partition_path in partition_paths]
+        # every partition is sorted by date, merging them keeps the export oldest first
+        for _, _, line in heapq.merge(*partitions):
+            yield line
+
+
+def _read_partition(
+    archive: IO[bytes], user_id: UUID | None, since: datetime | None, until: datetime | None
+) -> Iterator[Tuple[datetime, str, bytes]]:
+    user_id = str(user_id) if user_id else None
+    for line in archive:
+        # the other users of the partition are skipped without parsing their lines
+        if user_id and user_id.encode() not in line:
+            continue
+        login = orjson.loads(line)  # pylint: disable=no-member
+        if user_id and login['user_id'] != user_id:
+            continue
+        date = datetime.fromisoformat(login['date'])
+        if (since and date < since) or (until and date >= until):
+            continue
+        yield date, login['id'], line
+
+
+def _count_lines(path: Path) -> int:
+    count = 0
+    for partition_path in path.glob(f'*{_ARCHIVE_SUFFIX}'):
+        with gzip.open(partition_path, 'rb') as archive:
+            count += sum(1 for _ in archive)
+    return count
+
+
+def _archive_path(month: datetime, end: datetime) -> Path:
+    return Path(settings.history_archive_dir) / f'{month:{_ARCHIVE_MONTH_FORMAT}}' / f'{end:%Y%m%dT%H%M%S}'
+
+
+def _partition(user_id: UUID, partitions: int) -> int:
+    return user_id.int % partitions
+
+
+def _partition_name(partition: int) -> str:
+    return f'{partition:04d}{_ARCHIVE_SUFFIX}'
+
+
+def _take(lines: Iterator[bytes], size: int) -> List[bytes]:
+    return list(itertools.islice(lines, size))
+
+
+def _ndjson_line(row: Row) -> bytes:
+    # pylint: disable=no-member
+    return orjson.dumps({'id': row.id, 'user_id': row.user_id, 'user_agent': row.user_agent,
+                         'device_type': row.user_device_type, 'date': row.date}, option=orjson.OPT_APPEND_NEWLINE)
+
+
+def _naive_utc(value: datetime | None) -> datetime | None:
+    # login dates are stored as naive UTC
+    if value and value.tzinfo:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _next_month(month: datetime) -> datetime:
+    return month.replace(year=month.year + month.month // 12, month=month.month % 12 + 1, day=1)
+
+
+def get_history_service() -> HistoryService:
+    return HistoryService()
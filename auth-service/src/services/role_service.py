@@ -1,61 +1,72 @@
+import logging
 from uuid import uuid4, UUID
 from typing import List
 
 from fastapi import Depends
+from pydantic import TypeAdapter
 from sqlalchemy import select, insert, delete
 from sqlalchemy.ext.asyncio import AsyncSession
 from api.v1.schemas import RoleIn, RoleOut
 
 from models.entity import Role
 from db.postgres import get_session
+from storage.profile_cache import CachedBody, ProfileCache, get_profile_cache, role_catalog_resource
+
+_ROLES_ADAPTER = TypeAdapter(List[RoleOut])
+
+logger = logging.getLogger(__name__)
 
 
 class RoleService:
-    def __init__(self, async_session: AsyncSession):
+    def __init__(self, async_session: AsyncSession, profile_cache: ProfileCache | None = None):
         self.async_session = async_session
+        self._profile_cache = profile_cache
 
-    STAFF_ROLES = ['superuser', 'admin', 'service']
-    EXISTING_ROLES = STAFF_ROLES + ['user']
-
-    async def is_staff(self, user_roles: List[Role]) -> bool:
-        user_roles_names = [user_role.name for user_role in user_roles]
-        for staff_role in self.STAFF_ROLES:
-            if staff_role in user_roles_names and await self.is_role_exists_by_name(staff_role):
-                return True
-        return False
+    EXISTING_ROLES = ['superuser', 'admin', 'service', 'user']
 
     async def get(self) -> List[Role]:
         roles = await self.async_session.execute(select(Role))
         roles = roles.scalars().all()
         return roles
 
+    async def get_catalog_etag(self) -> str | None:
+        return await self._profile_cache.etag(role_catalog_resource()) if self._profile_cache else None
+
+    async def get_serialized(self) -> CachedBody:
+        """Returns all roles serialized as a list of RoleOut, from the cache if they are there."""
+        logger.info('Getting serialized roles')
+        if self._profile_cache:
+            return await self._profile_cache.get_or_load(role_catalog_resource(), self._load_serialized)
+        return CachedBody(None, await self._load_serialized())
+
     async def is_role_exists_by_name(self, new_role_name: str) -> bool:
         role = await self.async_session.execute(select(Role).where(Role.name == new_role_name))
         role = role.scalars().all()
         return bool(role)
 
-    async def is_role_exists_by_id(self, role_id: UUID) -> bool:
-        role = await self.async_session.execute(select(Role).where(Role.id == role_id))
-        role = role.scalars().all()
-        if role:
-            return True
-        return False
-
     async def create(self, new_role: RoleIn) -> RoleOut:
         role_id = uuid4()
         await self.async_session.execute(insert(Role).values(id=role_id, name=new_role.name))
         await self.async_session.commit()
+        await self._invalidate_catalog()
         return RoleOut(id=role_id, name=new_role.name)
 
     async def delete(self, role_id: UUID):
         await self.async_session.execute(delete(Role).where(Role.id == role_id))
         await self.async_session.commit()
+        # the role lists of users are cached with the catalog version, they drop the deleted role too
+        await self._invalidate_catalog()
+
+    async def _load_serialized(self) -> bytes:
+        return _ROLES_ADAPTER.dump_json([RoleOut.model_validate(role) for role in await self.get()])
 
-    async def get_role_by_id(self, role_id: UUID) -> Role:
-        return await self.async_session.scalar(select(Role).where(Role.id == role_id))
+    async def _invalidate_catalog(self) -> None:
+        if self._profile_cache:
+            await self._profile_cache.invalidate(role_catalog_resource())
 
 
 def get_role_service(
         async_session: AsyncSession = Depends(get_session),
+        profile_cache: ProfileCache = Depends(get_profile_cache),
 ) -> RoleService:
-    return RoleService(async_session)
+    return RoleService(async_session, profile_cache)
@@ -1,22 +1,33 @@
+import asyncio
 import logging
+from datetime import datetime
 from uuid import uuid4, UUID
-from typing import Annotated, List
+from typing import Annotated, AsyncIterator, Awaitable, Callable, List, NamedTuple, Sequence, Tuple
 from enum import Enum
 
-from aiohttp import ClientSession
+from async_timeout import timeout
 from fastapi import Depends
-from sqlalchemy import select, update, insert, delete
+from sqlalchemy import Select, select, update, delete, exists, func, values, column, tuple_, literal
 from sqlalchemy.orm import joinedload
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID, insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter
 
-from db.postgres import get_session
-from http_client import get_session as get_http_session
+from api.v1.schemas import RoleOut, UserOut
+from db.postgres import async_session, get_session
+from http_client import ProviderClient, ProviderUnavailableError, get_provider_client
 from core.config import settings
 from models.entity import User, ProviderUser, Role, user_role
 from services.password_service import PasswordService, get_password_service
+from storage.email_filter import EmailFilter, EmailFilterStats, get_email_filter
+from storage.profile_cache import (
+    CachedBody, CacheResource, ProfileCache, get_profile_cache, user_profile_resource, user_roles_resource
+)
 
 
+_EMAIL_BATCH_SIZE = 10000
+_ROLES_ADAPTER = TypeAdapter(List[RoleOut])
+
 logger = logging.getLogger(__name__)
 
 
@@ -24,39 +35,112 @@ class UserProvider(str, Enum):
     YANDEX = 'yandex'
 
 
+class UserAuthInfo(NamedTuple):
+    id: UUID
+    hashed_password: str
+    roles: Tuple[str, ...]
+
+
+class RoleAssignment(NamedTuple):
+    id: UUID
+    name: str
+    applied: bool
+
+
 class UserService:
     def __init__(
-        self, db_session: AsyncSession, password_service: PasswordService, http_session: ClientSession
+        self,
+        db_session: AsyncSession,
+        password_service: PasswordService,
+        provider_client: ProviderClient,
+        email_filter: EmailFilter | None = None,
+        profile_cache: ProfileCache | None = None,
     ) -> None:
         self._db_session = db_session
         self._password_service = password_service
-        self._http_session = http_session
+        self._provider_client = provider_client
+        self._email_filter = email_filter
+        self._profile_cache = profile_cache
 
     async def get_by_id(self, user_id: UUID) -> User | None:
         logger.info('Getting user by id: %s', user_id)
         return await self._db_session.scalar(select(User).where(User.id == user_id).options(joinedload(User.roles)))
 
-    async def get_by_email(self, email: str) -> User | None:
-        logger.info('Getting user by email: %s', email)
-        return await self._db_session.scalar(select(User).where(User.email == email).options(joinedload(User.roles)))
+    async def get_profile_etag(self, user_id: UUID) -> str | None:
+        return await self._get_etag(user_profile_resource(user_id))
+
+    async def get_profile(self, user_id: UUID) -> CachedBody | None:
+        """Returns the user serialized as UserOut, from the cache if it is there."""
+        logger.info('Getting user profile: %s', user_id)
+        return await self._get_cached(user_profile_resource(user_id), lambda: self._load_profile(user_id))
 
-    async def create(self, email: str, password: str) -> User:
+    async def search(
+        self, email: str | None, role: str | None, after: Tuple[datetime, UUID] | None, limit: int
+    ) -> List[User]:
+        logger.info('Searching users, email = %s, role = %s, after = %s', email, role, after)
+        query = select(User).order_by(User.created, User.id).limit(limit)
+        if email:
+            query = query.where(User.email.ilike(f'%{_escape_like(email)}%', escape='/'))
+        if role:
+            query = query.where(
+                select(user_role.c.user_id)
+                .join(Role, Role.id == user_role.c.role_id)
+                .where(user_role.c.user_id == User.id, Role.name == role)
+                .exists()
+            )
+        if after:
+            query = query.where(tuple_(User.created, User.id) > tuple_(*after))
+        return list(await self._db_session.scalars(query))
+
+    async def get_auth_info_by_id(self, user_id: UUID) -> UserAuthInfo | None:
+        logger.info('Getting user auth info by id: %s', user_id)
+        return await self._fetch_auth_info(_auth_info_query().where(User.id == user_id))
+
+    async def get_auth_info_by_email(self, email: str) -> UserAuthInfo | None:
+        logger.info('Getting user auth info by email: %s', email)
+        if self._email_filter and not await self._email_filter.might_contain(email):
+            logger.info('Email %s is not in the email filter', email)
+            return None
+        return await self._fetch_auth_info(_auth_info_query().where(User.email == email))
+
+    async def create(self, email: str, password: str) -> UUID | None:
         logger.info('Creating user with email: %s', email)
+        # a taken email is turned down before the password hash, the insert below still settles concurrent signups
+        if await self._is_email_taken(email):
+            logger.info('User with email %s already exists', email)
+            return None
         hashed_password = self._password_service.get_password_hash(email, password)
-        user = User(id=uuid4(), email=email, hashed_password=hashed_password)
-        self._db_session.add(user)
+        user_id = await self._db_session.scalar(
+            pg_insert(User)
+            .values(id=uuid4(), email=email, hashed_password=hashed_password)
+            .on_conflict_do_nothing(index_elements=[User.email])
+            .returning(User.id)
+        )
         await self._db_session.commit()
-        return user
+        if user_id is None:
+            logger.info('User with email %s already exists', email)
+        elif self._email_filter:
+            await self._email_filter.add(email)
+        return user_id
 
-    async def get_or_create_from_provider(self, code: str, provider: UserProvider) -> User:
+    async def _is_email_taken(self, email: str) -> bool:
+        # the filter rules out most new emails without a query
+        if self._email_filter and not await self._email_filter.might_contain(email):
+            return False
+        return await self._db_session.scalar(select(exists().where(User.email == email)))
+
+    async def get_or_create_from_provider(self, code: str, provider: UserProvider) -> UserAuthInfo:
         logger.info('Getting or creating user from provider: %s', provider)
         provided_user_details = await self._get_provided_user_details(code, provider)
-        provider_user = await self._db_session.scalar(select(ProviderUser)
-                                                      .where(ProviderUser.id == provided_user_details.id)
-                                                      .where(ProviderUser.provider == provider))
-        if provider_user:
+        user_auth_info = await self._fetch_auth_info(
+            _auth_info_query()
+            .join(ProviderUser, ProviderUser.user_id == User.id)
+            .where(ProviderUser.id == provided_user_details.id)
+            .where(ProviderUser.provider == provider)
+        )
+        if user_auth_info:
             logger.info('User from provider %s with id %s found', provider, provided_user_details.id)
-            return await self.get_by_id(provider_user.user_id)
+            return user_auth_info
         logger.info('User from provider %s with id %s not found, creating new user',
                     provider, provided_user_details.id)
         hashed_password = self._password_service.get_password_hash(provided_user_details.email, str(uuid4()))
@@ -65,9 +149,24 @@ class UserService:
         self._db_session.add(user)
         self._db_session.add(provider_user)
         await self._db_session.commit()
-        return user
+        if self._email_filter:
+            await self._email_filter.add(user.email)
+        return UserAuthInfo(id=user.id, hashed_password=hashed_password, roles=())
+
+    async def get_roles_etag(self, user_id: UUID) -> str | None:
+        return await self._get_etag(user_roles_resource(user_id))
+
+    async def get_serialized_roles(self, user_id: UUID) -> CachedBody:
+        """Returns the roles of the user serialized as a list of RoleOut, from the cache if they are there."""
+        logger.info('Getting serialized user roles, user_id = %s', user_id)
+        return await self._get_cached(user_roles_resource(user_id), lambda: self._load_roles(user_id),
+                                      settings.role_list_cache_ttl_seconds)
 
     async def get_roles(self, user_id: UUID) -> List[Role]:
+        roles = _ROLES_ADAPTER.validate_json((await self.get_serialized_roles(user_id)).body)
+        return [Role(id=role.id, name=role.name) for role in roles]
+
+    async def _load_roles(self, user_id: UUID) -> bytes:
         logger.info('Getting user roles, user_id = %s', user_id)
         user_roles_names = await self._db_session.execute(
             select(Role.id, Role.name)
@@ -77,8 +176,7 @@ class UserService:
             )
             .where(user_role.c.user_id == user_id)
         )
-        user_roles_names = [Role(id=row[0], name=row[1]) for row in user_roles_names]
-        return user_roles_names
+        return _ROLES_ADAPTER.dump_json([RoleOut(id=row[0], name=row[1]) for row in user_roles_names])
 
     async def update(self, user_id: UUID, email: str, password: str) -> User:
         logger.info('Updating user with id = %s', user_id)
@@ -90,42 +188,126 @@ class UserService:
             .returning(User)
         )
         await self._db_session.commit()
+        if self._email_filter:
+            await self._email_filter.add(email)
+        await self._invalidate(user_profile_resource(user_id))
         return updated_user.scalar()
 
-    async def has_role(self, user_id: UUID, role_id: UUID):
-        logger.info('Checking if user with id = %s have role with id = %s', user_id, role_id)
-        return await self._db_session.scalar(
-            select(user_role)
-            .where(user_role.c.user_id == user_id, user_role.c.role_id == role_id))
-
-    async def add_role_to_user(self, user_id: UUID, role_id: UUID) -> UUID:
+    async def add_role_to_user(self, user_id: UUID, role_id: UUID) -> RoleAssignment | None:
         logger.info('Adding role with id = %s to user with id = %s', role_id, user_id)
-        role_id = await self._db_session.execute(
-            insert(user_role)
-            .values(user_id=user_id, role_id=role_id)
-            .returning(user_role.c.role_id))
+        inserted = (
+            pg_insert(user_role)
+            .from_select(['user_id', 'role_id'], select(literal(user_id, PG_UUID(as_uuid=True)), Role.id)
+                                                 .where(Role.id == role_id))
+            .on_conflict_do_nothing()
+            .returning(user_role.c.role_id)
+            .cte('inserted')
+        )
+        assignment = (await self._db_session.execute(
+            select(Role.id, Role.name, inserted.c.role_id.is_not(None).label('applied'))
+            .outerjoin(inserted, inserted.c.role_id == Role.id)
+            .where(Role.id == role_id)
+        )).one_or_none()
         await self._db_session.commit()
-        role_id = UUID(str(role_id.scalar()))
-        return role_id
+        if assignment and assignment.applied:
+            await self._invalidate(user_roles_resource(user_id))
+        return RoleAssignment(*assignment) if assignment else None
 
-    async def delete_role_from_user(self, user_id: UUID, role_id: UUID) -> None:
+    async def delete_role_from_user(self, user_id: UUID, role_id: UUID) -> bool:
         logger.info('Deleting role with id = %s from user with id = %s', role_id, user_id)
-        await self._db_session.execute(
+        deleted = (
             delete(user_role)
             .where(user_role.c.user_id == user_id, user_role.c.role_id == role_id)
+            .returning(user_role.c.role_id)
+            .cte('deleted')
         )
+        role_exists, deleted_count = (await self._db_session.execute(
+            select(
+                select(Role.id).where(Role.id == role_id).exists(),
+                select(func.count()).select_from(deleted).scalar_subquery(),  # pylint: disable=not-callable
+            )
+        )).one()
         await self._db_session.commit()
+        if deleted_count:
+            await self._invalidate(user_roles_resource(user_id))
+        return role_exists
+
+    async def add_roles_to_users(self, user_roles: Sequence[Tuple[UUID, UUID]]) -> List[Tuple[UUID, UUID]]:
+        logger.info('Adding %s roles to users', len(user_roles))
+        requested = values(
+            column('user_id', PG_UUID(as_uuid=True)), column('role_id', PG_UUID(as_uuid=True)), name='requested'
+        ).data(list(dict.fromkeys(user_roles)))
+        # pairs with unknown users or roles are dropped by the joins, already assigned ones by ON CONFLICT
+        applied = await self._db_session.execute(
+            pg_insert(user_role)
+            .from_select(
+                ['user_id', 'role_id'],
+                select(requested.c.user_id, requested.c.role_id)
+                .join(User, User.id == requested.c.user_id)
+                .join(Role, Role.id == requested.c.role_id)
+            )
+            .on_conflict_do_nothing()
+            .returning(user_role.c.user_id, user_role.c.role_id)
+        )
+        applied = [(row.user_id, row.role_id) for row in applied]
+        await self._db_session.commit()
+        await self._invalidate(*{user_roles_resource(user_id) for user_id, _ in applied})
+        return applied
+
+    async def delete_roles_from_users(self, user_roles: Sequence[Tuple[UUID, UUID]]) -> List[Tuple[UUID, UUID]]:
+        logger.info('Deleting %s roles from users', len(user_roles))
+        deleted = await self._db_session.execute(
+            delete(user_role)
+            .where(tuple_(user_role.c.user_id, user_role.c.role_id).in_(list(dict.fromkeys(user_roles))))
+            .returning(user_role.c.user_id, user_role.c.role_id)
+        )
+        deleted = [(row.user_id, row.role_id) for row in deleted]
+        await self._db_session.commit()
+        await self._invalidate(*{user_roles_resource(user_id) for user_id, _ in deleted})
+        return deleted
+
+    async def _load_profile(self, user_id: UUID) -> bytes | None:
+        user = await self.get_by_id(user_id)
+        return UserOut.model_validate(user).model_dump_json().encode() if user else None
+
+    async def _get_etag(self, resource: CacheResource) -> str | None:
+        return await self._profile_cache.etag(resource) if self._profile_cache else None
+
+    async def _get_cached(
+        self, resource: CacheResource, load: Callable[[], Awaitable[bytes | None]], ttl_seconds: int | None = None
+    ) -> CachedBody | None:
+        if self._profile_cache:
+            return await self._profile_cache.get_or_load(resource, load, ttl_seconds)
+        body = await load()
+        return CachedBody(None, body) if body is not None else None
+
+    async def _invalidate(self, *resources: CacheResource) -> None:
+        if self._profile_cache and resources:
+            await self._profile_cache.invalidate(*resources)
+
+    async def _fetch_auth_info(self, query: Select) -> UserAuthInfo | None:
+        row = (await self._db_session.execute(query)).one_or_none()
+        if row is None:
+            return None
+        return UserAuthInfo(id=row.id, hashed_password=row.hashed_password, roles=tuple(row.roles))
 
     async def _get_provided_user_details(
         self, code: str, provider: UserProvider  # pylint: disable=unused-argument
     ) -> '_ProvidedUserDetails':
-        token = await self._get_yandex_user_data_access_token(code)
-        return await self._get_yandex_user(token)
+        try:
+            async with timeout(settings.provider_http_deadline):
+                token = await self._get_yandex_user_data_access_token(code)
+                return await self._get_yandex_user(token)
+        except asyncio.TimeoutError as e:
+            raise ProviderUnavailableError(f'Provider {provider} did not respond in time') from e
 
     async def _get_yandex_user_data_access_token(self, code: str) -> str:
         logger.info('Getting user data access token')
-        async with self._http_session.post(
-            'https://oauth.yandex.ru/token',
+        # the authorization code is single-use, so the exchange is retried only if it was never sent
+        body = await self._provider_client.request_json(
+            'POST',
+            f'{settings.yandex_oauth_url}/token',
+            idempotent=False,
             data={
                 'grant_type': 'authorization_code',
                 'code': code,
@@ -133,27 +315,59 @@ class UserService:
                 'client_secret': settings.yandex_client_secret,
             },
             headers={'Content-Type': 'application/x-www-form-urlencoded'},
-            raise_for_status=True
-        ) as response:
-            return (await response.json())['access_token']
-
+        )
+        return body['access_token']
 
     async def _get_yandex_user(self, token: str) -> '_ProvidedUserDetails':
         logger.info('Getting user info by token')
-        async with self._http_session.get(
-            'https://login.yandex.ru/info',
+        body = await self._provider_client.request_json(
+            'GET',
+            f'{settings.yandex_login_url}/info',
             headers={'Authorization': f'OAuth {token}'},
-        ) as response:
-            body = await response.json()
-            return _ProvidedUserDetails(id=body['id'], email=body['default_email'])
+        )
+        return _ProvidedUserDetails(id=body['id'], email=body['default_email'])
 
 
 def get_user_service(
     db_session: Annotated[AsyncSession, Depends(get_session)],
     password_service: Annotated[PasswordService, Depends(get_password_service)],
-    http_session: Annotated[ClientSession, Depends(get_http_session)],
+    provider_client: Annotated[ProviderClient, Depends(get_provider_client)],
+    email_filter: Annotated[EmailFilter | None, Depends(get_email_filter)],
+    profile_cache: Annotated[ProfileCache, Depends(get_profile_cache)],
 ) -> UserService:
-    return UserService(db_session, password_service, http_session)
+    return UserService(db_session, password_service, provider_client, email_filter, profile_cache)
+
+
+async def rebuild_email_filter(email_filter: EmailFilter) -> EmailFilterStats | None:
+    logger.info('Rebuilding email filter from the users table')
+    return await email_filter.rebuild(_stream_emails)
+
+
+async def _stream_emails() -> AsyncIterator[str]:
+    # a server side cursor, the emails are not loaded into memory all at once
+    async with async_session() as session:
+        async for email in await session.stream_scalars(
+            select(User.email).execution_options(yield_per=_EMAIL_BATCH_SIZE)
+        ):
+            yield email
+
+
+def _escape_like(value: str) -> str:
+    return value.replace('/', '//').replace('%', '/%').replace('_', '/_')
+
+
+def _auth_info_query() -> Select:
+    # one row per user with role names aggregated, no ORM entities or relationship loading
+    return (
+        select(
+            User.id,
+            User.hashed_password,
+            func.array_remove(func.array_agg(Role.name), None).label('roles'),  # pylint: disable=not-callable
+        )
+        .outerjoin(user_role, user_role.c.user_id == User.id)
+        .outerjoin(Role, Role.id == user_role.c.role_id)
+        .group_by(User.id)
+    )
 
 
 class _ProvidedUserDetails(BaseModel):
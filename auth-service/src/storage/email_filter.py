@@ -0,0 +1,172 @@
+import logging
+import math
+from functools import lru_cache
+from hashlib import blake2b
+from typing import Annotated, AsyncIterator, Callable, Iterable, List, NamedTuple
+
+from fastapi import Depends
+from opentelemetry import metrics
+from redis import RedisError
+from redis.asyncio import Redis, RedisCluster
+
+from core.config import settings
+from db.redis import get_redis
+
+# the hash tag keeps the filter, its next build and the lock on one cluster slot, BITOP and the add script need it
+_KEY_PREFIX = '{email_filter}'
+_LOCK_KEY = f'{_KEY_PREFIX}:lock'
+_LOCK_SECONDS = 10 * 60
+
+# sets the bits in the filter and in a build in progress, a filter that does not exist yet is not created
+_ADD_SCRIPT = """
+for _, key in ipairs(KEYS) do
+    if redis.call('EXISTS', key) == 1 then
+        for i = 1, #ARGV do
+            redis.call('SETBIT', key, ARGV[i], 1)
+        end
+    end
+end
+"""
+
+logger = logging.getLogger(__name__)
+meter = metrics.get_meter(__name__)
+
+_checks = meter.create_counter(
+    'email_filter.checks', description='Email lookups checked against the known-email filter, by result'
+)
+
+
+class EmailFilterStats(NamedTuple):
+    items: int
+    size_bytes: int
+    false_positive_rate: float
+
+
+class EmailFilter:
+    """Bloom filter of registered emails kept in Redis.
+
+    An email the filter does not contain is certainly not registered, an email it contains may be. The filter only
+    grows: changed emails stay in it until the next rebuild, which costs false positives and never a false negative.
+    """
+
+    def __init__(self, cache_storage: Redis | RedisCluster, capacity: int, error_rate: float) -> None:
+        self.cache_storage = cache_storage
+        self._size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self._hashes = max(1, round(self._size / capacity * math.log(2)))
+        # the key depends on the sizing, so a changed configuration starts with a new filter instead of a broken one
+        self._key = f'{_KEY_PREFIX}:{self._size}:{self._hashes}'
+        self._build_key = f'{self._key}:build'
+        self._scan_key = f'{self._key}:scan'
+        self._transaction = not isinstance(cache_storage, RedisCluster)
+
+    async def might_contain(self, email: str) -> bool:
+        # read from the primary, an email added by a signup must be visible to the login right after it
+        try:
+            async with self.cache_storage.pipeline(transaction=False) as pipe:
+                pipe.exists(self._key)
+                for position in self._positions(email):
+                    pipe.getbit(self._key, position)
+                exists, *bits = await pipe.execute()
+        except RedisError as e:
+            logger.warning('Failed to check email in filter, falling back to database: %s', e)
+            _checks.add(1, {'result': 'unavailable'})
+            return True
+        if not exists:
+            _checks.add(1, {'result': 'missing'})
+            return True
+        result = all(bits)
+        _checks.add(1, {'result': 'maybe' if result else 'absent'})
+        return result
+
+    async def add(self, email: str) -> None:
+        logger.info('Adding email %s to filter', email)
+        await self.add_many([email])
+
+    async def add_many(self, emails: Iterable[str]) -> None:
+        try:
+            async with self.cache_storage.pipeline(transaction=False) as pipe:
+                for email in emails:
+                    pipe.eval(_ADD_SCRIPT, 2, self._key, self._build_key, *self._positions(email))
+                await pipe.execute()
+        except RedisError as e:
+            logger.error('Failed to add emails to filter: %s', e)
+            # a filter without the email would reject its owner, without the filter every lookup goes to the database
+            try:
+                await self.cache_storage.delete(self._key)
+            except RedisError:
+                logger.error('Failed to drop email filter, it is stale until the next rebuild')
+
+    async def exists(self) -> bool:
+        return bool(await self.cache_storage.exists(self._key))
+
+    async def rebuild(self, load_emails: Callable[[], AsyncIterator[str]]) -> EmailFilterStats | None:
+        """Builds the filter from all emails and replaces the current one, or returns None if a build is running.
+
+        Emails are loaded after the build key exists, so a signup either reaches the build through add() or is
+        committed before the load starts.
+        """
+        logger.info('Rebuilding email filter, %s bits and %s hashes', self._size, self._hashes)
+        if not await self.cache_storage.set(_LOCK_KEY, 1, ex=_LOCK_SECONDS, nx=True):
+            logger.info('Email filter is being rebuilt by another process')
+            return None
+        try:
+            async with self.cache_storage.pipeline(transaction=self._transaction) as pipe:
+                pipe.delete(self._build_key)
+                pipe.setbit(self._build_key, self._size - 1, 0)
+                # a build abandoned by a failed process does not outlive its lock
+                pipe.expire(self._build_key, _LOCK_SECONDS)
+                await pipe.execute()
+
+            bitmap, items = bytearray((self._size + 7) // 8), 0
+            async for email in load_emails():
+                for position in self._positions(email):
+                    bitmap[position >> 3] |= 0x80 >> (position & 7)
+                items += 1
+
+            async with self.cache_storage.pipeline(transaction=self._transaction) as pipe:
+                pipe.set(self._scan_key, bytes(bitmap), ex=_LOCK_SECONDS)
+                pipe.bitop('OR', self._build_key, self._build_key, self._scan_key)
+                pipe.delete(self._scan_key)
+                pipe.rename(self._build_key, self._key)
+                pipe.persist(self._key)
+                await pipe.execute()
+        except RedisError as e:
+            logger.error('Failed to rebuild email filter: %s', e)
+            raise
+        finally:
+            await self.cache_storage.delete(_LOCK_KEY)
+
+        stats = EmailFilterStats(items, len(bitmap), self._false_positive_rate(items))
+        logger.info('Email filter rebuilt: %s emails, %s bytes, estimated false positive rate %.4f', *stats)
+        if items > settings.email_filter_capacity:
+            logger.warning('Email filter holds %s emails over its capacity of %s, increase EMAIL_FILTER_CAPACITY',
+                           items, settings.email_filter_capacity)
+        return stats
+
+    async def stats(self) -> EmailFilterStats | None:
+        """Estimates the number of emails and the false positive rate from the share of set bits."""
+        async with self.cache_storage.pipeline(transaction=False) as pipe:
+            pipe.strlen(self._key)
+            pipe.bitcount(self._key)
+            size_bytes, bits_set = await pipe.execute()
+        if not size_bytes:
+            return None
+        fill = bits_set / self._size
+        items = round(-self._size / self._hashes * math.log(1 - fill)) if fill < 1 else settings.email_filter_capacity
+        return EmailFilterStats(items, size_bytes, fill ** self._hashes)
+
+    def _false_positive_rate(self, items: int) -> float:
+        return (1 - math.exp(-self._hashes * items / self._size)) ** self._hashes
+
+    def _positions(self, email: str) -> List[int]:
+        # double hashing: k positions from the two halves of one digest
+        digest = blake2b(email.encode('utf-8'), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big') | 1
+        return [(first + i * second) % self._size for i in range(self._hashes)]
+
+
+@lru_cache()
+def get_email_filter(cache_storage: Annotated[Redis | RedisCluster, Depends(get_redis)]) -> EmailFilter | None:
+    if not settings.email_filter_enabled:
+        return None
+    return EmailFilter(cache_storage, settings.email_filter_capacity, settings.email_filter_error_rate)
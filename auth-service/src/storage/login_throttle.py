@@ -0,0 +1,107 @@
+import logging
+from functools import lru_cache
+from typing import Annotated
+
+from fastapi import Depends
+from opentelemetry import metrics
+from redis import RedisError
+from redis.asyncio import Redis, RedisCluster
+
+from core.config import settings
+from db.redis import get_redis
+
+_FAILURES_PREFIX = 'login_failures'
+_LOCKOUT_PREFIX = 'login_lockout'
+_EMAIL_SCOPE = 'email'
+_IP_SCOPE = 'ip'
+
+logger = logging.getLogger(__name__)
+meter = metrics.get_meter(__name__)
+
+_blocked_attempts = meter.create_counter(
+    'login.blocked', description='Login attempts rejected by a failed-login lockout before the password check'
+)
+
+
+class LoginThrottle:
+    """Failed login counters per email and per source address with exponentially growing lockouts.
+
+    Each failure over the limit locks the email or the address for twice as long as the previous one, up to the
+    configured maximum. Counters are forgotten after a window without failures.
+    """
+
+    def __init__(self, cache_storage: Redis | RedisCluster) -> None:
+        self.cache_storage = cache_storage
+        self._max_failures = {
+            _EMAIL_SCOPE: settings.login_email_max_failures,
+            _IP_SCOPE: settings.login_ip_max_failures,
+        }
+
+    async def get_lockout(self, email: str, ip: str) -> int:
+        """Returns the seconds left until the email and the address may try again, 0 if neither is locked."""
+        scopes = {_EMAIL_SCOPE: email, _IP_SCOPE: ip}
+        try:
+            async with self.cache_storage.pipeline(transaction=False) as pipe:
+                for scope, value in scopes.items():
+                    pipe.ttl(self._lockout_cache_key(scope, value))
+                ttls = dict(zip(scopes, await pipe.execute()))
+        except RedisError as e:
+            # the lockout only saves hashing work, logins go on without it
+            logger.warning('Failed to check login lockout: %s', e)
+            return 0
+        for scope, ttl in ttls.items():
+            if ttl > 0:
+                logger.info('Login attempt blocked by %s lockout for %s s', scope, ttl)
+                _blocked_attempts.add(1, {'scope': scope})
+        # a missing lockout has a negative ttl
+        return max(0, *ttls.values())
+
+    async def register_failure(self, ip: str, email: str | None = None) -> None:
+        """Counts a failed login, the email is passed only when it belongs to a user."""
+        scopes = {_IP_SCOPE: ip} if email is None else {_EMAIL_SCOPE: email, _IP_SCOPE: ip}
+        logger.info('Registering failed login for %s', scopes)
+        try:
+            async with self.cache_storage.pipeline(transaction=False) as pipe:
+                for scope, value in scopes.items():
+                    pipe.incr(self._failures_cache_key(scope, value))
+                    pipe.expire(self._failures_cache_key(scope, value), settings.login_failures_window_seconds)
+                failures = dict(zip(scopes, (await pipe.execute())[::2]))
+            lockouts = {scope: self._lockout_seconds(scope, count) for scope, count in failures.items()}
+            if any(lockouts.values()):
+                async with self.cache_storage.pipeline(transaction=False) as pipe:
+                    for scope, seconds in lockouts.items():
+                        if seconds:
+                            pipe.set(self._lockout_cache_key(scope, scopes[scope]), 1, ex=seconds)
+                    await pipe.execute()
+        except RedisError as e:
+            logger.warning('Failed to register failed login: %s', e)
+
+    async def reset(self, email: str) -> None:
+        # the address keeps its counter, a valid login of its own must not clear guesses at other accounts
+        logger.info('Resetting failed logins of %s', email)
+        try:
+            await self.cache_storage.delete(self._failures_cache_key(_EMAIL_SCOPE, email))
+        except RedisError as e:
+            logger.warning('Failed to reset failed logins of %s: %s', email, e)
+
+    def _lockout_seconds(self, scope: str, failures: int) -> int:
+        # the allowed failures themselves do not lock, the first one over the limit does
+        over_limit = failures - self._max_failures[scope]
+        if over_limit <= 0:
+            return 0
+        # the exponent is capped, counters of a long attack would make the power needlessly large
+        seconds = settings.login_lockout_seconds * 2 ** min(over_limit - 1, 32)
+        return min(seconds, settings.login_lockout_max_seconds)
+
+    @staticmethod
+    def _failures_cache_key(scope: str, value: str) -> str:
+        return f'{_FAILURES_PREFIX}:{scope}:{value}'
+
+    @staticmethod
+    def _lockout_cache_key(scope: str, value: str) -> str:
+        return f'{_LOCKOUT_PREFIX}:{scope}:{value}'
+
+
+@lru_cache()
+def get_login_throttle(cache_storage: Annotated[Redis | RedisCluster, Depends(get_redis)]) -> LoginThrottle:
+    return LoginThrottle(cache_storage)
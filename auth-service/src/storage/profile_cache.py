@@ -0,0 +1,141 @@
+import logging
+import secrets
+from functools import lru_cache
+from typing import Annotated, Awaitable, Callable, List, NamedTuple, Tuple
+from uuid import UUID
+
+from fastapi import Depends
+from opentelemetry import metrics
+from redis import RedisError
+from redis.asyncio import Redis, RedisCluster
+
+from core.config import settings
+from db.redis import get_redis
+
+_VERSION_PREFIX = 'profile_version'
+_BODY_PREFIX = 'profile_body'
+_ROLE_CATALOG_VERSION = 'roles'
+
+logger = logging.getLogger(__name__)
+meter = metrics.get_meter(__name__)
+
+_lookups = meter.create_counter(
+    'profile_cache.lookups', description='Cached user profile and role list reads, by result'
+)
+
+# a resource is named by its version keys, its body changes whenever one of them does
+CacheResource = Tuple[str, ...]
+
+
+class CachedBody(NamedTuple):
+    # None when the cache is unavailable, the body is then served without an ETag
+    etag: str | None
+    body: bytes
+
+
+def user_profile_resource(user_id: UUID) -> CacheResource:
+    return (f'user:{user_id}',)
+
+
+def user_roles_resource(user_id: UUID) -> CacheResource:
+    # the role catalog version is a part of every role list, so deleting a role invalidates the lists holding it
+    return (_ROLE_CATALOG_VERSION, f'user_roles:{user_id}')
+
+
+def role_catalog_resource() -> CacheResource:
+    return (_ROLE_CATALOG_VERSION,)
+
+
+class ProfileCache:
+    """Read-through cache of serialized user profiles and role lists with random version tokens as ETags.
+
+    A resource is current while its version keys exist. Invalidation deletes them and the next read creates new
+    random tokens, so a body loaded before a change is stored under a version nobody asks for again.
+    """
+
+    def __init__(self, cache_storage: Redis | RedisCluster) -> None:
+        self.cache_storage = cache_storage
+
+    async def etag(self, resource: CacheResource) -> str | None:
+        """Returns the ETag of the cached resource, None if it has no current version."""
+        try:
+            async with self.cache_storage.pipeline(transaction=False) as pipe:
+                for version_key in resource:
+                    pipe.get(self._version_cache_key(version_key))
+                versions = await pipe.execute()
+        except RedisError as e:
+            logger.warning('Failed to get version of %s: %s', resource, e)
+            return None
+        if not all(versions):
+            return None
+        return self._etag([version.decode() for version in versions])
+
+    async def get_or_load(
+        self, resource: CacheResource, load: Callable[[], Awaitable[bytes | None]], ttl_seconds: int | None = None
+    ) -> CachedBody | None:
+        """Returns the cached body, loading and caching it on a miss; a resource loaded as None is not cached.
+
+        The body is kept for ttl_seconds, PROFILE_CACHE_TTL_SECONDS if not set; its version may outlive it, an expired
+        body is loaded again under the same ETag.
+        """
+        try:
+            versions = await self._current_versions(resource)
+            body = await self.cache_storage.get(self._body_cache_key(resource, versions))
+        except RedisError as e:
+            logger.warning('Failed to read %s from cache, loading it from the database: %s', resource, e)
+            _lookups.add(1, {'result': 'unavailable'})
+            body = await load()
+            return CachedBody(None, body) if body is not None else None
+        if body is not None:
+            _lookups.add(1, {'result': 'hit'})
+            return CachedBody(self._etag(versions), body)
+
+        _lookups.add(1, {'result': 'miss'})
+        # the versions were read before the load, a change committed meanwhile has already replaced them
+        body = await load()
+        if body is None:
+            return None
+        try:
+            await self.cache_storage.set(self._body_cache_key(resource, versions), body,
+                                         ex=ttl_seconds or settings.profile_cache_ttl_seconds)
+        except RedisError as e:
+            logger.warning('Failed to cache %s: %s', resource, e)
+        return CachedBody(self._etag(versions), body)
+
+    async def invalidate(self, *resources: CacheResource) -> None:
+        version_keys = {version_key for resource in resources for version_key in resource}
+        logger.info('Invalidating cached %s', ', '.join(sorted(version_keys)))
+        try:
+            async with self.cache_storage.pipeline(transaction=False) as pipe:
+                for version_key in version_keys:
+                    pipe.delete(self._version_cache_key(version_key))
+                await pipe.execute()
+        except RedisError as e:
+            # the stale body is served until its version expires
+            logger.error('Failed to invalidate cached %s: %s', ', '.join(sorted(version_keys)), e)
+
+    async def _current_versions(self, resource: CacheResource) -> List[str]:
+        async with self.cache_storage.pipeline(transaction=False) as pipe:
+            for version_key in resource:
+                # a missing version gets a new token, concurrent readers agree on whichever was set first
+                pipe.set(self._version_cache_key(version_key), secrets.token_hex(8),
+                         ex=settings.profile_cache_ttl_seconds, nx=True)
+                pipe.get(self._version_cache_key(version_key))
+            return [version.decode() for version in (await pipe.execute())[1::2]]
+
+    @staticmethod
+    def _etag(versions: List[str]) -> str:
+        return f'"{".".join(versions)}"'
+
+    @staticmethod
+    def _version_cache_key(version_key: str) -> str:
+        return f'{_VERSION_PREFIX}:{version_key}'
+
+    @staticmethod
+    def _body_cache_key(resource: CacheResource, versions: List[str]) -> str:
+        return f'{_BODY_PREFIX}:{resource[-1]}:{".".join(versions)}'
+
+
+@lru_cache()
+def get_profile_cache(cache_storage: Annotated[Redis | RedisCluster, Depends(get_redis)]) -> ProfileCache:
+    return ProfileCache(cache_storage)
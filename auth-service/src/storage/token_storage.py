@@ -1,67 +1,224 @@
+import json
 import logging
+import time
 from functools import lru_cache
-from typing import Annotated
+from enum import Enum
+from typing import Annotated, Any, Dict, List
 from uuid import UUID
 
 from fastapi import Depends
 from redis import RedisError
-from redis.asyncio import Redis
+from redis.asyncio import Redis, RedisCluster
+from redis.asyncio.client import Pipeline
 
-from db.redis import get_redis
+from core.config import settings
+from db.redis import get_redis, get_redis_replica
 
 _REFRESH_PREFIX = 'refresh'
 _ACCESS_PREFIX = 'access'
+_SESSIONS_PREFIX = 'sessions'
 _TOKEN_KEY = 'token_key'
 
+# compact layout: binary jtis, a one byte value and revoked access jtis grouped into sets by expiry hour,
+# so most of the per-key overhead is paid once per bucket instead of once per token
+_COMPACT_REFRESH_PREFIX = b'r:'
+_COMPACT_REVOKED_PREFIX = 'ar'
+_COMPACT_VALUE = b'\x01'
+_REVOKED_BUCKET_SECONDS = 60 * 60
+
+# reads the sessions and removes them in one step, so a session saved meanwhile is either revoked or left intact;
+# the keys it writes mirror the cache key helpers of TokenStorage
+_REVOKE_SESSIONS_SCRIPT = """
+local function uuid_bytes(uuid)
+    return (string.gsub(string.gsub(uuid, '-', ''), '..', function(h) return string.char(tonumber(h, 16)) end))
+end
+local now = tonumber(ARGV[1])
+local access_token_ttl = tonumber(ARGV[2])
+local write_compact = ARGV[3] == '1'
+local read_legacy = ARGV[4] == '1'
+local bucket_seconds = tonumber(ARGV[5])
+local sessions = redis.call('HGETALL', KEYS[1])
+for i = 1, #sessions, 2 do
+    local jti = sessions[i]
+    local session = cjson.decode(sessions[i + 1])
+    if write_compact then
+        redis.call('DEL', 'r:' .. uuid_bytes(jti))
+    end
+    if read_legacy then
+        redis.call('DEL', 'refresh:' .. jti)
+    end
+    local access_expires_at = session['iat'] + access_token_ttl
+    if access_expires_at > now then
+        if write_compact then
+            local bucket = math.floor(access_expires_at / bucket_seconds)
+            redis.call('SADD', 'ar:' .. bucket, uuid_bytes(session['access_jti']))
+            redis.call('EXPIREAT', 'ar:' .. bucket, (bucket + 1) * bucket_seconds)
+        else
+            local ttl = math.max(math.floor(access_expires_at - now), 1)
+            redis.call('SET', 'access:revoked:' .. session['access_jti'], 'token_key', 'EX', ttl)
+        end
+    end
+end
+redis.call('DEL', KEYS[1])
+return #sessions / 2
+"""
+
 logger = logging.getLogger(__name__)
 
 
+class TokenStorageLayout(str, Enum):
+    LEGACY = 'legacy'
+    # writes the compact layout and still reads keys written by the legacy one, until they expire
+    DUAL = 'dual'
+    COMPACT = 'compact'
+
+
 class TokenStorage:
-    def __init__(self, cache_storage: Redis):
+    def __init__(
+        self,
+        cache_storage: Redis | RedisCluster,
+        layout: TokenStorageLayout = TokenStorageLayout.LEGACY,
+        replica_storage: Redis | RedisCluster | None = None,
+    ):
         self.cache_storage = cache_storage
+        self._replica_storage = replica_storage or cache_storage
+        # cluster pipelines cannot be transactions, their commands are sent to each node separately
+        self._transaction = not isinstance(cache_storage, RedisCluster)
+        self._write_compact = layout != TokenStorageLayout.LEGACY
+        self._read_legacy = layout != TokenStorageLayout.COMPACT
+        self._revoke_sessions_script = cache_storage.register_script(_REVOKE_SESSIONS_SCRIPT)
 
-    async def save_refresh_jti(self, jti: UUID, ttl: int) -> None:
-        logger.info('Saving refresh jti %s in cache', jti)
+    async def save_session(
+        self, user_id: UUID, jti: UUID, access_jti: UUID, issued_at: float, expires_at: float, device_type: str
+    ) -> None:
+        logger.info('Saving refresh jti %s of user %s in cache', jti, user_id)
+        session = json.dumps({'iat': issued_at, 'exp': expires_at, 'device_type': device_type,
+                              'access_jti': str(access_jti)})
         try:
-            await self.cache_storage.set(self._refresh_jti_cache_key(jti), _TOKEN_KEY, ttl)
+            async with self.cache_storage.pipeline(transaction=self._transaction) as pipe:
+                if self._write_compact:
+                    pipe.set(self._compact_refresh_jti_cache_key(jti), _COMPACT_VALUE, int(expires_at - time.time()))
+                else:
+                    pipe.set(self._refresh_jti_cache_key(jti), _TOKEN_KEY, int(expires_at - time.time()))
+                pipe.hset(self._sessions_cache_key(user_id), str(jti), session)
+                # refresh tokens share one lifetime, so the newest session is always the last to expire
+                pipe.expireat(self._sessions_cache_key(user_id), int(expires_at))
+                await pipe.execute()
         except RedisError as e:
             logger.error('Failed to save refresh jti %s in cache: %s', jti, e)
             raise
 
-    async def remove_refresh_jti(self, jti: UUID) -> None:
+    async def remove_refresh_jti(self, user_id: UUID, jti: UUID) -> None:
         logger.info('Removing refresh jti %s from cache', jti)
         try:
-            await self.cache_storage.delete(self._refresh_jti_cache_key(jti))
+            async with self.cache_storage.pipeline(transaction=False) as pipe:
+                for key in self._refresh_jti_cache_keys(jti):
+                    pipe.delete(key)
+                pipe.hdel(self._sessions_cache_key(user_id), str(jti))
+                await pipe.execute()
         except RedisError as e:
             logger.error('Failed to remove refresh jti %s from cache: %s', jti, e)
             raise
 
-    async def check_refresh_token_exists(self, jti: UUID) -> bool:
+    async def check_refresh_token_exists(self, user_id: UUID, jti: UUID) -> bool:
         logger.info('Checking if refresh jti %s exists in cache', jti)
         try:
-            jti = await self.cache_storage.getdel(self._refresh_jti_cache_key(jti))
-            return jti is not None
+            async with self.cache_storage.pipeline(transaction=False) as pipe:
+                for key in self._refresh_jti_cache_keys(jti):
+                    pipe.getdel(key)
+                pipe.hdel(self._sessions_cache_key(user_id), str(jti))
+                *token_keys, _ = await pipe.execute()
+            return any(token_key is not None for token_key in token_keys)
         except RedisError as e:
             logger.error('Failed to delete refresh jti %s from cache: %s', jti, e)
             raise
 
-    async def save_revoked_access_jti(self, jti: UUID, ttl: int) -> None:
+    async def get_sessions(self, user_id: UUID) -> Dict[str, Dict[str, Any]]:
+        logger.info('Getting sessions of user %s from cache', user_id)
+        try:
+            sessions = await self.cache_storage.hgetall(self._sessions_cache_key(user_id))
+            sessions = {jti.decode(): json.loads(session) for jti, session in sessions.items()}
+            expired = [jti for jti, session in sessions.items() if session['exp'] <= time.time()]
+            if expired:
+                await self.cache_storage.hdel(self._sessions_cache_key(user_id), *expired)
+            return {jti: session for jti, session in sessions.items() if jti not in expired}
+        except RedisError as e:
+            logger.error('Failed to get sessions of user %s from cache: %s', user_id, e)
+            raise
+
+    async def revoke_sessions(self, user_id: UUID, access_token_ttl: int) -> int:
+        logger.info('Revoking all sessions of user %s in cache', user_id)
+        try:
+            if self._transaction:
+                return await self._revoke_sessions_script(
+                    keys=[self._sessions_cache_key(user_id)],
+                    args=[time.time(), access_token_ttl, int(self._write_compact), int(self._read_legacy),
+                          _REVOKED_BUCKET_SECONDS],
+                )
+            # a cluster script may only touch keys of one slot, the refresh and revoked keys are spread over all
+            return await self._revoke_sessions_in_cluster(user_id, access_token_ttl)
+        except RedisError as e:
+            logger.error('Failed to revoke sessions of user %s in cache: %s', user_id, e)
+            raise
+
+    async def _revoke_sessions_in_cluster(self, user_id: UUID, access_token_ttl: int) -> int:
+        sessions = await self.cache_storage.hgetall(self._sessions_cache_key(user_id))
+        if not sessions:
+            return 0
+        now = time.time()
+        # only the fetched sessions are removed, so one created meanwhile is left intact
+        async with self.cache_storage.pipeline(transaction=False) as pipe:
+            for jti, session in sessions.items():
+                session = json.loads(session)
+                for key in self._refresh_jti_cache_keys(UUID(jti.decode())):
+                    pipe.delete(key)
+                # access token is issued at the same time as refresh token
+                access_expires_at = session['iat'] + access_token_ttl
+                if access_expires_at > now:
+                    self._add_revoked_access_jti(pipe, UUID(session['access_jti']), access_expires_at)
+            pipe.hdel(self._sessions_cache_key(user_id), *sessions)
+            await pipe.execute()
+        return len(sessions)
+
+    async def save_revoked_access_jti(self, jti: UUID, expires_at: float) -> None:
         logger.info('Saving revoked access jti %s in cache', jti)
         try:
-            await self.cache_storage.set(self._revoked_access_jti_cache_key(jti), _TOKEN_KEY, ttl)
+            async with self.cache_storage.pipeline(transaction=self._transaction) as pipe:
+                self._add_revoked_access_jti(pipe, jti, expires_at)
+                await pipe.execute()
         except RedisError as e:
             logger.error('Failed to save revoked access jti %s in cache: %s', jti, e)
             raise
 
-    async def check_access_token_revoked(self, jti: UUID) -> bool:
+    async def check_access_token_revoked(self, jti: UUID, expires_at: float) -> bool:
         logger.info('Checking if access token with jti %s was revoked in cache', jti)
         try:
-            is_exist = await self.cache_storage.exists(self._revoked_access_jti_cache_key(jti))
-            return bool(is_exist)
+            if not self._write_compact:
+                return bool(await self._replica_storage.exists(self._revoked_access_jti_cache_key(jti)))
+            async with self._replica_storage.pipeline(transaction=False) as pipe:
+                pipe.sismember(self._compact_revoked_access_cache_key(expires_at), jti.bytes)
+                if self._read_legacy:
+                    pipe.exists(self._revoked_access_jti_cache_key(jti))
+                return any(await pipe.execute())
         except RedisError as e:
             logger.error('Failed to check if access token with jti %s is revoked in cache %s', jti, e)
             raise
 
+    def _add_revoked_access_jti(self, pipe: Pipeline, jti: UUID, expires_at: float) -> None:
+        if not self._write_compact:
+            pipe.set(self._revoked_access_jti_cache_key(jti), _TOKEN_KEY, max(int(expires_at - time.time()), 1))
+            return
+        # the bucket outlives every token in it, the token itself is rejected by its exp claim by then
+        bucket_key = self._compact_revoked_access_cache_key(expires_at)
+        pipe.sadd(bucket_key, jti.bytes)
+        pipe.expireat(bucket_key, (int(expires_at) // _REVOKED_BUCKET_SECONDS + 1) * _REVOKED_BUCKET_SECONDS)
+
+    def _refresh_jti_cache_keys(self, jti: UUID) -> List[str | bytes]:
+        keys = [self._compact_refresh_jti_cache_key(jti)] if self._write_compact else []
+        if self._read_legacy:
+            keys.append(self._refresh_jti_cache_key(jti))
+        return keys
+
     @staticmethod
     def _refresh_jti_cache_key(jti: UUID) -> str:
         return f'{_REFRESH_PREFIX}:{jti}'
@@ -70,9 +227,23 @@ class TokenStorage:
     def _revoked_access_jti_cache_key(jti: UUID) -> str:
         return f'{_ACCESS_PREFIX}:revoked:{jti}'
 
+    @staticmethod
+    def _compact_refresh_jti_cache_key(jti: UUID) -> bytes:
+        return _COMPACT_REFRESH_PREFIX + jti.bytes
+
+    @staticmethod
+    def _compact_revoked_access_cache_key(expires_at: float) -> str:
+        return f'{_COMPACT_REVOKED_PREFIX}:{int(expires_at) // _REVOKED_BUCKET_SECONDS}'
+
+    @staticmethod
+    def _sessions_cache_key(user_id: UUID) -> str:
+        # hash tag keeps all sessions of a user on one cluster slot
+        return f'{_SESSIONS_PREFIX}:{{{user_id}}}'
+
 
 @lru_cache()
 def get_token_storage(
-    cache_storage: Annotated[Redis, Depends(get_redis)]
+    cache_storage: Annotated[Redis | RedisCluster, Depends(get_redis)],
+    replica_storage: Annotated[Redis | RedisCluster, Depends(get_redis_replica)],
 ) -> TokenStorage:
-    return TokenStorage(cache_storage)
+    return TokenStorage(cache_storage, TokenStorageLayout(settings.token_storage_layout), replica_storage)
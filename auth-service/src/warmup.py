@@ -0,0 +1,62 @@
+import asyncio
+import logging
+import time
+
+from fastapi import FastAPI
+from opentelemetry import metrics
+from sqlalchemy import text
+
+from core.config import settings
+from db import postgres, redis
+from services.auth_service import load_token_keys
+
+logger = logging.getLogger(__name__)
+meter = metrics.get_meter(__name__)
+
+_time_to_ready = meter.create_histogram(
+    'app.time_to_ready', unit='s', description='Time from worker start to the end of its warm-up'
+)
+
+
+class WarmUp:
+    """Prepares a worker before it reports ready, so the first requests after a deploy are not the slow ones."""
+
+    def __init__(self) -> None:
+        # gunicorn resets it on fork, see gunicorn_conf.py
+        self.boot_started = time.monotonic()
+        self.ready = False
+        self._lock = asyncio.Lock()
+
+    async def run(self, app: FastAPI) -> bool:
+        async with self._lock:
+            if self.ready:
+                return True
+            try:
+                await self._warm_up(app)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                # not fatal, the readiness probe retries the warm-up
+                logger.error('Warm-up failed: %s', e)
+                return False
+            self.ready = True
+        time_to_ready = time.monotonic() - self.boot_started
+        _time_to_ready.record(time_to_ready, {'preload': settings.preload_app})
+        logger.info('Worker is ready in %.2f s', time_to_ready)
+        return True
+
+    @staticmethod
+    async def _warm_up(app: FastAPI) -> None:
+        load_token_keys()
+        app.openapi()
+        redis_clients = [redis.redis] if redis.redis_replica is redis.redis else [redis.redis, redis.redis_replica]
+        await asyncio.gather(
+            *(_ping_postgres() for _ in range(settings.warmup_db_connections)),
+            *(client.ping() for client in redis_clients for _ in range(settings.warmup_redis_connections)),
+        )
+
+
+async def _ping_postgres() -> None:
+    async with postgres.engine.connect() as conn:
+        await conn.execute(text('SELECT 1'))
+
+
+warm_up = WarmUp()
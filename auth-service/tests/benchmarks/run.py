@@ -0,0 +1,149 @@
+"""Times the auth hot paths in-process, without Postgres or Redis, and compares them with the stored baseline.
+
+    python -m tests.benchmarks.run                      # fails if a benchmark regressed
+    python -m tests.benchmarks.run --update-baseline    # records the current timings as the baseline
+"""
+import json
+import sys
+import timeit
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict
+from uuid import uuid4
+
+from tests.benchmarks.settings import benchmark_settings
+from tests.service import configure_service
+
+_USER_AGENTS = (
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) '
+    'Version/17.0 Mobile/15E148 Safari/604.1',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+    'Chrome/126.0.0.0 Safari/537.36',
+)
+
+
+def _token_benchmarks() -> Dict[str, Callable[[], object]]:
+    # pylint: disable=import-outside-toplevel,protected-access
+    from services.auth_service import AuthService, AccessTokenPayload, RefreshTokenPayload
+
+    user_id, roles = uuid4(), ['user', 'admin']
+    access_payload = AccessTokenPayload(user_id=user_id, roles=roles)
+    access_token = AuthService._create_token(access_payload)
+    refresh_token = AuthService._create_token(RefreshTokenPayload(user_id=user_id, access_jti=access_payload.jti))
+    compact_access_token = AuthService._create_token(access_payload, 'compact')
+    access_claims = access_payload.to_claims()
+
+    return {
+        'create_access_token': lambda: AuthService._create_token(AccessTokenPayload(user_id=user_id, roles=roles)),
+        'create_refresh_token': lambda: AuthService._create_token(
+            RefreshTokenPayload(user_id=user_id, access_jti=access_payload.jti)
+        ),
+        'create_compact_access_token': lambda: AuthService._create_token(
+            AccessTokenPayload(user_id=user_id, roles=roles), 'compact'
+        ),
+        'decode_access_token': lambda: AuthService._decode_access_token(access_token),
+        'decode_compact_access_token': lambda: AuthService._decode_access_token(compact_access_token),
+        'decode_refresh_token': lambda: AuthService._decode_refresh_token(refresh_token),
+        'access_claims_parse': lambda: AccessTokenPayload.from_claims(access_claims),
+        'access_payload_cycle': lambda: AccessTokenPayload.from_claims(
+            AccessTokenPayload(user_id=user_id, roles=roles).to_claims()
+        ),
+    }
+
+
+def _request_benchmarks() -> Dict[str, Callable[[], object]]:
+    # pylint: disable=import-outside-toplevel,protected-access
+    from core.permissions import has_permission, permission_mask
+    from services.auth_service import AuthService
+    from services.password_service import PasswordService
+    from storage.token_storage import TokenStorage
+
+    user_id, roles = uuid4(), ['user', 'admin']
+    password_service = PasswordService()
+
+    return {
+        'password_hash': lambda: password_service.get_password_hash('user@example.com', 'password'),
+        'user_device_type': lambda: [AuthService._get_user_device_type(ua) for ua in _USER_AGENTS],
+        'token_storage_keys': lambda: (TokenStorage._refresh_jti_cache_key(user_id),
+                                       TokenStorage._revoked_access_jti_cache_key(user_id)),
+        'permission_check': lambda: has_permission(permission_mask(roles), 'roles:write'),
+    }
+
+
+def _schema_benchmarks() -> Dict[str, Callable[[], object]]:
+    # pylint: disable=import-outside-toplevel,protected-access
+    from api.v1.schemas import AuthHistory, Token
+    from models.entity import UserLogin
+    from services.auth_service import AuthService, AccessTokenPayload, RefreshTokenPayload
+
+    user_id = uuid4()
+    access_payload = AccessTokenPayload(user_id=user_id, roles=['user', 'admin'])
+    token = Token(
+        access_token=AuthService._create_token(access_payload),
+        refresh_token=AuthService._create_token(RefreshTokenPayload(user_id=user_id, access_jti=access_payload.jti)),
+    )
+    user_login = UserLogin(id=uuid4(), user_agent=_USER_AGENTS[0], user_id=user_id, user_device_type='mobile',
+                           date=datetime.now())
+
+    return {
+        'token_schema_dump': token.model_dump_json,
+        'auth_history_schema_dump': lambda: AuthHistory.model_validate(user_login).model_dump_json(),
+    }
+
+
+def _benchmarks() -> Dict[str, Callable[[], object]]:
+    return {**_request_benchmarks(), **_token_benchmarks(), **_schema_benchmarks()}
+
+
+def _token_sizes() -> Dict[str, int]:
+    # pylint: disable=import-outside-toplevel,protected-access
+    from services.auth_service import AuthService, AccessTokenPayload
+
+    payload = AccessTokenPayload(user_id=uuid4(), roles=['user', 'admin'])
+    return {profile: len(AuthService._create_token(payload, profile)) for profile in ('full', 'compact')}
+
+
+def _time_per_call(func: Callable[[], object]) -> float:
+    timer = timeit.Timer(func)
+    number, elapsed = 1, 0.0
+    while elapsed < benchmark_settings.min_run_seconds:
+        number *= 2
+        elapsed = timer.timeit(number)
+    return min(timer.repeat(repeat=benchmark_settings.repeat, number=number)) / number
+
+
+def main() -> int:
+    configure_service('benchmark')
+    baseline_path = Path(benchmark_settings.baselines_dir) / f'{benchmark_settings.profile}.json'
+    baseline = json.loads(baseline_path.read_text(encoding='utf-8'))['timings'] if baseline_path.exists() else {}
+    timings, regressions = {}, []
+
+    print(f'{"benchmark":<28}{"per call, us":>16}{"baseline, us":>16}{"change":>10}')
+    for name, func in _benchmarks().items():
+        timings[name] = _time_per_call(func)
+        before = baseline.get(name)
+        change = (timings[name] - before) / before * 100 if before else None
+        if change is not None and change > benchmark_settings.regression_threshold:
+            regressions.append(name)
+        print(f'{name:<28}{timings[name] * 1e6:>16.2f}'
+              f'{(before or 0) * 1e6:>16.2f}{"" if change is None else f"{change:+.1f}%":>10}')
+
+    print('access token size, B: ' + ', '.join(f'{profile} {size}' for profile, size in _token_sizes().items()))
+
+    if '--update-baseline' in sys.argv or not baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps({
+            'recorded_at': datetime.now(timezone.utc).isoformat(),
+            'python': sys.version.split()[0],
+            'timings': timings,
+        }, indent=2), encoding='utf-8')
+        print(f'baseline written to {baseline_path}')
+        return 0
+    if regressions:
+        print(f'regressed by more than {benchmark_settings.regression_threshold}%: {", ".join(regressions)}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,22 @@
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class BenchmarkSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_file='.env', env_prefix='benchmark_')
+
+    # a benchmark fails when it is slower than its baseline by more than this many percent
+    regression_threshold: float = 25
+    # baselines are per machine, CI and developer laptops keep separate profiles
+    profile: str = 'local'
+    baselines_dir: str = 'tests/benchmarks/baselines'
+    min_run_seconds: float = 0.2
+    repeat: int = 5
+
+    # token_memory writes into this database and flushes it, keep it apart from the service data
+    redis_host: str = '127.0.0.1'
+    redis_port: int = 6379
+    redis_db: int = 15
+    memory_tokens: int = 100_000
+
+
+benchmark_settings = BenchmarkSettings()
@@ -0,0 +1,68 @@
+"""Measures Redis memory used per token by each token storage layout.
+
+Needs a running Redis, the database from BENCHMARK_REDIS_DB is flushed before every measurement.
+
+    python -m tests.benchmarks.token_memory
+"""
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Tuple
+from uuid import uuid4
+
+from redis.asyncio import Redis
+
+from tests.benchmarks.settings import benchmark_settings
+from tests.service import configure_service
+
+_ACCESS_TOKEN_EXPIRE_SECONDS = 24 * 60 * 60
+_REFRESH_TOKEN_EXPIRE_SECONDS = 10 * 24 * 60 * 60
+_CHUNK = 1000
+
+
+async def _used_memory(redis: Redis) -> int:
+    return (await redis.info('memory'))['used_memory']
+
+
+async def _measure(redis: Redis, write: Callable[[], Awaitable[None]], *drop_keys: str) -> float:
+    await redis.flushdb()
+    before = await _used_memory(redis)
+    for start in range(0, benchmark_settings.memory_tokens, _CHUNK):
+        await asyncio.gather(*(write() for _ in range(start, min(start + _CHUNK, benchmark_settings.memory_tokens))))
+    if drop_keys:
+        await redis.delete(*drop_keys)
+    return (await _used_memory(redis) - before) / benchmark_settings.memory_tokens
+
+
+async def _measure_layout(redis: Redis, layout: str) -> Tuple[float, float]:
+    # pylint: disable=import-outside-toplevel,protected-access
+    from storage.token_storage import TokenStorage, TokenStorageLayout
+
+    token_storage = TokenStorage(redis, TokenStorageLayout(layout))
+    now = time.time()
+    # the session index is the same in both layouts, so it is dropped before measuring
+    user_id = uuid4()
+    refresh = await _measure(redis, lambda: token_storage.save_session(
+        user_id, uuid4(), uuid4(), now, now + _REFRESH_TOKEN_EXPIRE_SECONDS, 'pc'
+    ), TokenStorage._sessions_cache_key(user_id))
+    # revoked access tokens expire evenly over the access token lifetime
+    revoked = await _measure(redis, lambda: token_storage.save_revoked_access_jti(
+        uuid4(), now + random.uniform(1, _ACCESS_TOKEN_EXPIRE_SECONDS)
+    ))
+    return refresh, revoked
+
+
+async def main() -> None:
+    configure_service('benchmark')
+    redis = Redis(host=benchmark_settings.redis_host, port=benchmark_settings.redis_port,
+                  db=benchmark_settings.redis_db)
+    print(f'{"layout":<10}{"refresh token, B":>22}{"revoked access, B":>22}')
+    for layout in ('legacy', 'compact'):
+        refresh, revoked = await _measure_layout(redis, layout)
+        print(f'{layout:<10}{refresh:>22.1f}{revoked:>22.1f}')
+    await redis.flushdb()
+    await redis.aclose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
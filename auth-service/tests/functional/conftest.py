@@ -36,8 +36,10 @@ class Client:
     ) -> ClientResponse:
         return await self._session.put(f'{_BASE_URL}/{path}', json=(body or {}), headers=(headers or {}))
 
-    async def delete(self, path: str, headers: Dict[str, str] | None = None) -> ClientResponse:
-        return await self._session.delete(f'{_BASE_URL}/{path}', headers=(headers or {}))
+    async def delete(
+        self, path: str, body: Dict[str, str] | None = None, headers: Dict[str, str] | None = None
+    ) -> ClientResponse:
+        return await self._session.delete(f'{_BASE_URL}/{path}', json=body, headers=(headers or {}))
 
 
 @pytest_asyncio.fixture(scope='session')
@@ -4,6 +4,7 @@ import hashlib
 from dataclasses import dataclass
 
 import pytest_asyncio
+from redis.asyncio import Redis
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from tests.functional.plugins.models import User, Role
@@ -20,7 +21,7 @@ class TestUser:
 
 
 @pytest_asyncio.fixture(name='user')
-async def fixture_user(db_session: AsyncSession) -> Iterator[TestUser]:
+async def fixture_user(db_session: AsyncSession, redis_client: Redis) -> Iterator[TestUser]:
     id, email, password = uuid4(), f'{uuid4()}@test.com', 'password'
     roles = [Role(id=uuid4(), name=str(uuid4()))]
     user = User(
@@ -31,11 +32,12 @@ async def fixture_user(db_session: AsyncSession) -> Iterator[TestUser]:
     )
     db_session.add(user)
     await db_session.commit()
+    await _drop_email_filter(redis_client)
     yield TestUser(id=id, email=email, password=password, roles=roles)
 
 
 @pytest_asyncio.fixture(name='superuser')
-async def fixture_superuser(db_session: AsyncSession, superuser_role: Role) -> Iterator[TestUser]:
+async def fixture_superuser(db_session: AsyncSession, redis_client: Redis, superuser_role: Role) -> Iterator[TestUser]:
     id, email, password = uuid4(), f'{uuid4()}@test.com', 'password'
     user = User(
         id=id,
@@ -45,8 +47,16 @@ async def fixture_superuser(db_session: AsyncSession, superuser_role: Role) -> I
     )
     db_session.add(user)
     await db_session.commit()
+    await _drop_email_filter(redis_client)
     yield TestUser(id=id, email=email, password=password, roles=[superuser_role])
 
 
+async def _drop_email_filter(redis_client: Redis) -> None:
+    # the user is written past the service and is not in its email filter, without the filter logins look it up
+    # in the database
+    async for key in redis_client.scan_iter(match='{email_filter}:*'):
+        await redis_client.delete(key)
+
+
 def _hash_password(salt: str, password: str) -> str:
     return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('utf-8'), 100000).hex()
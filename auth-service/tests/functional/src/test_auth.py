@@ -1,12 +1,17 @@
+import asyncio
 from http import HTTPStatus
 from uuid import uuid4
 
 import pytest
+from redis.asyncio import Redis
 
 from tests.functional.conftest import Client
 from tests.functional.plugins.users import TestUser
 from tests.functional.src.utils import build_headers, login
 
+# LOGIN_EMAIL_MAX_FAILURES of the service
+_LOGIN_EMAIL_MAX_FAILURES = 5
+
 
 @pytest.mark.asyncio
 async def test_login_returns_tokens(client: Client, user: TestUser) -> None:
@@ -35,6 +40,30 @@ async def test_login_incorrect_password(client: Client, user: TestUser) -> None:
     assert response.status == HTTPStatus.FORBIDDEN
 
 
+@pytest.mark.asyncio
+@pytest.mark.usefixtures('redis_flushall')
+async def test_login_locks_out_after_failed_attempts(client: Client, redis_client: Redis, user: TestUser) -> None:
+    lockout_key = f'login_lockout:email:{user.email}'
+    for _ in range(_LOGIN_EMAIL_MAX_FAILURES):
+        response = await client.post('api/v1/auth/login', body={'email': user.email, 'password': 'test_password'})
+        assert response.status == HTTPStatus.FORBIDDEN
+        # stays under the per-client rate limit
+        await asyncio.sleep(0.25)
+    assert not await redis_client.exists(lockout_key)
+
+    response = await client.post('api/v1/auth/login', body={'email': user.email, 'password': 'test_password'})
+    assert response.status == HTTPStatus.FORBIDDEN
+    assert await redis_client.pttl(lockout_key) > 0
+    # the first lockout is short, it is extended so the check below does not race it
+    await redis_client.expire(lockout_key, 60)
+    await asyncio.sleep(0.25)
+
+    response = await client.post('api/v1/auth/login', body={'email': user.email, 'password': user.password})
+
+    assert response.status == HTTPStatus.TOO_MANY_REQUESTS
+    assert (await response.json())['detail'] == 'Too many failed login attempts'
+
+
 @pytest.mark.asyncio
 async def test_get_auth_history_returns_history(client: Client, user: TestUser) -> None:
     user_agent = f'test user agent {uuid4()}'
@@ -48,6 +77,22 @@ async def test_get_auth_history_returns_history(client: Client, user: TestUser)
     assert body['items'][0]['user_agent'] == user_agent
 
 
+@pytest.mark.asyncio
+async def test_get_auth_history_pages_through_logins(client: Client, user: TestUser) -> None:
+    user_agents = [f'test user agent {uuid4()}' for _ in range(3)]
+    for user_agent in user_agents:
+        access_token, _ = await login(user, client, user_agent)
+
+    response = await client.get('api/v1/auth/history', params={'page': '2', 'size': '2'},
+                                headers=build_headers(access_token))
+
+    assert response.status == HTTPStatus.OK
+    body = await response.json()
+    assert body['total'] == len(user_agents)
+    assert len(body['items']) == 1
+    assert body['items'][0]['user_agent'] in user_agents
+
+
 @pytest.mark.asyncio
 async def test_get_auth_history_returns_unauthorized_if_no_token(client: Client) -> None:
     response = await client.get('api/v1/auth/history')
@@ -86,6 +131,16 @@ async def test_signup_new_user(client: Client) -> None:
     assert body['email'] == email
 
 
+@pytest.mark.asyncio
+async def test_login_right_after_signup(client: Client) -> None:
+    email, password = f'{uuid4()}@test.com', 'test_password'
+    response = await client.post('api/v1/auth/signup', body={'email': email, 'password': password})
+    assert response.status == HTTPStatus.OK
+    body = await response.json()
+
+    await login(TestUser(id=body['id'], email=email, password=password, roles=[]), client)
+
+
 @pytest.mark.asyncio
 async def test_signup_existing_user(client: Client, user: TestUser) -> None:
     response = await client.post('api/v1/auth/signup', body={'email': user.email, 'password': user.password})
@@ -109,3 +164,51 @@ async def test_logout_invalid_token(client: Client, user: TestUser):
     response = await client.post('api/v1/auth/logout', headers=build_headers(access_token))
 
     assert response.status == HTTPStatus.FORBIDDEN
+
+
+@pytest.mark.asyncio
+async def test_verify_returns_user_headers(client: Client, user: TestUser) -> None:
+    access_token, _ = await login(user, client)
+
+    response = await client.get('api/v1/auth/verify', headers=build_headers(access_token))
+
+    assert response.status == HTTPStatus.NO_CONTENT
+    assert response.headers['X-User-Id'] == str(user.id)
+    assert response.headers['X-User-Roles'] == ','.join(role.name for role in user.roles)
+    assert response.headers['Cache-Control'].startswith('max-age=')
+
+
+@pytest.mark.asyncio
+async def test_verify_returns_unauthorized_for_revoked_token(client: Client, user: TestUser) -> None:
+    access_token, refresh_token = await login(user, client)
+    await client.post('api/v1/auth/logout', headers=build_headers(refresh_token))
+
+    response = await client.get('api/v1/auth/verify', headers=build_headers(access_token))
+
+    assert response.status == HTTPStatus.UNAUTHORIZED
+
+
+@pytest.mark.asyncio
+async def test_get_sessions_returns_active_sessions(client: Client, user: TestUser) -> None:
+    await login(user, client, user_agent='Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X)')
+    access_token, _ = await login(user, client, user_agent=f'test user agent {uuid4()}')
+
+    response = await client.get('api/v1/auth/sessions', headers=build_headers(access_token))
+
+    assert response.status == HTTPStatus.OK
+    body = await response.json()
+    assert [session['device_type'] for session in body] == ['unknown', 'mobile']
+
+
+@pytest.mark.asyncio
+async def test_revoke_sessions_revokes_all_tokens(client: Client, user: TestUser) -> None:
+    other_access_token, other_refresh_token = await login(user, client)
+    access_token, _ = await login(user, client)
+
+    response = await client.delete('api/v1/auth/sessions', headers=build_headers(access_token))
+
+    assert response.status == HTTPStatus.NO_CONTENT
+    response = await client.post('api/v1/auth/refresh', headers=build_headers(other_refresh_token))
+    assert response.status == HTTPStatus.FORBIDDEN
+    response = await client.get('api/v1/auth/verify', headers=build_headers(other_access_token))
+    assert response.status == HTTPStatus.UNAUTHORIZED
@@ -0,0 +1,12 @@
+from http import HTTPStatus
+
+import pytest
+
+from tests.functional.conftest import Client
+
+
+@pytest.mark.asyncio
+async def test_ready_after_warm_up(client: Client) -> None:
+    response = await client.get('api/health/ready')
+
+    assert response.status == HTTPStatus.NO_CONTENT
@@ -0,0 +1,53 @@
+from http import HTTPStatus
+from typing import Any, Dict
+from uuid import uuid4
+
+import pytest
+
+from tests.functional.conftest import Client
+from tests.functional.plugins.users import TestUser
+from tests.functional.src.utils import build_headers, login
+
+
+# a request per permission, the role of the user fixture grants none of them
+@pytest.mark.asyncio
+@pytest.mark.parametrize(('method', 'path', 'kwargs'), [
+    ('get', 'api/v1/users/', {}),
+    ('post', 'api/v1/users/roles/bulk', {'body': {'items': [{'user_id': str(uuid4()), 'role_id': str(uuid4())}]}}),
+    ('get', 'api/v1/roles/', {}),
+    ('post', 'api/v1/roles/', {'body': {'name': 'role'}}),
+    ('get', 'api/v1/users/history/export', {}),
+])
+async def test_role_without_permission_is_forbidden(
+    client: Client, user: TestUser, method: str, path: str, kwargs: Dict[str, Any]
+) -> None:
+    access_token, _ = await login(user, client)
+
+    response = await getattr(client, method)(path, headers=build_headers(access_token), **kwargs)
+
+    assert response.status == HTTPStatus.FORBIDDEN
+
+
+@pytest.mark.asyncio
+async def test_own_history_and_roles_need_no_permission(client: Client, user: TestUser) -> None:
+    access_token, _ = await login(user, client)
+
+    response = await client.get('api/v1/users/history/export', params={'user_id': str(user.id)},
+                                headers=build_headers(access_token))
+    assert response.status == HTTPStatus.OK
+
+    response = await client.get(f'api/v1/users/{user.id}/roles', headers=build_headers(access_token))
+    assert response.status == HTTPStatus.OK
+
+
+@pytest.mark.asyncio
+async def test_revoked_role_loses_permission_with_the_same_token(client: Client, superuser: TestUser) -> None:
+    access_token, _ = await login(superuser, client)
+
+    response = await client.delete(f'api/v1/users/{superuser.id}/roles?role_id={superuser.roles[0].id}',
+                                   headers=build_headers(access_token))
+    assert response.status == HTTPStatus.NO_CONTENT
+
+    # without TOKEN_PERMISSIONS the roles are read on every check, the change invalidated the cached ones
+    response = await client.get('api/v1/roles/', headers=build_headers(access_token))
+    assert response.status == HTTPStatus.FORBIDDEN
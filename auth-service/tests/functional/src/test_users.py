@@ -1,3 +1,4 @@
+import json
 from http import HTTPStatus
 from uuid import uuid4
 
@@ -48,6 +49,21 @@ async def test_update_user_success(client: Client, user: TestUser) -> None:
     assert body['email'] == email_to_update
 
 
+@pytest.mark.asyncio
+async def test_login_with_updated_email(client: Client, user: TestUser) -> None:
+    access_token, _ = await login(user, client)
+    updated = TestUser(id=user.id, email=f'{uuid4()}@test.com', password='new_password', roles=user.roles)
+
+    response = await client.put(
+        f'api/v1/users/{user.id}',
+        body={'email': updated.email, 'password': updated.password},
+        headers=build_headers(access_token)
+    )
+
+    assert response.status == HTTPStatus.OK
+    await login(updated, client)
+
+
 @pytest.mark.asyncio
 async def test_update_user_without_permission(client: Client, user: TestUser, superuser: TestUser) -> None:
     access_token, _ = await login(user, client)
@@ -89,6 +105,47 @@ async def test_get_user_roles_returns_forbidden_regular_user(
     assert response.status == HTTPStatus.FORBIDDEN
 
 
+@pytest.mark.asyncio
+async def test_get_user_returns_not_modified_until_update(client: Client, user: TestUser) -> None:
+    access_token, _ = await login(user, client)
+    response = await client.get(f'api/v1/users/{user.id}', headers=build_headers(access_token))
+    etag = response.headers['ETag']
+
+    not_modified = await client.get(f'api/v1/users/{user.id}',
+                                    headers={**build_headers(access_token), 'If-None-Match': etag})
+    await client.put(f'api/v1/users/{user.id}', body={'email': f'{uuid4()}@test.com', 'password': user.password},
+                     headers=build_headers(access_token))
+    modified = await client.get(f'api/v1/users/{user.id}',
+                                headers={**build_headers(access_token), 'If-None-Match': etag})
+
+    assert not_modified.status == HTTPStatus.NOT_MODIFIED
+    assert not_modified.headers['ETag'] == etag
+    assert modified.status == HTTPStatus.OK
+    assert modified.headers['ETag'] != etag
+
+
+@pytest.mark.asyncio
+async def test_get_user_roles_returns_not_modified_until_role_change(
+        client: Client,
+        superuser: TestUser,
+        user: TestUser,
+        role: Role
+) -> None:
+    access_token, _ = await login(superuser, client)
+    response = await client.get(f'api/v1/users/{user.id}/roles', headers=build_headers(access_token))
+    etag = response.headers['ETag']
+
+    not_modified = await client.get(f'api/v1/users/{user.id}/roles',
+                                    headers={**build_headers(access_token), 'If-None-Match': etag})
+    await client.post(f'api/v1/users/{user.id}/roles?role_id={role.id}', headers=build_headers(access_token))
+    modified = await client.get(f'api/v1/users/{user.id}/roles',
+                                headers={**build_headers(access_token), 'If-None-Match': etag})
+
+    assert not_modified.status == HTTPStatus.NOT_MODIFIED
+    assert modified.status == HTTPStatus.OK
+    assert str(role.id) in [role['id'] for role in await modified.json()]
+
+
 @pytest.mark.asyncio
 async def test_assign_existing_role_to_another_by_superuser(
         client: Client,
@@ -180,3 +237,129 @@ async def test_dissociate_not_existing_role(client: Client, superuser: TestUser)
     )
 
     assert response.status == HTTPStatus.NOT_FOUND
+
+
+@pytest.mark.asyncio
+async def test_bulk_assign_roles_by_superuser(
+        client: Client,
+        superuser: TestUser,
+        user: TestUser,
+        role: Role
+) -> None:
+    access_token, _ = await login(superuser, client)
+
+    response = await client.post(
+        'api/v1/users/roles/bulk',
+        body={'items': [
+            {'user_id': str(user.id), 'role_id': str(role.id)},
+            {'user_id': str(user.id), 'role_id': str(user.roles[0].id)},
+            {'user_id': str(user.id), 'role_id': str(uuid4())},
+        ]},
+        headers=build_headers(access_token)
+    )
+
+    assert response.status == HTTPStatus.OK
+    body = await response.json()
+    assert body['applied'] == [{'user_id': str(user.id), 'role_id': str(role.id)}]
+
+
+@pytest.mark.asyncio
+async def test_bulk_assign_roles_by_regular_user(client: Client, user: TestUser, role: Role) -> None:
+    access_token, _ = await login(user, client)
+
+    response = await client.post(
+        'api/v1/users/roles/bulk',
+        body={'items': [{'user_id': str(user.id), 'role_id': str(role.id)}]},
+        headers=build_headers(access_token)
+    )
+
+    assert response.status == HTTPStatus.FORBIDDEN
+
+
+@pytest.mark.asyncio
+async def test_bulk_dissociate_roles_by_superuser(client: Client, superuser: TestUser, user: TestUser) -> None:
+    access_token, _ = await login(superuser, client)
+
+    response = await client.delete(
+        'api/v1/users/roles/bulk',
+        body={'items': [
+            {'user_id': str(user.id), 'role_id': str(user.roles[0].id)},
+            {'user_id': str(user.id), 'role_id': str(uuid4())},
+        ]},
+        headers=build_headers(access_token)
+    )
+
+    assert response.status == HTTPStatus.OK
+    body = await response.json()
+    assert body['applied'] == [{'user_id': str(user.id), 'role_id': str(user.roles[0].id)}]
+
+
+@pytest.mark.asyncio
+async def test_get_users_finds_user_by_email_for_superuser(client: Client, superuser: TestUser, user: TestUser) -> None:
+    access_token, _ = await login(superuser, client)
+
+    response = await client.get(
+        'api/v1/users/',
+        params={'email': user.email.split('@')[0], 'role': user.roles[0].name},
+        headers=build_headers(access_token)
+    )
+
+    assert response.status == HTTPStatus.OK
+    body = await response.json()
+    assert [item['id'] for item in body['items']] == [str(user.id)]
+    assert body['next_cursor'] is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures('user')
+async def test_get_users_pages_with_cursor(client: Client, superuser: TestUser) -> None:
+    access_token, _ = await login(superuser, client)
+
+    first_page = await client.get('api/v1/users/', params={'size': '1'}, headers=build_headers(access_token))
+    first_body = await first_page.json()
+    second_page = await client.get(
+        'api/v1/users/',
+        params={'size': '1', 'cursor': first_body['next_cursor']},
+        headers=build_headers(access_token)
+    )
+
+    assert second_page.status == HTTPStatus.OK
+    second_body = await second_page.json()
+    assert len(second_body['items']) == 1
+    assert second_body['items'][0]['id'] != first_body['items'][0]['id']
+
+
+@pytest.mark.asyncio
+async def test_get_users_returns_forbidden_for_regular_user(client: Client, user: TestUser) -> None:
+    access_token, _ = await login(user, client)
+
+    response = await client.get('api/v1/users/', headers=build_headers(access_token))
+
+    assert response.status == HTTPStatus.FORBIDDEN
+
+
+@pytest.mark.asyncio
+async def test_export_history_streams_ndjson_for_superuser(client: Client, superuser: TestUser, user: TestUser) -> None:
+    await login(user, client, user_agent='first agent')
+    await login(user, client, user_agent='second agent')
+    access_token, _ = await login(superuser, client)
+
+    response = await client.get('api/v1/users/history/export', params={'user_id': str(user.id)},
+                                headers=build_headers(access_token))
+
+    assert response.status == HTTPStatus.OK
+    logins = [json.loads(line) for line in (await response.read()).splitlines()]
+    assert [item['user_agent'] for item in logins][-2:] == ['first agent', 'second agent']
+    assert {item['user_id'] for item in logins} == {str(user.id)}
+
+
+@pytest.mark.asyncio
+async def test_export_history_of_another_user_returns_forbidden_for_regular_user(
+    client: Client, user: TestUser, superuser: TestUser
+) -> None:
+    access_token, _ = await login(user, client)
+
+    response = await client.get('api/v1/users/history/export', params={'user_id': str(superuser.id)},
+                                headers=build_headers(access_token))
+
+    assert response.status == HTTPStatus.FORBIDDEN
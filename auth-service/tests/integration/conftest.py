@@ -0,0 +1,69 @@
+"""Runs the service in-process against a throwaway database and a Redis server, for the parts the HTTP tests can not
+reach: the command line tools, the archive and what a request does to the connection pool.
+
+    python -m pytest tests/integration      # from auth-service, needs Postgres and Redis, see settings.py
+"""
+import asyncio
+import os
+import tempfile
+from typing import Dict, Iterator
+from uuid import uuid4
+
+import pytest_asyncio
+from httpx import ASGITransport, AsyncClient
+from redis.asyncio import Redis
+
+from tests.integration.settings import integration_settings
+from tests.service import configure_database, configure_service, create_database
+
+
+def _configure_service() -> None:
+    configure_service('integration')
+    configure_database(integration_settings)
+    os.environ['REDIS_HOST'] = integration_settings.redis_host
+    os.environ['REDIS_PORT'] = str(integration_settings.redis_port)
+    os.environ['HISTORY_ARCHIVE_DIR'] = tempfile.mkdtemp(prefix='history_archive_')
+    # every test calls the API from the same address
+    os.environ['RATE_LIMIT_TIMES'] = '1000000'
+
+
+_configure_service()
+
+from db import redis  # pylint: disable=wrong-import-position
+from main import app  # pylint: disable=wrong-import-position
+
+
+@pytest_asyncio.fixture(scope='session')
+def event_loop() -> Iterator[asyncio.AbstractEventLoop]:
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest_asyncio.fixture(scope='session', name='service')
+async def fixture_service() -> Iterator[None]:
+    await create_database(integration_settings)
+    async with app.router.lifespan_context(app):
+        yield
+
+
+@pytest_asyncio.fixture(name='client')
+async def fixture_client(service: None) -> Iterator[AsyncClient]:  # pylint: disable=unused-argument
+    async with AsyncClient(transport=ASGITransport(app=app), base_url='http://integration',
+                           headers={'X-Request-Id': 'integration'}) as client:
+        yield client
+
+
+@pytest_asyncio.fixture(name='redis_client')
+async def fixture_redis_client(service: None) -> Iterator[Redis]:  # pylint: disable=unused-argument
+    # the client of the service, set up by its lifespan
+    yield redis.redis
+    await redis.redis.flushall()
+
+
+@pytest_asyncio.fixture
+async def credentials(client: AsyncClient) -> Iterator[Dict[str, str]]:
+    body = {'email': f'{uuid4()}@example.com', 'password': 'password'}
+    response = await client.post('/api/v1/auth/signup', json=body)
+    assert response.status_code == 200, response.text
+    yield body
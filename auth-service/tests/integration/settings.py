@@ -0,0 +1,16 @@
+from pydantic_settings import SettingsConfigDict
+
+from tests.service import ThrowawayDatabaseSettings
+
+
+class IntegrationSettings(ThrowawayDatabaseSettings):
+    model_config = SettingsConfigDict(env_file='.env', env_prefix='integration_')
+
+    postgres_db: str = 'integration'
+
+    # flushed after every test, it must not be shared with a running service
+    redis_host: str = '127.0.0.1'
+    redis_port: int = 6379
+
+
+integration_settings = IntegrationSettings()
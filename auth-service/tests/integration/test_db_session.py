@@ -0,0 +1,27 @@
+from typing import Dict
+
+import pytest
+from httpx import AsyncClient
+
+from tests.integration.utils import auth_headers, checkouts, login
+from db.postgres import engine
+
+
+@pytest.mark.asyncio
+async def test_redis_only_request_checks_out_no_connection(client: AsyncClient, credentials: Dict[str, str]) -> None:
+    _, refresh_token = await login(client, credentials)
+
+    with checkouts() as checked_out:
+        response = await client.post('/api/v1/auth/logout', headers=auth_headers(refresh_token))
+
+    assert response.status_code == 204
+    assert not checked_out
+
+
+@pytest.mark.asyncio
+async def test_request_returns_connection_after_its_work(client: AsyncClient, credentials: Dict[str, str]) -> None:
+    with checkouts() as checked_out:
+        await login(client, credentials)
+
+    assert len(checked_out) == 1
+    assert engine.sync_engine.pool.checkedout() == 0
@@ -0,0 +1,109 @@
+import asyncio
+from typing import Dict, Iterator
+from uuid import uuid4
+
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from redis.asyncio import Redis
+from sqlalchemy import text
+
+from tests.integration.utils import auth_headers, checkouts, login
+from db import redis
+from db.postgres import engine
+from services.password_service import PasswordService
+from services.user_service import rebuild_email_filter
+from storage.email_filter import EmailFilter, get_email_filter
+
+
+@pytest_asyncio.fixture(name='email_filter')
+async def fixture_email_filter(redis_client: Redis) -> Iterator[EmailFilter]:  # pylint: disable=unused-argument
+    # the instance the service uses; the filter is built anew, the previous test flushed it
+    email_filter = get_email_filter(redis.redis)
+    # the build started by the lifespan may still hold the lock
+    while await rebuild_email_filter(email_filter) is None:
+        await asyncio.sleep(0.1)
+    yield email_filter
+
+
+async def _signup(client: AsyncClient) -> Dict[str, str]:
+    body = {'email': f'{uuid4()}@example.com', 'password': 'password'}
+    response = await client.post('/api/v1/auth/signup', json=body)
+    assert response.status_code == 200, response.text
+    return {**body, 'id': response.json()['id']}
+
+
+async def _insert_user(email: str, password: str) -> None:
+    # straight into the database, past the service and its email filter
+    async with engine.begin() as conn:
+        await conn.execute(text('INSERT INTO users (id, email, hashed_password, created) VALUES (:id, :email, '
+                                ':hashed_password, now())'),
+                           {'id': uuid4(), 'email': email,
+                            'hashed_password': PasswordService().get_password_hash(email, password)})
+
+
+@pytest.mark.asyncio
+async def test_login_with_unknown_email_skips_database(client: AsyncClient, email_filter: EmailFilter) -> None:
+    with checkouts() as checked_out:
+        response = await client.post('/api/v1/auth/login', json={'email': f'{uuid4()}@example.com',
+                                                                 'password': 'password'})
+
+    assert response.status_code == 404
+    assert not checked_out
+    assert await email_filter.exists()
+
+
+@pytest.mark.asyncio
+async def test_login_right_after_signup(client: AsyncClient, email_filter: EmailFilter) -> None:
+    user = await _signup(client)
+
+    await login(client, {'email': user['email'], 'password': user['password']})
+    assert await email_filter.might_contain(user['email'])
+
+
+@pytest.mark.asyncio
+async def test_login_with_updated_email(client: AsyncClient, email_filter: EmailFilter) -> None:
+    user = await _signup(client)
+    access_token, _ = await login(client, {'email': user['email'], 'password': user['password']})
+    updated = {'email': f'{uuid4()}@example.com', 'password': 'new password'}
+
+    response = await client.put(f'/api/v1/users/{user["id"]}', json=updated, headers=auth_headers(access_token))
+
+    assert response.status_code == 200, response.text
+    await login(client, updated)
+    assert await email_filter.might_contain(updated['email'])
+
+
+@pytest.mark.asyncio
+async def test_login_after_rebuild(client: AsyncClient, email_filter: EmailFilter) -> None:
+    credentials = {'email': f'{uuid4()}@example.com', 'password': 'password'}
+    await _insert_user(**credentials)
+    # written past the service, the user is not in the filter until it is rebuilt
+    assert not await email_filter.might_contain(credentials['email'])
+
+    await rebuild_email_filter(email_filter)
+
+    await login(client, credentials)
+
+
+@pytest.mark.asyncio
+async def test_login_without_filter_falls_back_to_database(client: AsyncClient, redis_client: Redis) -> None:
+    credentials = {'email': f'{uuid4()}@example.com', 'password': 'password'}
+    await _insert_user(**credentials)
+    await redis_client.flushall()
+
+    await login(client, credentials)
+
+
+@pytest.mark.asyncio
+async def test_signup_and_login_with_redis_unavailable(
+    client: AsyncClient, email_filter: EmailFilter, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    # nothing listens on the port, every filter command fails to connect
+    unavailable = Redis(host='127.0.0.1', port=1)
+    monkeypatch.setattr(email_filter, 'cache_storage', unavailable)
+    try:
+        user = await _signup(client)
+        await login(client, {'email': user['email'], 'password': user['password']})
+    finally:
+        await unavailable.aclose()
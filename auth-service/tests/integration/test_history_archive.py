@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta
+from typing import Iterator, List, NamedTuple, Tuple
+from uuid import UUID, uuid4
+
+import orjson
+import pytest
+import pytest_asyncio
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.postgres import engine
+from services.history_service import HistoryService
+
+# each test archives its own year, the logins the other tests make are recent
+_YEAR = 2001
+_ARCHIVED_BEFORE = datetime(_YEAR, 3, 15)
+_USERS = 3
+
+
+class _Login(NamedTuple):
+    date: datetime
+    id: str
+    user_id: UUID
+
+
+async def _insert_logins(year: int) -> Tuple[List[UUID], List[_Login]]:
+    user_ids = [uuid4() for _ in range(_USERS)]
+    # the users log in at the same moments, so the merge of the archive partitions has to order them by id
+    dates = [datetime(year, 1, 1) + timedelta(days=day, hours=day % 7) for day in range(0, 90, 4)]
+    logins = sorted(_Login(date, str(uuid4()), user_id) for user_id in user_ids for date in dates)
+    async with engine.begin() as conn:
+        for user_id in user_ids:
+            await conn.execute(text('INSERT INTO users (id, email, hashed_password, created) '
+                                    'VALUES (:id, :email, :hashed_password, now())'),
+                               {'id': user_id, 'email': f'{user_id}@example.com', 'hashed_password': ''})
+        await conn.execute(text('INSERT INTO user_logins (id, user_agent, user_device_type, date, user_id) '
+                                "VALUES (:id, 'integration', 'pc', :date, :user_id)"),
+                           [login._asdict() for login in logins])
+    return user_ids, logins
+
+
+async def _export(user_id: UUID | None = None, since: datetime | None = None,
+                  until: datetime | None = None) -> List[str]:
+    body = b''.join([chunk async for chunk in HistoryService().export(user_id, since, until)])
+    return [orjson.loads(line)['id'] for line in body.splitlines()]  # pylint: disable=no-member
+
+
+async def _count_in_table(user_ids: List[UUID]) -> int:
+    async with engine.connect() as conn:
+        return await conn.scalar(text('SELECT count(*) FROM user_logins WHERE user_id = ANY(:user_ids)'),
+                                 {'user_ids': user_ids})
+
+
+@pytest_asyncio.fixture(scope='module', name='archived')
+async def fixture_archived(service: None) -> Iterator[Tuple[List[UUID], List[_Login]]]:  # pylint: disable=unused-argument
+    user_ids, logins = await _insert_logins(_YEAR)
+
+    archived = await HistoryService().archive(_ARCHIVED_BEFORE)
+
+    assert archived == sum(login.date < _ARCHIVED_BEFORE for login in logins)
+    assert await _count_in_table(user_ids) == len(logins) - archived
+    yield user_ids, logins
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(('user', 'since', 'until'), [
+    (None, None, None),
+    (0, None, None),
+    (1, datetime(_YEAR, 2, 10), None),
+    (2, None, datetime(_YEAR, 3, 1)),
+    # a run in the middle of a month and the table after it
+    (None, datetime(_YEAR, 1, 20), datetime(_YEAR, 3, 20)),
+    (0, datetime(_YEAR, 3, 10), datetime(_YEAR, 3, 20)),
+    (None, datetime(_YEAR, 3, 16), None),
+])
+async def test_export_reads_archive_and_table(
+    archived: Tuple[List[UUID], List[_Login]], user: int | None, since: datetime | None, until: datetime | None
+) -> None:
+    user_ids, logins = archived
+    user_id = user_ids[user] if user is not None else None
+
+    exported = await _export(user_id, since, until)
+
+    expected = [login.id for login in logins
+                if (user_id is None or login.user_id == user_id)
+                and (since is None or login.date >= since) and (until is None or login.date < until)]
+    if user_id is None:
+        # the logins the other tests made are newer than these
+        exported = exported[:len(expected)]
+    assert exported == expected
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures('service')
+async def test_export_during_archive_returns_each_login_once(monkeypatch: pytest.MonkeyPatch) -> None:
+    user_ids, logins = await _insert_logins(_YEAR + 1)
+    exported_meanwhile: List[List[str]] = []
+    commit = AsyncSession.commit
+
+    async def export_then_commit(session: AsyncSession) -> None:
+        # a run is written and its logins are deleted, but not committed yet
+        exported_meanwhile.append(await _export(user_ids[0]))
+        await commit(session)
+
+    monkeypatch.setattr(AsyncSession, 'commit', export_then_commit)
+    await HistoryService().archive(datetime(_YEAR + 1, 12, 1))
+    monkeypatch.undo()
+
+    expected = [login.id for login in logins if login.user_id == user_ids[0]]
+    assert exported_meanwhile
+    assert all(exported == expected for exported in exported_meanwhile)
+    assert await _export(user_ids[0]) == expected
+    assert await _count_in_table(user_ids) == 0
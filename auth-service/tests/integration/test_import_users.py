@@ -0,0 +1,65 @@
+from typing import Dict, Iterator, List, Tuple
+from uuid import UUID, uuid4
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import text
+
+from db.postgres import engine
+from import_users import _create_staging_table, _load_batch
+from services.password_service import PasswordService
+
+
+@pytest_asyncio.fixture(name='role_name')
+async def fixture_role_name(service: None) -> Iterator[str]:  # pylint: disable=unused-argument
+    name = f'imported_{uuid4()}'
+    async with engine.begin() as conn:
+        await conn.execute(text('INSERT INTO roles (id, name, created) VALUES (:id, :name, now())'),
+                           {'id': uuid4(), 'name': name})
+    yield name
+
+
+_Row = Tuple[UUID, str, str, List[str]]
+
+
+def _row(email: str, password: str, roles: List[str]) -> _Row:
+    return uuid4(), email, PasswordService().get_password_hash(email, password), roles
+
+
+async def _load(rows: List[_Row]) -> Tuple[int, List[UUID]]:
+    async with engine.connect() as conn:
+        await _create_staging_table(conn)
+        return await _load_batch(conn, rows)
+
+
+async def _roles_of(email: str) -> List[str]:
+    async with engine.connect() as conn:
+        return list((await conn.execute(text(
+            'SELECT roles.name FROM users JOIN user_role ON user_role.user_id = users.id '
+            'JOIN roles ON roles.id = user_role.role_id WHERE users.email = :email'
+        ), {'email': email})).scalars())
+
+
+@pytest.mark.asyncio
+async def test_load_batch_grants_no_roles_to_existing_account(credentials: Dict[str, str], role_name: str) -> None:
+    created, assigned_user_ids = await _load([_row(credentials['email'], 'another password', [role_name])])
+
+    assert created == 0
+    assert not assigned_user_ids
+    assert await _roles_of(credentials['email']) == []
+
+
+@pytest.mark.asyncio
+async def test_load_batch_run_again_grants_roles_of_loaded_users(role_name: str) -> None:
+    email = f'{uuid4()}@example.com'
+    row = _row(email, 'password', [role_name])
+    async with engine.begin() as conn:
+        # a previous run that created the user and stopped before the roles were recorded
+        await conn.execute(text('INSERT INTO users (id, email, hashed_password, created) VALUES (:id, :email, '
+                                ':hashed_password, now())'), {'id': uuid4(), 'email': email, 'hashed_password': row[2]})
+
+    created, assigned_user_ids = await _load([row])
+
+    assert created == 0
+    assert len(assigned_user_ids) == 1
+    assert await _roles_of(email) == [role_name]
@@ -0,0 +1,76 @@
+import asyncio
+from typing import Dict, Iterator
+from uuid import UUID, uuid4
+
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from sqlalchemy import text
+
+from tests.integration.utils import auth_headers, login
+from core.config import settings
+from db.postgres import engine
+
+
+@pytest_asyncio.fixture(name='superuser')
+async def fixture_superuser(client: AsyncClient) -> Iterator[Dict[str, str]]:
+    body = {'email': f'{uuid4()}@example.com', 'password': 'password'}
+    response = await client.post('/api/v1/auth/signup', json=body)
+    assert response.status_code == 200, response.text
+    async with engine.begin() as conn:
+        await conn.execute(text("INSERT INTO roles (id, name, created) VALUES (:id, 'superuser', now()) "
+                                'ON CONFLICT (name) DO NOTHING'), {'id': uuid4()})
+        await conn.execute(text('INSERT INTO user_role (user_id, role_id) '
+                                "SELECT :user_id, id FROM roles WHERE name = 'superuser'"),
+                           {'user_id': UUID(response.json()['id'])})
+    yield {**body, 'id': response.json()['id']}
+
+
+async def _revoke_superuser(user_id: str) -> None:
+    # straight in the database, so neither the cached role list nor the issued tokens are told
+    async with engine.begin() as conn:
+        await conn.execute(text('DELETE FROM user_role WHERE user_id = :user_id'), {'user_id': UUID(user_id)})
+
+
+@pytest.mark.asyncio
+async def test_token_permissions_are_checked_without_roles(
+    client: AsyncClient, superuser: Dict[str, str], credentials: Dict[str, str], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, 'token_permissions', True)
+    access_token, refresh_token = await login(client, {'email': superuser['email'], 'password': 'password'})
+    user_access_token, _ = await login(client, credentials)
+
+    await _revoke_superuser(superuser['id'])
+
+    # the mask in the token holds until the token is refreshed
+    response = await client.get('/api/v1/roles/', headers=auth_headers(access_token))
+    assert response.status_code == 200
+    response = await client.get('/api/v1/roles/', headers=auth_headers(user_access_token))
+    assert response.status_code == 403
+
+    response = await client.post('/api/v1/auth/refresh', headers={**auth_headers(refresh_token),
+                                                                  'User-Agent': 'integration'})
+    assert response.status_code == 200, response.text
+    response = await client.get('/api/v1/roles/', headers=auth_headers(response.json()['access_token']))
+    assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures('redis_client')
+async def test_role_list_ttl_bounds_failed_invalidation(
+    client: AsyncClient, superuser: Dict[str, str], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, 'role_list_cache_ttl_seconds', 1)
+    access_token, _ = await login(client, {'email': superuser['email'], 'password': 'password'})
+    response = await client.get('/api/v1/roles/', headers=auth_headers(access_token))
+    assert response.status_code == 200
+
+    # as a role change whose invalidation failed
+    await _revoke_superuser(superuser['id'])
+
+    # the cached role list is served until it expires
+    response = await client.get('/api/v1/roles/', headers=auth_headers(access_token))
+    assert response.status_code == 200
+    await asyncio.sleep(1.5)
+    response = await client.get('/api/v1/roles/', headers=auth_headers(access_token))
+    assert response.status_code == 403
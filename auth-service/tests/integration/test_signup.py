@@ -0,0 +1,25 @@
+from typing import Dict, List
+
+import pytest
+from httpx import AsyncClient
+
+from services.password_service import PasswordService
+
+
+@pytest.mark.asyncio
+async def test_signup_with_taken_email_skips_password_hash(
+    client: AsyncClient, credentials: Dict[str, str], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    hashed: List[str] = []
+    get_password_hash = PasswordService.get_password_hash
+
+    def counting_get_password_hash(self: PasswordService, salt: str, password: str) -> str:
+        hashed.append(salt)
+        return get_password_hash(self, salt, password)
+
+    monkeypatch.setattr(PasswordService, 'get_password_hash', counting_get_password_hash)
+
+    response = await client.post('/api/v1/auth/signup', json=credentials)
+
+    assert response.status_code == 403
+    assert not hashed
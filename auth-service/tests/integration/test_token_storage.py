@@ -0,0 +1,42 @@
+import time
+from typing import Tuple
+from uuid import UUID, uuid4
+
+import pytest
+from redis.asyncio import Redis
+
+from storage.token_storage import TokenStorage, TokenStorageLayout
+
+_ACCESS_TOKEN_TTL = 15 * 60
+
+
+async def _save_session(token_storage: TokenStorage, user_id: UUID, issued_at: float) -> Tuple[UUID, UUID]:
+    jti, access_jti = uuid4(), uuid4()
+    await token_storage.save_session(user_id, jti, access_jti, issued_at, time.time() + 60 * 60, 'web')
+    return jti, access_jti
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('layout', list(TokenStorageLayout))
+async def test_revoke_sessions(redis_client: Redis, layout: TokenStorageLayout) -> None:
+    token_storage = TokenStorage(redis_client, layout)
+    user_id, other_user_id = uuid4(), uuid4()
+    now = time.time()
+    jti, access_jti = await _save_session(token_storage, user_id, now)
+    stale_jti, stale_access_jti = await _save_session(token_storage, user_id, now - 2 * _ACCESS_TOKEN_TTL)
+    other_jti, _ = await _save_session(token_storage, other_user_id, now)
+
+    assert await token_storage.revoke_sessions(user_id, _ACCESS_TOKEN_TTL) == 2
+
+    assert await token_storage.get_sessions(user_id) == {}
+    assert not await token_storage.check_refresh_token_exists(user_id, jti)
+    assert not await token_storage.check_refresh_token_exists(user_id, stale_jti)
+    assert await token_storage.check_access_token_revoked(access_jti, now + _ACCESS_TOKEN_TTL)
+    # its access token has expired already, there is nothing to revoke
+    assert not await token_storage.check_access_token_revoked(stale_access_jti, now - _ACCESS_TOKEN_TTL)
+    assert await token_storage.check_refresh_token_exists(other_user_id, other_jti)
+
+
+@pytest.mark.asyncio
+async def test_revoke_sessions_without_sessions(redis_client: Redis) -> None:
+    assert await TokenStorage(redis_client).revoke_sessions(uuid4(), _ACCESS_TOKEN_TTL) == 0
@@ -0,0 +1,33 @@
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+from httpx import AsyncClient
+from sqlalchemy import event
+
+from db.postgres import engine
+
+
+async def login(client: AsyncClient, credentials: Dict[str, str]) -> Tuple[str, str]:
+    response = await client.post('/api/v1/auth/login', json=credentials, headers={'User-Agent': 'integration'})
+    assert response.status_code == 200, response.text
+    body = response.json()
+    return body['access_token'], body['refresh_token']
+
+
+def auth_headers(token: str) -> Dict[str, str]:
+    return {'Authorization': f'Bearer {token}'}
+
+
+@contextmanager
+def checkouts() -> Iterator[List[object]]:
+    """Collects the connections checked out of the service's pool in the block."""
+    checked_out = []
+
+    def on_checkout(dbapi_connection, _connection_record, _connection_proxy) -> None:
+        checked_out.append(dbapi_connection)
+
+    event.listen(engine.sync_engine.pool, 'checkout', on_checkout)
+    try:
+        yield checked_out
+    finally:
+        event.remove(engine.sync_engine.pool, 'checkout', on_checkout)
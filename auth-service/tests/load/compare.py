@@ -0,0 +1,21 @@
+"""Prints per-endpoint changes between two result files written by tests.load.run."""
+import json
+import sys
+from pathlib import Path
+
+
+def main(base_path: str, new_path: str) -> None:
+    base = json.loads(Path(base_path).read_text(encoding='utf-8'))['endpoints']
+    new = json.loads(Path(new_path).read_text(encoding='utf-8'))['endpoints']
+    print(f'{"endpoint":<28}{"rps":>18}{"p50 ms":>20}{"p95 ms":>20}{"p99 ms":>20}')
+    for name in sorted(base.keys() & new.keys()):
+        columns = []
+        for metric in ('rps', 'p50_ms', 'p95_ms', 'p99_ms'):
+            before, after = base[name][metric], new[name][metric]
+            change = (after - before) / before * 100 if before else 0.0
+            columns.append(f'{after:>10.1f} ({change:+6.1f}%)')
+        print(f'{name:<28}' + ''.join(f'{column:>20}' for column in columns))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:3])
@@ -0,0 +1,5 @@
+#!/bin/sh
+
+python -m tests.load.run
+
+exec "$@"
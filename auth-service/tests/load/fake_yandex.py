@@ -0,0 +1,37 @@
+"""Local stand-in for oauth.yandex.ru/token and login.yandex.ru/info.
+
+Every authorization code maps to its own provider user, so `code=<n>` is stable across requests and new codes
+create new users on the service side.
+"""
+import hashlib
+
+from aiohttp import web
+
+from tests.load.settings import load_settings
+
+
+async def token(request: web.Request) -> web.Response:
+    form = await request.post()
+    if form.get('grant_type') != 'authorization_code' or not form.get('code'):
+        return web.json_response({'error': 'invalid_grant'}, status=400)
+    return web.json_response({'access_token': f'token-{form["code"]}', 'token_type': 'bearer', 'expires_in': 3600})
+
+
+async def info(request: web.Request) -> web.Response:
+    authorization = request.headers.get('Authorization', '')
+    if not authorization.startswith('OAuth token-'):
+        return web.json_response({'error': 'unauthorized'}, status=401)
+    code = authorization.removeprefix('OAuth token-')
+    provider_id = hashlib.sha1(code.encode()).hexdigest()[:16]
+    return web.json_response({'id': provider_id, 'default_email': f'{provider_id}@yandex.test'})
+
+
+def create_app() -> web.Application:
+    app = web.Application()
+    app.router.add_post('/token', token)
+    app.router.add_get('/info', info)
+    return app
+
+
+if __name__ == '__main__':
+    web.run_app(create_app(), host=load_settings.fake_provider_host, port=load_settings.fake_provider_port)
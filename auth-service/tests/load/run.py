@@ -0,0 +1,114 @@
+"""Runs the weighted scenarios against the service and writes per-endpoint latency percentiles and RPS as JSON.
+
+    python -m tests.load.run
+    python -m tests.load.compare results/base.json results/load.json
+"""
+import asyncio
+import json
+import os
+import random
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List
+from uuid import uuid4
+
+from aiohttp import ClientSession, TCPConnector
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from tests.load.scenarios import LoadClient, Recorder, State, VirtualUser, SCENARIOS, PASSWORD
+from tests.load.settings import load_settings
+
+_SUPERUSER = 'superuser'
+
+
+async def _create_user(client: LoadClient) -> VirtualUser:
+    email = f'{uuid4()}@load.test'
+    _, body = await client.request('setup.signup', 'POST', 'api/v1/auth/signup',
+                                   json={'email': email, 'password': PASSWORD})
+    return VirtualUser(id=body['id'], email=email)
+
+
+async def _login(client: LoadClient, user: VirtualUser) -> None:
+    _, body = await client.request('setup.login', 'POST', 'api/v1/auth/login',
+                                   json={'email': user.email, 'password': PASSWORD})
+    user.access_token, user.refresh_token = body['access_token'], body['refresh_token']
+
+
+async def _grant_superuser(user: VirtualUser) -> None:
+    dsn = (f'postgresql+asyncpg://{load_settings.postgres_user}:{load_settings.postgres_password}@'
+           f'{load_settings.postgres_host}:{load_settings.postgres_port}/{load_settings.postgres_db}')
+    engine = create_async_engine(dsn)
+    async with engine.begin() as conn:
+        await conn.execute(text('INSERT INTO roles (id, name, created) VALUES (:id, :name, now()) '
+                                'ON CONFLICT (name) DO NOTHING'), {'id': uuid4(), 'name': _SUPERUSER})
+        await conn.execute(text('INSERT INTO user_role (user_id, role_id) '
+                                'SELECT :user_id, id FROM roles WHERE name = :name ON CONFLICT DO NOTHING'),
+                           {'user_id': user.id, 'name': _SUPERUSER})
+    await engine.dispose()
+
+
+async def _setup(client: LoadClient) -> State:
+    users = await asyncio.gather(*(_create_user(client) for _ in range(max(load_settings.users,
+                                                                          load_settings.concurrency))))
+    admin = await _create_user(client)
+    await _grant_superuser(admin)
+    await asyncio.gather(*(_login(client, user) for user in [*users, admin]))
+    return State(users=list(users), admin=admin)
+
+
+async def _worker(client: LoadClient, state: State, user: VirtualUser, deadline: float) -> None:
+    names = list(load_settings.scenarios)
+    weights = [load_settings.scenarios[name] for name in names]
+    while time.monotonic() < deadline:
+        await SCENARIOS[random.choices(names, weights)[0]](client, state, user)
+
+
+def _percentile(sorted_values: List[float], percent: int) -> float:
+    index = max(0, -(-len(sorted_values) * percent // 100) - 1)
+    return sorted_values[index]
+
+
+def _summary(recorder: Recorder, elapsed: float) -> Dict[str, Dict[str, Any]]:
+    summary = {}
+    for name, latencies in sorted(recorder.latencies.items()):
+        latencies = sorted(latencies)
+        summary[name] = {
+            'requests': len(latencies),
+            'errors': recorder.errors[name],
+            'rps': round(len(latencies) / elapsed, 2),
+            **{f'p{p}_ms': round(_percentile(latencies, p) * 1000, 2) for p in (50, 95, 99)},
+        }
+    return summary
+
+
+async def main() -> None:
+    async with ClientSession(connector=TCPConnector(limit=load_settings.concurrency * 2)) as session:
+        state = await _setup(LoadClient(session, Recorder()))
+        recorder = Recorder()
+        client = LoadClient(session, recorder)
+        started = time.monotonic()
+        deadline = started + load_settings.duration
+        await asyncio.gather(*(_worker(client, state, state.users[i], deadline)
+                               for i in range(load_settings.concurrency)))
+        elapsed = time.monotonic() - started
+
+    result = {
+        'meta': {
+            'finished_at': datetime.now(timezone.utc).isoformat(),
+            'commit': os.environ.get('GIT_COMMIT'),
+            'duration': round(elapsed, 2),
+            'concurrency': load_settings.concurrency,
+            'scenarios': load_settings.scenarios,
+        },
+        'endpoints': _summary(recorder, elapsed),
+    }
+    result_path = Path(load_settings.result_path)
+    result_path.parent.mkdir(parents=True, exist_ok=True)
+    result_path.write_text(json.dumps(result, indent=2), encoding='utf-8')
+    print(json.dumps(result['endpoints'], indent=2))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
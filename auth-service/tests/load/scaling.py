@@ -0,0 +1,35 @@
+"""Prints how the total throughput changes with the number of replicas from the result files of scaling.sh."""
+import json
+import re
+import sys
+from pathlib import Path
+from typing import Any, Dict, List
+
+
+def _replicas(path: Path) -> int:
+    return int(re.search(r'scale_(\d+)', path.name).group(1))
+
+
+def _totals(result: Dict[str, Any]) -> Dict[str, float]:
+    endpoints = result['endpoints'].values()
+    return {
+        'rps': sum(endpoint['rps'] for endpoint in endpoints),
+        'errors': sum(endpoint['errors'] for endpoint in endpoints),
+        'p95_ms': max(endpoint['p95_ms'] for endpoint in endpoints),
+    }
+
+
+def main(paths: List[str]) -> None:
+    results = sorted(((_replicas(Path(path)), json.loads(Path(path).read_text(encoding='utf-8'))) for path in paths))
+    base_rps = _totals(results[0][1])['rps'] / results[0][0]
+    print(f'{"replicas":<10}{"concurrency":>12}{"rps":>12}{"speedup":>10}{"efficiency":>12}{"max p95 ms":>12}'
+          f'{"errors":>8}')
+    for replicas, result in results:
+        totals = _totals(result)
+        speedup = totals['rps'] / base_rps
+        print(f'{replicas:<10}{result["meta"]["concurrency"]:>12}{totals["rps"]:>12.1f}{speedup:>9.2f}x'
+              f'{speedup / replicas * 100:>11.0f}%{totals["p95_ms"]:>12.1f}{totals["errors"]:>8}')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
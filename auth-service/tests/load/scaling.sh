@@ -0,0 +1,23 @@
+#!/bin/sh
+# Runs the load test through nginx against 1 to MAX_REPLICAS replicas of the service, a fresh stack each time,
+# and prints how the throughput scales. Concurrency grows with the replicas so that each run saturates them.
+#
+#   ./scaling.sh 4
+#   CONCURRENCY_PER_REPLICA=100 ./scaling.sh 4
+
+set -e
+
+max_replicas=${1:-4}
+per_replica=${CONCURRENCY_PER_REPLICA:-50}
+cd "$(dirname "$0")"
+compose="docker-compose --project-name auth-api-scaling"
+
+for replicas in $(seq 1 "$max_replicas"); do
+    $compose up -d --build --wait --scale auth_api="$replicas" nginx
+    $compose run --rm -e SERVICE_HOST=nginx -e SERVICE_PORT=80 -e CONCURRENCY=$((per_replica * replicas)) \
+        -e RESULT_PATH="results/scale_$replicas.json" load
+    $compose down -v
+done
+
+cd ../../
+python -m tests.load.scaling tests/load/results/scale_*.json
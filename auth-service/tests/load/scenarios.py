@@ -0,0 +1,117 @@
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Coroutine, Dict, List, Tuple
+from uuid import uuid4
+
+from aiohttp import ClientSession
+
+from tests.load.settings import load_settings
+
+_BASE_URL = f'http://{load_settings.service_host}:{load_settings.service_port}'
+PASSWORD = 'password'
+
+
+@dataclass
+class VirtualUser:
+    id: str
+    email: str
+    access_token: str = ''
+    refresh_token: str = ''
+
+
+@dataclass
+class Recorder:
+    latencies: Dict[str, List[float]] = field(default_factory=lambda: defaultdict(list))
+    errors: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+
+
+class LoadClient:
+    def __init__(self, session: ClientSession, recorder: Recorder) -> None:
+        self._session = session
+        self._recorder = recorder
+
+    async def request(
+        self, name: str, method: str, path: str, token: str | None = None, expected: Tuple[int, ...] = (200,),
+        **kwargs: Any
+    ) -> Tuple[int, Any]:
+        headers = {'X-Request-Id': str(uuid4()), 'User-Agent': 'load test'}
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        started = time.perf_counter()
+        async with self._session.request(method, f'{_BASE_URL}/{path}', headers=headers, **kwargs) as response:
+            body = await response.json() if response.content_type == 'application/json' else None
+        self._recorder.latencies[name].append(time.perf_counter() - started)
+        if response.status not in expected:
+            self._recorder.errors[name] += 1
+        return response.status, body
+
+
+@dataclass
+class State:
+    users: List[VirtualUser]
+    admin: VirtualUser
+
+
+Scenario = Callable[[LoadClient, State, VirtualUser], Coroutine[Any, Any, None]]
+
+
+async def signup(client: LoadClient, *_: Any) -> None:
+    await client.request('auth.signup', 'POST', 'api/v1/auth/signup',
+                         json={'email': f'{uuid4()}@load.test', 'password': PASSWORD})
+
+
+async def login(client: LoadClient, state: State, *_: Any) -> None:
+    user = random.choice(state.users)
+    await client.request('auth.login', 'POST', 'api/v1/auth/login', json={'email': user.email, 'password': PASSWORD})
+
+
+async def refresh(client: LoadClient, _: State, user: VirtualUser) -> None:
+    status, body = await client.request('auth.refresh', 'POST', 'api/v1/auth/refresh', token=user.refresh_token)
+    if status == 200:
+        user.access_token, user.refresh_token = body['access_token'], body['refresh_token']
+
+
+async def token_validation(client: LoadClient, _: State, user: VirtualUser) -> None:
+    await client.request('users.get', 'GET', f'api/v1/users/{user.id}', token=user.access_token)
+
+
+async def verify(client: LoadClient, _: State, user: VirtualUser) -> None:
+    await client.request('auth.verify', 'GET', 'api/v1/auth/verify', token=user.access_token, expected=(204,))
+
+
+async def history(client: LoadClient, _: State, user: VirtualUser) -> None:
+    await client.request('auth.history', 'GET', 'api/v1/auth/history', token=user.access_token,
+                         params={'page': random.randint(1, 3), 'size': 50})
+
+
+async def admin_roles(client: LoadClient, state: State, user: VirtualUser) -> None:
+    token = state.admin.access_token
+    status, role = await client.request('roles.create', 'POST', 'api/v1/roles/', token=token, expected=(201,),
+                                        json={'name': f'load-{uuid4()}'})
+    if status != 201:
+        return
+    await client.request('users.roles.assign', 'POST', f'api/v1/users/{user.id}/roles', token=token,
+                         params={'role_id': role['id']})
+    await client.request('users.roles.get', 'GET', f'api/v1/users/{user.id}/roles', token=token)
+    await client.request('users.roles.dissociate', 'DELETE', f'api/v1/users/{user.id}/roles', token=token,
+                         expected=(204,), params={'role_id': role['id']})
+    await client.request('roles.delete', 'DELETE', f'api/v1/roles/{role["id"]}', token=token, expected=(204,))
+
+
+async def provider_login(client: LoadClient, state: State, *_: Any) -> None:
+    await client.request('providers.yandex.tokens', 'GET', 'api/v1/auth/yandex/tokens',
+                         params={'code': str(random.randint(1, len(state.users)))})
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    'signup': signup,
+    'login': login,
+    'refresh': refresh,
+    'token_validation': token_validation,
+    'verify': verify,
+    'history': history,
+    'admin_roles': admin_roles,
+    'provider_login': provider_login,
+}
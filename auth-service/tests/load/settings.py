@@ -0,0 +1,28 @@
+from typing import Dict
+
+from tests.functional.settings import TestSettings
+
+
+class LoadSettings(TestSettings):
+    # the database and service addresses are the ones the functional tests use
+    fake_provider_host: str = '0.0.0.0'
+    fake_provider_port: int = 8081
+
+    duration: float = 30
+    concurrency: int = 50
+    users: int = 200
+    # relative share of virtual users running each scenario
+    scenarios: Dict[str, int] = {
+        'signup': 1,
+        'login': 4,
+        'refresh': 2,
+        'token_validation': 4,
+        'verify': 8,
+        'history': 2,
+        'admin_roles': 1,
+        'provider_login': 1,
+    }
+    result_path: str = 'results/load.json'
+
+
+load_settings = LoadSettings()
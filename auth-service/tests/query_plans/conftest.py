@@ -0,0 +1,143 @@
+"""Runs the migrations on a throwaway database, seeds it and records the statements the services send to Postgres.
+
+    python -m pytest tests/query_plans      # from auth-service, needs a Postgres server, see settings.py
+"""
+import asyncio
+import json
+import os
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, NamedTuple, Tuple
+from uuid import UUID
+
+import pytest_asyncio
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from tests.query_plans.settings import query_plan_settings
+from tests.service import configure_database, configure_service, create_database
+
+_EXPLAINED_STATEMENTS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+_SEED = (
+    'INSERT INTO roles (id, name, created) '
+    "SELECT gen_random_uuid(), name, now() FROM unnest(ARRAY['superuser', 'admin', 'service', 'user']) name",
+    'INSERT INTO roles (id, name, created) '
+    "SELECT gen_random_uuid(), 'role_' || i, now() FROM generate_series(1, :extra_roles) i",
+    'INSERT INTO users (id, email, hashed_password, created) '
+    "SELECT gen_random_uuid(), 'user' || i || '@example.com', md5(i::text), now() - i * interval '1 minute' "
+    'FROM generate_series(1, :users) i',
+    'INSERT INTO user_role (user_id, role_id) '
+    "SELECT users.id, roles.id FROM users JOIN roles ON roles.name = 'user'",
+    # one user in a hundred is an admin, every user also has one of the extra roles
+    'INSERT INTO user_role (user_id, role_id) '
+    "SELECT users.id, roles.id FROM users JOIN roles ON roles.name = 'admin' WHERE users.email LIKE '%00@example.com'",
+    'INSERT INTO user_role (user_id, role_id) '
+    'SELECT u.id, r.id FROM (SELECT id, row_number() OVER () AS n FROM users) u '
+    "JOIN (SELECT id, row_number() OVER () AS n FROM roles WHERE name LIKE 'role_%') r "
+    'ON r.n = u.n % :extra_roles + 1',
+    # every fifth user signed up through a provider
+    'INSERT INTO provider_users (id, provider, user_id) '
+    "SELECT 'yandex_' || id, 'yandex', id FROM users WHERE email ~ '[05]@example.com$'",
+    'INSERT INTO user_logins (id, user_agent, user_device_type, date, user_id) '
+    "SELECT gen_random_uuid(), 'agent', (ARRAY['mobile', 'tablet', 'pc', 'unknown'])[1 + i % 4], "
+    "now() - i * interval '1 hour', users.id FROM users CROSS JOIN generate_series(1, :logins_per_user) i",
+)
+
+
+def _configure_service() -> None:
+    # the service settings are read on import, they point it to the throwaway database
+    configure_service('query_plans')
+    os.environ['ECHO_IN_DB'] = 'False'
+    configure_database(query_plan_settings)
+
+
+_configure_service()
+
+from db.postgres import engine  # pylint: disable=wrong-import-position
+
+
+class Sample(NamedTuple):
+    user_id: UUID
+    email: str
+    provider_user_id: str
+    role_id: UUID
+    role_name: str
+
+
+class Explained(NamedTuple):
+    statement: str
+    plan: Dict[str, Any]
+
+
+class QueryRecorder:
+    """Collects the statements a service call sends and explains them on the same connection."""
+
+    def __init__(self, conn: AsyncConnection) -> None:
+        self._conn = conn
+        self.session = AsyncSession(bind=conn, join_transaction_mode='create_savepoint', expire_on_commit=False)
+        self._statements: List[Tuple[str, Any]] = []
+
+    async def record(self, call: Callable[[AsyncSession], Awaitable[object]]) -> List[Explained]:
+        self._statements = []
+        event.listen(self._conn.sync_connection, 'before_cursor_execute', self._record_statement)
+        try:
+            await call(self.session)
+        finally:
+            event.remove(self._conn.sync_connection, 'before_cursor_execute', self._record_statement)
+        explained = []
+        for statement, parameters in self._statements:
+            plan = (await self._conn.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {statement}', parameters)).scalar()
+            explained.append(Explained(statement, (json.loads(plan) if isinstance(plan, str) else plan)[0]['Plan']))
+        return explained
+
+    def _record_statement(  # pylint: disable=too-many-arguments
+        self, _conn, _cursor, statement: str, parameters: Any, _context, executemany: bool
+    ) -> None:
+        if statement.lstrip().upper().startswith(_EXPLAINED_STATEMENTS):
+            self._statements.append((statement, parameters[0] if executemany else parameters))
+
+
+@pytest_asyncio.fixture(scope='session')
+def event_loop() -> Iterator[asyncio.AbstractEventLoop]:
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest_asyncio.fixture(scope='session', name='sample')
+async def fixture_sample() -> Sample:
+    await create_database(query_plan_settings)
+
+    seed_parameters = {'users': query_plan_settings.users, 'logins_per_user': query_plan_settings.logins_per_user,
+                       'extra_roles': query_plan_settings.extra_roles}
+    async with engine.begin() as conn:
+        for statement in _SEED:
+            await conn.execute(text(statement), seed_parameters)
+        await conn.execute(text('ANALYZE'))
+        row = (await conn.execute(text(
+            'SELECT users.id, users.email, provider_users.id, roles.id, roles.name FROM users '
+            "JOIN provider_users ON provider_users.user_id = users.id JOIN roles ON roles.name = 'role_1' "
+            'WHERE users.email = :email'
+        ), {'email': f'user{query_plan_settings.users // 2 // 10 * 10}@example.com'})).one()
+    return Sample(*row)
+
+
+@pytest_asyncio.fixture(scope='session')
+def measured_costs() -> Iterator[Dict[str, float]]:
+    costs: Dict[str, float] = {}
+    yield costs
+    if query_plan_settings.costs_path and costs:
+        costs_path = Path(query_plan_settings.costs_path)
+        costs_path.parent.mkdir(parents=True, exist_ok=True)
+        costs_path.write_text(json.dumps(dict(sorted(costs.items())), indent=2), encoding='utf-8')
+
+
+@pytest_asyncio.fixture
+async def recorder(sample: Sample) -> Iterator[QueryRecorder]:  # pylint: disable=unused-argument
+    # everything a case writes is rolled back, the seed stays the same for the next one
+    async with engine.connect() as conn:
+        transaction = await conn.begin()
+        query_recorder = QueryRecorder(conn)
+        yield query_recorder
+        await query_recorder.session.close()
+        await transaction.rollback()
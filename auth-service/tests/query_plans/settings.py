@@ -0,0 +1,21 @@
+from pydantic_settings import SettingsConfigDict
+
+from tests.service import ThrowawayDatabaseSettings
+
+
+class QueryPlanSettings(ThrowawayDatabaseSettings):
+    model_config = SettingsConfigDict(env_file='.env', env_prefix='query_plan_')
+
+    postgres_db: str = 'query_plans'
+
+    # large enough for the planner to prefer indexes wherever they exist
+    users: int = 100_000
+    logins_per_user: int = 10
+    extra_roles: int = 200
+    # total cost of a plan a hot query may not exceed, unless its case sets its own budget
+    cost_budget: float = 100
+    # when set, the highest plan cost of every case is written there as JSON, the budgets are chosen from it
+    costs_path: str | None = None
+
+
+query_plan_settings = QueryPlanSettings()
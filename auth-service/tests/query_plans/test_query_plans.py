@@ -0,0 +1,133 @@
+import json
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Iterator, NamedTuple
+
+import pytest
+from fastapi_pagination import Params, set_params
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from tests.query_plans.conftest import QueryRecorder, Sample
+from tests.query_plans.settings import query_plan_settings
+from api.v1.schemas import RoleIn
+from services.auth_service import AuthService
+from services.password_service import PasswordService
+from services.role_service import RoleService
+from services.user_service import UserProvider, UserService, _ProvidedUserDetails
+
+# a full scan of these is cheaper than an index lookup
+_SMALL_TABLES = frozenset({'roles'})
+# plans name the partition that is scanned
+_PARTITIONS = {f'user_logins_{device_type}': 'user_logins' for device_type in ('mobile', 'tablet', 'pc', 'unknown')}
+
+
+class Case(NamedTuple):
+    call: Callable[[AsyncSession, Sample], Awaitable[object]]
+    cost_budget: float = query_plan_settings.cost_budget
+    allowed_seq_scans: FrozenSet[str] = frozenset()
+
+
+class _SeededUserService(UserService):
+    """Takes the provider answer from the seed instead of asking the OAuth provider."""
+
+    def __init__(self, session: AsyncSession, provider_user_id: str, email: str) -> None:
+        super().__init__(session, PasswordService(), provider_client=None)
+        self._provided_user_details = _ProvidedUserDetails(id=provider_user_id, email=email)
+
+    async def _get_provided_user_details(  # pylint: disable=unused-argument
+        self, code: str, provider: UserProvider
+    ) -> _ProvidedUserDetails:
+        return self._provided_user_details
+
+
+def _users(session: AsyncSession) -> UserService:
+    return UserService(session, PasswordService(), provider_client=None)
+
+
+def _auth(session: AsyncSession) -> AuthService:
+    return AuthService(session, token_storage=None, password_service=PasswordService())
+
+
+async def _history(session: AsyncSession, sample: Sample) -> object:
+    with set_params(Params(page=2, size=20)):
+        return await _auth(session).get_history(sample.user_id)
+
+
+async def _delete(session: AsyncSession, statement: str, **params: Any) -> None:
+    # a cascade from a deleted row runs this in a trigger, EXPLAIN of the parent delete does not show it
+    await session.execute(text(statement), params)
+
+
+CASES: Dict[str, Case] = {
+    'user_get_by_id': Case(lambda session, sample: _users(session).get_by_id(sample.user_id)),
+    'user_auth_info_by_id': Case(lambda session, sample: _users(session).get_auth_info_by_id(sample.user_id)),
+    'user_auth_info_by_email': Case(lambda session, sample: _users(session).get_auth_info_by_email(sample.email)),
+    'user_roles': Case(lambda session, sample: _users(session).get_roles(sample.user_id)),
+    'user_create': Case(lambda session, sample: _users(session).create('new_user@example.com', 'password')),
+    'user_update': Case(lambda session, sample: _users(session).update(sample.user_id, 'updated@example.com',
+                                                                       'password')),
+    'user_from_provider': Case(lambda session, sample: _SeededUserService(
+        session, sample.provider_user_id, sample.email
+    ).get_or_create_from_provider('code', UserProvider.YANDEX)),
+    'user_add_role': Case(lambda session, sample: _users(session).add_role_to_user(sample.user_id, sample.role_id)),
+    'user_delete_role': Case(lambda session, sample: _users(session).delete_role_from_user(sample.user_id,
+                                                                                           sample.role_id)),
+    'users_add_roles': Case(lambda session, sample: _users(session).add_roles_to_users([(sample.user_id,
+                                                                                         sample.role_id)])),
+    'users_delete_roles': Case(lambda session, sample: _users(session).delete_roles_from_users(
+        [(sample.user_id, sample.role_id)]
+    )),
+    'users_search_first_page': Case(lambda session, sample: _users(session).search(None, None, None, 50)),
+    'users_search_by_email': Case(lambda session, sample: _users(session).search(sample.email.split('@')[0],
+                                                                                 None, None, 50),
+                                  cost_budget=5000),
+    # an admin listing, the role may hold a large share of users and scanning them is a fair plan
+    'users_search_by_role': Case(lambda session, sample: _users(session).search(None, sample.role_name, None, 50),
+                                 cost_budget=10000, allowed_seq_scans=frozenset({'users'})),
+    'roles_list': Case(lambda session, sample: RoleService(session).get()),
+    'role_exists_by_name': Case(lambda session, sample: RoleService(session).is_role_exists_by_name('admin')),
+    'role_create': Case(lambda session, sample: RoleService(session).create(RoleIn(name='new_role'))),
+    'role_delete': Case(lambda session, sample: RoleService(session).delete(sample.role_id)),
+    'auth_history': Case(_history),
+    'auth_update_history': Case(lambda session, sample: _auth(session).update_history(sample.user_id, 'agent')),
+    'cascade_role_to_user_role': Case(lambda session, sample: _delete(
+        session, 'DELETE FROM user_role WHERE role_id = :role_id', role_id=sample.role_id
+    ), cost_budget=1000),
+    'cascade_user_to_provider_users': Case(lambda session, sample: _delete(
+        session, 'DELETE FROM provider_users WHERE user_id = :user_id', user_id=sample.user_id
+    )),
+    'cascade_user_to_user_logins': Case(lambda session, sample: _delete(
+        session, 'DELETE FROM user_logins WHERE user_id = :user_id', user_id=sample.user_id
+    )),
+}
+
+
+def _nodes(plan: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from _nodes(child)
+
+
+def _seq_scanned_tables(plan: Dict[str, Any]) -> FrozenSet[str]:
+    return frozenset(_PARTITIONS.get(node['Relation Name'], node['Relation Name'])
+                     for node in _nodes(plan) if node['Node Type'] == 'Seq Scan')
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('name', CASES)
+async def test_query_plan(
+    name: str, sample: Sample, recorder: QueryRecorder, measured_costs: Dict[str, float]
+) -> None:
+    case = CASES[name]
+
+    explained = await recorder.record(lambda session: case.call(session, sample))
+
+    assert explained, f'{name} sent no statements'
+    measured_costs[name] = max(plan['Total Cost'] for _, plan in explained)
+    for statement, plan in explained:
+        seq_scans = _seq_scanned_tables(plan) - _SMALL_TABLES - case.allowed_seq_scans
+        assert not seq_scans, (f'sequential scan of {", ".join(sorted(seq_scans))} in {statement}\n'
+                               f'{json.dumps(plan, indent=2)}')
+        assert plan['Total Cost'] <= case.cost_budget, (
+            f'cost {plan["Total Cost"]} over the budget of {case.cost_budget} in {statement}\n'
+            f'{json.dumps(plan, indent=2)}'
+        )
@@ -0,0 +1,67 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from pydantic_settings import BaseSettings
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+_AUTH_SERVICE_DIR = Path(__file__).resolve().parents[1]
+
+
+class ThrowawayDatabaseSettings(BaseSettings):
+    # the database is dropped and created again on every run, it must not be the service database
+    postgres_db: str
+    postgres_maintenance_db: str = 'postgres'
+    postgres_user: str = 'app'
+    postgres_password: str = 'postgres'
+    postgres_host: str = '127.0.0.1'
+    postgres_port: int = 5432
+
+
+def configure_service(client_name: str) -> None:
+    """Sets the environment the service settings need and puts the service sources on the import path.
+
+    The settings are read on import, so this runs before any service module is imported. Variables that are already
+    set are kept.
+    """
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    os.environ.setdefault('PRIVATE_KEY', key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode())
+    os.environ.setdefault('PUBLIC_KEY', key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode())
+    os.environ.setdefault('YANDEX_CLIENT_ID', client_name)
+    os.environ.setdefault('YANDEX_CLIENT_SECRET', client_name)
+    os.environ.setdefault('ENABLE_TRACER', 'False')
+    os.environ.setdefault('ECHO_IN_DB', 'False')
+    sys.path.insert(0, str(_AUTH_SERVICE_DIR / 'src'))
+
+
+def configure_database(database_settings: ThrowawayDatabaseSettings) -> None:
+    """Points the service to the throwaway database, before any service module is imported."""
+    os.environ['POSTGRES_DB'] = database_settings.postgres_db
+    os.environ['POSTGRES_USER'] = database_settings.postgres_user
+    os.environ['POSTGRES_PASSWORD'] = database_settings.postgres_password
+    os.environ['POSTGRES_HOST'] = database_settings.postgres_host
+    os.environ['POSTGRES_PORT'] = str(database_settings.postgres_port)
+
+
+async def create_database(database_settings: ThrowawayDatabaseSettings) -> None:
+    """Creates the throwaway database anew and runs the migrations on it."""
+    maintenance_engine = create_async_engine(
+        f'postgresql+asyncpg://{database_settings.postgres_user}:{database_settings.postgres_password}@'
+        f'{database_settings.postgres_host}:{database_settings.postgres_port}/'
+        f'{database_settings.postgres_maintenance_db}',
+        isolation_level='AUTOCOMMIT',
+    )
+    async with maintenance_engine.connect() as conn:
+        await conn.execute(text(f'DROP DATABASE IF EXISTS "{database_settings.postgres_db}" WITH (FORCE)'))
+        await conn.execute(text(f'CREATE DATABASE "{database_settings.postgres_db}"'))
+    await maintenance_engine.dispose()
+    # the real migrations, so the suites see the indexes and partitions production has rather than the models
+    subprocess.run([sys.executable, '-m', 'alembic', 'upgrade', 'head'], cwd=_AUTH_SERVICE_DIR, check=True)
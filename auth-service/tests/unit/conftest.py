@@ -0,0 +1,7 @@
+"""Tests of single service modules, without Postgres or Redis.
+
+    python -m pytest tests/unit     # from auth-service
+"""
+from tests.service import configure_service
+
+configure_service('unit')
@@ -0,0 +1,26 @@
+import pytest
+from starlette.requests import Request
+
+from api.v1.dependencies import get_client_ip
+
+
+def _request(peer: str) -> Request:
+    return Request({'type': 'http', 'headers': [], 'client': (peer, 50000)})
+
+
+@pytest.mark.parametrize('peer', ['127.0.0.1', '172.18.0.5', '::1'])
+def test_real_ip_of_trusted_proxy_is_used(peer: str) -> None:
+    assert get_client_ip(_request(peer), '203.0.113.7') == '203.0.113.7'
+
+
+def test_real_ip_of_untrusted_peer_is_ignored() -> None:
+    assert get_client_ip(_request('198.51.100.1'), '203.0.113.7') == '198.51.100.1'
+
+
+@pytest.mark.parametrize('peer', ['198.51.100.1', '172.18.0.5'])
+def test_peer_is_used_without_real_ip(peer: str) -> None:
+    assert get_client_ip(_request(peer)) == peer
+
+
+def test_peer_that_is_not_an_address_is_not_trusted() -> None:
+    assert get_client_ip(_request('testclient'), '203.0.113.7') == 'testclient'
@@ -0,0 +1,90 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
+
+import pytest
+
+import http_client
+from http_client import CircuitBreaker, CircuitState, ProviderClient
+
+_HOST = 'provider.test'
+
+
+class _HangingSession:
+    """Stands in for the aiohttp session, its requests never complete."""
+
+    @asynccontextmanager
+    async def request(self, *_: Any, **__: Any) -> AsyncIterator[None]:
+        await asyncio.Event().wait()
+        yield
+
+
+def _open_breaker(reset_timeout: float) -> CircuitBreaker:
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=reset_timeout)
+    breaker.record_failure()
+    breaker.record_failure()
+    return breaker
+
+
+def test_breaker_opens_after_failure_threshold() -> None:
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+
+    breaker.record_failure()
+    assert breaker.state == CircuitState.CLOSED
+    assert breaker.allow_request()
+    breaker.record_failure()
+
+    assert breaker.state == CircuitState.OPEN
+    assert not breaker.allow_request()
+
+
+def test_breaker_success_resets_failure_count() -> None:
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+
+    assert breaker.state == CircuitState.CLOSED
+
+
+def test_breaker_lets_one_trial_through_after_reset_timeout() -> None:
+    breaker = _open_breaker(reset_timeout=0)
+
+    assert breaker.allow_request()
+    assert breaker.state == CircuitState.HALF_OPEN
+    assert not breaker.allow_request()
+
+
+def test_breaker_closes_after_successful_trial() -> None:
+    breaker = _open_breaker(reset_timeout=0)
+    breaker.allow_request()
+
+    breaker.record_success()
+
+    assert breaker.state == CircuitState.CLOSED
+    assert breaker.allow_request()
+
+
+def test_breaker_opens_again_after_failed_trial() -> None:
+    breaker = _open_breaker(reset_timeout=60)
+    breaker.state, breaker._trial_in_flight = CircuitState.HALF_OPEN, False  # pylint: disable=protected-access
+    breaker.allow_request()
+
+    breaker.record_failure()
+
+    assert breaker.state == CircuitState.OPEN
+    assert not breaker.allow_request()
+
+
+@pytest.mark.asyncio
+async def test_cancelled_trial_releases_breaker(monkeypatch: pytest.MonkeyPatch) -> None:
+    breaker = _open_breaker(reset_timeout=0)
+    monkeypatch.setitem(http_client._breakers, _HOST, breaker)  # pylint: disable=protected-access
+
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(ProviderClient(_HangingSession()).request_json('GET', f'https://{_HOST}/'), 0.01)
+
+    assert breaker.state == CircuitState.OPEN
+    # the next trial is let through once the reset timeout passes
+    assert breaker.allow_request()
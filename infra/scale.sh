@@ -0,0 +1,15 @@
+#!/bin/sh
+# Scales the auth service to the given number of replicas and reloads nginx, which resolves the replicas only
+# when its configuration is loaded.
+#
+#   ./scale.sh 6
+
+set -e
+
+replicas=${1:?usage: scale.sh REPLICAS}
+cd "$(dirname "$0")"
+compose="docker-compose --project-name auth-api -f docker-compose.yml -f docker-compose.scale.yml"
+
+$compose up -d --no-deps --no-recreate --scale auth_service="$replicas" --wait auth_service
+$compose exec auth_nginx nginx -s reload
+echo "auth_service runs $replicas replicas"